@@ -18,7 +18,9 @@ from agent.run import run_agent
 from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, verify_thread_access
 from utils.logger import logger
 from services.billing import check_billing_status
-from sandbox.sandbox import create_sandbox, get_or_start_sandbox
+from sandbox.sandbox import async_daytona, create_sandbox, get_or_start_sandbox, SandboxHandleCache
+from sandbox.pool import SandboxPool
+from sandbox.prewarm import SandboxPrewarmer
 from services.llm import make_llm_api_call
 
 # Initialize shared resources
@@ -300,29 +302,31 @@ async def _cleanup_redis_instance_key(agent_run_id: str):
 
 async def get_or_create_project_sandbox(client, project_id: str):
     """Get or create a sandbox for a project."""
-    project = await client.table('projects').select('*').eq('project_id', project_id).execute()
-    if not project.data:
-        raise ValueError(f"Project {project_id} not found")
-    project_data = project.data[0]
-
-    if project_data.get('sandbox', {}).get('id'):
-        sandbox_id = project_data['sandbox']['id']
-        sandbox_pass = project_data['sandbox']['pass']
-        logger.info(f"Project {project_id} already has sandbox {sandbox_id}, retrieving it")
-        try:
-            sandbox = await get_or_start_sandbox(sandbox_id)
-            return sandbox, sandbox_id, sandbox_pass
-        except Exception as e:
-            logger.error(f"Failed to retrieve existing sandbox {sandbox_id}: {str(e)}. Creating a new one.")
+    sandbox_cache = SandboxHandleCache()
+    try:
+        # Served from the handle cache; only a missing or expired handle queries
+        # the project and checks the sandbox state
+        handle = await sandbox_cache.get(client, project_id)
+        if handle is not None:
+            return handle.sandbox, handle.sandbox_id, handle.sandbox_pass
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to retrieve existing sandbox for project {project_id}: {str(e)}. Creating a new one.")
 
-    logger.info(f"Creating new sandbox for project {project_id}")
-    sandbox_pass = str(uuid.uuid4())
-    sandbox = create_sandbox(sandbox_pass, project_id)
+    # Take a pre-created sandbox from the warm pool; create one only when the pool is empty
+    pooled = await SandboxPool().claim(project_id)
+    if pooled is not None:
+        sandbox, sandbox_pass = pooled
+    else:
+        logger.info(f"Creating new sandbox for project {project_id}")
+        sandbox_pass = str(uuid.uuid4())
+        sandbox = await create_sandbox(sandbox_pass, project_id)
+        logger.info(f"Created new sandbox {sandbox.id}")
     sandbox_id = sandbox.id
-    logger.info(f"Created new sandbox {sandbox_id}")
 
-    vnc_link = sandbox.get_preview_link(6080)
-    website_link = sandbox.get_preview_link(8080)
+    vnc_link = await sandbox.get_preview_link(6080)
+    website_link = await sandbox.get_preview_link(8080)
     vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link).split("url='")[1].split("'")[0]
     website_url = website_link.url if hasattr(website_link, 'url') else str(website_link).split("url='")[1].split("'")[0]
     token = None
@@ -342,8 +346,47 @@ async def get_or_create_project_sandbox(client, project_id: str):
         logger.error(f"Failed to update project {project_id} with new sandbox {sandbox_id}")
         raise Exception("Database update failed")
 
+    sandbox_cache.put(project_id, sandbox, sandbox_id, sandbox_pass)
     return sandbox, sandbox_id, sandbox_pass
 
+async def _discard_project_sandbox(sandbox_task: asyncio.Task, project_id: str) -> None:
+    """Remove the sandbox being created for a project whose setup failed.
+
+    The task is awaited rather than cancelled: the Daytona call runs on an
+    executor thread and would create the sandbox anyway, with nobody left to
+    remove it.
+    """
+    try:
+        sandbox, sandbox_id, _ = await sandbox_task
+    except Exception as e:
+        logger.debug(f"No sandbox to remove for project {project_id}: {str(e)}")
+        return
+    SandboxHandleCache().invalidate(project_id)
+    try:
+        await async_daytona.remove(sandbox)
+        logger.info(f"Removed sandbox {sandbox_id} of project {project_id} after failed setup")
+    except Exception as e:
+        logger.error(f"Failed to remove sandbox {sandbox_id} of project {project_id}: {str(e)}")
+
+async def prewarm_project_sandbox(client, project_id: str) -> bool:
+    """Start a project's existing sandbox in the background.
+
+    Returns:
+        Whether the project has a sandbox; if not, nothing was scheduled
+    """
+    sandbox_cache = SandboxHandleCache()
+    if not sandbox_cache.has(project_id):
+        project = await client.table('projects').select('sandbox').eq('project_id', project_id).execute()
+        if not project.data:
+            raise ValueError(f"Project {project_id} not found")
+        sandbox_info = project.data[0].get('sandbox') or {}
+        if not sandbox_info.get('id'):
+            return False
+        sandbox_cache.prime(project_id, sandbox_info['id'], sandbox_info.get('pass'))
+
+    SandboxPrewarmer().schedule(project_id, lambda: get_or_create_project_sandbox(client, project_id))
+    return True
+
 @router.post("/thread/{thread_id}/agent/start")
 async def start_agent(
     thread_id: str,
@@ -375,8 +418,12 @@ async def start_agent(
         logger.info(f"Stopping existing agent run {active_run_id} for project {project_id}")
         await stop_agent_run(active_run_id)
 
+    sandbox = None
     try:
-        sandbox, sandbox_id, sandbox_pass = await get_or_create_project_sandbox(client, project_id)
+        # An existing sandbox is started in the background, concurrently with the
+        # first LLM call; only a project without one waits for it to be created
+        if not await prewarm_project_sandbox(client, project_id):
+            sandbox, sandbox_id, sandbox_pass = await get_or_create_project_sandbox(client, project_id)
     except Exception as e:
         logger.error(f"Failed to get/create sandbox for project {project_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to initialize sandbox: {str(e)}")
@@ -884,19 +931,27 @@ async def initiate_agent_with_files(
         project_id = project.data[0]['project_id']
         logger.info(f"Created new project: {project_id}")
 
-        # 2. Create Thread
-        thread = await client.table('threads').insert({
-            "thread_id": str(uuid.uuid4()), "project_id": project_id, "account_id": account_id,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }).execute()
-        thread_id = thread.data[0]['thread_id']
-        logger.info(f"Created new thread: {thread_id}")
+        # Create the sandbox while the thread and naming task are set up
+        sandbox_task = asyncio.create_task(get_or_create_project_sandbox(client, project_id))
+
+        try:
+            # 2. Create Thread
+            thread = await client.table('threads').insert({
+                "thread_id": str(uuid.uuid4()), "project_id": project_id, "account_id": account_id,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }).execute()
+            thread_id = thread.data[0]['thread_id']
+            logger.info(f"Created new thread: {thread_id}")
+        except BaseException:
+            # Also on cancellation, e.g. when the client disconnects
+            await _discard_project_sandbox(sandbox_task, project_id)
+            raise
 
         # Trigger Background Naming Task
         asyncio.create_task(generate_and_update_project_name(project_id=project_id, prompt=prompt))
 
-        # 3. Create Sandbox
-        sandbox, sandbox_id, sandbox_pass = await get_or_create_project_sandbox(client, project_id)
+        # 3. Wait for the Sandbox
+        sandbox, sandbox_id, sandbox_pass = await sandbox_task
         logger.info(f"Using sandbox {sandbox_id} for new project {project_id}")
 
         # 4. Upload Files to Sandbox (if any)
@@ -930,7 +985,7 @@ async def initiate_agent_with_files(
                             try:
                                 await asyncio.sleep(0.2)
                                 parent_dir = os.path.dirname(target_path)
-                                files_in_dir = sandbox.fs.list_files(parent_dir)
+                                files_in_dir = await sandbox.fs.list_files(parent_dir)
                                 file_names_in_dir = [f.name for f in files_in_dir]
                                 if safe_filename in file_names_in_dir:
                                     successful_uploads.append(target_path)
@@ -962,8 +1017,7 @@ async def initiate_agent_with_files(
         message_payload = {"role": "user", "content": message_content}
         await client.table('messages').insert({
             "message_id": message_id, "thread_id": thread_id, "type": "user",
-            "is_llm_message": True, "content": json.dumps(message_payload),
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "is_llm_message": True, "content": json.dumps(message_payload)
         }).execute()
 
         # 6. Start Agent Run
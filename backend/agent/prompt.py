@@ -410,7 +410,7 @@ En tant que concierge d'OrchestraConnect, vous pouvez envoyer des emails profess
         - Use web-search to find relevant URLs
         - Use scrape-webpage on URLs from web-search results
         - Only if scrape-webpage fails or if the page requires interaction:
-          * Use direct browser tools (browser_navigate_to, browser_go_back, browser_wait, browser_click_element, browser_input_text, browser_send_keys, browser_switch_tab, browser_close_tab, browser_scroll_down, browser_scroll_up, browser_scroll_to_text, browser_get_dropdown_options, browser_select_dropdown_option, browser_drag_drop, browser_click_coordinates etc.)
+          * Use direct browser tools (browser_navigate_to, browser_go_back, browser_wait, browser_click_element, browser_input_text, browser_send_keys, browser_switch_tab, browser_close_tab, browser_scroll_down, browser_scroll_up, browser_scroll_to_text, browser_get_dropdown_options, browser_select_dropdown_option, browser_drag_drop, browser_click_coordinates, browser_batch etc.)
           * This is needed for:
             - Dynamic content loading
             - JavaScript-heavy sites
@@ -432,7 +432,8 @@ En tant que concierge d'OrchestraConnect, vous pouvez envoyer des emails profess
   1. ALWAYS start with web-search to find relevant URLs
   2. Use scrape-webpage on URLs from web-search results
   3. Only if scrape-webpage fails or if the page requires interaction:
-     - Use direct browser tools (browser_navigate_to, browser_go_back, browser_wait, browser_click_element, browser_input_text, browser_send_keys, browser_switch_tab, browser_close_tab, browser_scroll_down, browser_scroll_up, browser_scroll_to_text, browser_get_dropdown_options, browser_select_dropdown_option, browser_drag_drop, browser_click_coordinates etc.)
+     - Use direct browser tools (browser_navigate_to, browser_go_back, browser_wait, browser_click_element, browser_input_text, browser_send_keys, browser_switch_tab, browser_close_tab, browser_scroll_down, browser_scroll_up, browser_scroll_to_text, browser_get_dropdown_options, browser_select_dropdown_option, browser_drag_drop, browser_click_coordinates, browser_batch etc.)
+     - Use browser_batch for several steps on elements already listed in the browser state, such as filling in and submitting a form, instead of one call per step
      - This is needed for:
        * Dynamic content loading
        * JavaScript-heavy sites
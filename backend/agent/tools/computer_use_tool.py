@@ -31,9 +31,8 @@ class ComputerUseTool(SandboxToolsBase):
         self.session = None
         self.mouse_x = 0  # Track current mouse position
         self.mouse_y = 0
-        # Get automation service URL using port 8000
-        self.api_base_url = self.sandbox.get_preview_link(8000)
-        logging.info(f"Initialized Computer Use Tool with API URL: {self.api_base_url}")
+        # Automation service URL (port 8000), resolved on the first request
+        self.api_base_url = None
     
     async def _get_session(self) -> aiohttp.ClientSession:
         """Get or create aiohttp session for API requests."""
@@ -45,6 +44,9 @@ class ComputerUseTool(SandboxToolsBase):
         """Send request to automation service API."""
         try:
             session = await self._get_session()
+            if self.api_base_url is None:
+                self.api_base_url = await self.sandbox.get_preview_link(8000)
+                logging.info(f"Initialized Computer Use Tool with API URL: {self.api_base_url}")
             url = f"{self.api_base_url}/api{endpoint}"
             
             logging.debug(f"API request: {method} {url} {data}")
@@ -1,11 +1,31 @@
 import traceback
 import json
+import shlex
+from urllib.parse import urlencode
 
 from agentpress.tool import ToolResult, openapi_schema, xml_schema
 from agentpress.thread_manager import ThreadManager
+from sandbox.browser_client import BrowserAPIError, BrowserAPIUnavailable, browser_api_request
+from sandbox.docker.element_table import ElementTable
 from sandbox.sandbox import SandboxToolsBase, Sandbox
+from services.screenshot_store import ScreenshotStore
+from utils.config import config
 from utils.logger import logger
 
+BATCH_MAX_STEPS = 20  # Steps a batch may contain, as in the browser API
+BATCH_MAX_WAIT_SECONDS = 30  # Total seconds the browser API lets the wait steps of a batch take
+BATCH_STEP_TIMEOUT = 10  # Seconds allowed per batch step: the action and the page settle wait of up to 5 seconds
+
+
+def render_element_table(table: dict) -> str:
+    """Render the element table of a browser action as the element list shown to the LLM.
+
+    The browser API sends interactive elements as columns; they are rendered
+    as text, with the browser API's own ElementTable, only when the LLM
+    message is built.
+    """
+    return ElementTable.from_dict(table).to_string()
+
 
 class SandboxBrowserTool(SandboxToolsBase):
     """Tool for executing tasks in a Daytona sandbox with browser-use capabilities."""
@@ -13,14 +33,51 @@ class SandboxBrowserTool(SandboxToolsBase):
     def __init__(self, project_id: str, thread_id: str, thread_manager: ThreadManager):
         super().__init__(project_id, thread_manager)
         self.thread_id = thread_id
+        self.last_screenshot_ref = None
+
+    def _screenshot_query(self) -> dict:
+        """Screenshot options of browser actions, and the last screenshot so an unchanged one is not sent again."""
+        query = {}
+        if config.SANDBOX_BROWSER_SCREENSHOT_TIER:
+            query["screenshot_tier"] = config.SANDBOX_BROWSER_SCREENSHOT_TIER
+        if config.SANDBOX_BROWSER_SCREENSHOT_FORMAT:
+            query["screenshot_format"] = config.SANDBOX_BROWSER_SCREENSHOT_FORMAT
+        if self.last_screenshot_ref:
+            query["known_screenshot_id"] = self.last_screenshot_ref
+        return query
+
+    async def _request_via_exec(self, endpoint: str, params: dict = None, method: str = "POST", query: dict = None,
+                                timeout: int = None) -> dict:
+        """Call the browser API with curl inside the sandbox, for when it cannot be reached over HTTP."""
+        url = f"http://localhost:8002/api/automation/{endpoint}"
+        
+        if method == "GET" and params:
+            query = {**(query or {}), **params}
+        if query:
+            url = f"{url}?{urlencode(query)}"
+        
+        # Typed text and selectors may contain quotes; quote everything passed to the shell
+        curl_cmd = f"curl -s -X {method} {shlex.quote(url)} -H 'Content-Type: application/json'"
+        if method != "GET" and params:
+            json_data = json.dumps(params)
+            curl_cmd += f" -d {shlex.quote(json_data)}"
+        
+        logger.debug("\033[95mExecuting curl command:\033[0m")
+        logger.debug(f"{curl_cmd}")
+        
+        response = await self.sandbox.process.exec(curl_cmd, timeout=timeout or config.SANDBOX_BROWSER_API_TIMEOUT)
+        if response.exit_code != 0:
+            raise BrowserAPIError(f"Browser automation request failed 2: {response}")
+        return json.loads(response.result)
 
-    async def _execute_browser_action(self, endpoint: str, params: dict = None, method: str = "POST") -> ToolResult:
+    async def _execute_browser_action(self, endpoint: str, params: dict = None, method: str = "POST", timeout: int = None) -> ToolResult:
         """Execute a browser automation action through the API
         
         Args:
             endpoint (str): The API endpoint to call
             params (dict, optional): Parameters to send. Defaults to None.
             method (str, optional): HTTP method to use. Defaults to "POST".
+            timeout (int, optional): Seconds the action may take. Defaults to SANDBOX_BROWSER_API_TIMEOUT.
             
         Returns:
             ToolResult: Result of the execution
@@ -29,75 +86,82 @@ class SandboxBrowserTool(SandboxToolsBase):
             # Ensure sandbox is initialized
             await self._ensure_sandbox()
             
-            # Build the curl command
-            url = f"http://localhost:8002/api/automation/{endpoint}"
-            
-            if method == "GET" and params:
-                query_params = "&".join([f"{k}={v}" for k, v in params.items()])
-                url = f"{url}?{query_params}"
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-            else:
-                curl_cmd = f"curl -s -X {method} '{url}' -H 'Content-Type: application/json'"
-                if params:
-                    json_data = json.dumps(params)
-                    curl_cmd += f" -d '{json_data}'"
-            
-            logger.debug("\033[95mExecuting curl command:\033[0m")
-            logger.debug(f"{curl_cmd}")
-            
-            response = self.sandbox.process.exec(curl_cmd, timeout=30)
+            query = self._screenshot_query()
+            try:
+                result = None
+                if config.SANDBOX_BROWSER_DIRECT_HTTP:
+                    try:
+                        result = await browser_api_request(self.sandbox, endpoint, params, method, query=query, timeout=timeout)
+                    except BrowserAPIUnavailable as e:
+                        logger.warning(f"Browser API not reachable over HTTP, using curl: {e}")
+                if result is None:
+                    result = await self._request_via_exec(endpoint, params, method, query=query, timeout=timeout)
+            except BrowserAPIError as e:
+                logger.error(str(e))
+                return self.fail_response(str(e))
+            except json.JSONDecodeError as e:
+                logger.error(f"Failed to parse response JSON: {e.doc[:500]} {e}")
+                return self.fail_response(f"Failed to parse response JSON: {e.doc[:500]} {e}")
+
+            if not "content" in result:
+                result["content"] = ""
             
-            if response.exit_code == 0:
-                try:
-                    result = json.loads(response.result)
-
-                    if not "content" in result:
-                        result["content"] = ""
-                    
-                    if not "role" in result:
-                        result["role"] = "assistant"
-
-                    logger.info("Browser automation request completed successfully")
-
-                    # Add full result to thread messages for state tracking
-                    added_message = await self.thread_manager.add_message(
-                        thread_id=self.thread_id,
-                        type="browser_state",
-                        content=result,
-                        is_llm_message=False
-                    )
-
-                    # Return tool-specific success response
-                    success_response = {
-                        "success": True,
-                        "message": result.get("message", "Browser action completed successfully")
-                    }
+            if not "role" in result:
+                result["role"] = "assistant"
+
+            # Keep the screenshot in the screenshot store and only its key in the message
+            screenshot_base64 = result.pop("screenshot_base64", None)
+            if screenshot_base64:
+                result["screenshot_ref"] = await ScreenshotStore().put_base64(screenshot_base64)
+                self.last_screenshot_ref = result["screenshot_ref"]
+            elif result.get("screenshot_unchanged") and self.last_screenshot_ref:
+                # Same frame as the previous action, already stored
+                result["screenshot_ref"] = self.last_screenshot_ref
+            for checkpoint in result.get("checkpoints") or []:
+                checkpoint_screenshot = checkpoint.pop("screenshot_base64", None)
+                if checkpoint_screenshot:
+                    checkpoint["screenshot_ref"] = await ScreenshotStore().put_base64(checkpoint_screenshot)
+
+            logger.info("Browser automation request completed successfully")
+
+            # Add full result to thread messages for state tracking
+            added_message = await self.thread_manager.add_message(
+                thread_id=self.thread_id,
+                type="browser_state",
+                content=result,
+                is_llm_message=False
+            )
 
-                    # Add message ID if available
-                    if added_message and 'message_id' in added_message:
-                        success_response['message_id'] = added_message['message_id']
-
-                    # Add relevant browser-specific info
-                    if result.get("url"):
-                        success_response["url"] = result["url"]
-                    if result.get("title"):
-                        success_response["title"] = result["title"]
-                    if result.get("element_count"):
-                        success_response["elements_found"] = result["element_count"]
-                    if result.get("pixels_below"):
-                        success_response["scrollable_content"] = result["pixels_below"] > 0
-                    # Add OCR text when available
-                    if result.get("ocr_text"):
-                        success_response["ocr_text"] = result["ocr_text"]
-
-                    return self.success_response(success_response)
-
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse response JSON: {response.result} {e}")
-                    return self.fail_response(f"Failed to parse response JSON: {response.result} {e}")
-            else:
-                logger.error(f"Browser automation request failed 2: {response}")
-                return self.fail_response(f"Browser automation request failed 2: {response}")
+            # Return tool-specific success response
+            success_response = {
+                "success": True,
+                "message": result.get("message", "Browser action completed successfully")
+            }
+
+            # Add message ID if available
+            if added_message and 'message_id' in added_message:
+                success_response['message_id'] = added_message['message_id']
+
+            # Add relevant browser-specific info
+            if result.get("url"):
+                success_response["url"] = result["url"]
+            if result.get("title"):
+                success_response["title"] = result["title"]
+            if result.get("element_count"):
+                success_response["elements_found"] = result["element_count"]
+            if result.get("pixels_below"):
+                success_response["scrollable_content"] = result["pixels_below"] > 0
+            # Add OCR text when available
+            if result.get("ocr_text"):
+                success_response["ocr_text"] = result["ocr_text"]
+            # Report the outcome of each step of a batch
+            if result.get("steps") is not None:
+                success_response["success"] = result.get("success", True)
+                success_response["steps"] = result["steps"]
+                if result.get("error"):
+                    success_response["error"] = result["error"]
+
+            return self.success_response(success_response)
 
         except Exception as e:
             logger.error(f"Error executing browser action: {e}")
@@ -895,4 +959,101 @@ class SandboxBrowserTool(SandboxToolsBase):
             dict: Result of the execution
         """
         logger.debug(f"\033[95mClicking at coordinates: ({x}, {y})\033[0m")
-        return await self._execute_browser_action("click_coordinates", {"x": x, "y": y})
\ No newline at end of file
+        return await self._execute_browser_action("click_coordinates", {"x": x, "y": y})
+
+    @openapi_schema({
+        "type": "function",
+        "function": {
+            "name": "browser_batch",
+            "description": "Run a sequence of browser actions in one call, e.g. filling and submitting a form. The browser state is returned after the last step and after steps marked as checkpoints. Each step can assert the URL, visible text or an element afterwards; by default the batch stops at the first failed step.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "description": "The actions to run in order, at most 20; wait steps may take 30 seconds in total",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "action": {
+                                    "type": "string",
+                                    "description": "The action: navigate_to, go_back, wait, click_element, click_coordinates, input_text, send_keys, switch_tab, close_tab, scroll_down, scroll_up, scroll_to_text, get_dropdown_options, select_dropdown_option or drag_drop"
+                                },
+                                "params": {
+                                    "type": "object",
+                                    "description": "Parameters of the action, e.g. {\"index\": 2, \"text\": \"hello\"} for input_text or {\"index\": 4, \"option_text\": \"France\"} for select_dropdown_option"
+                                },
+                                "checkpoint": {
+                                    "type": "boolean",
+                                    "description": "Also return the browser state after this step"
+                                },
+                                "expect_url_contains": {
+                                    "type": "string",
+                                    "description": "Fail the step unless the URL then contains this"
+                                },
+                                "expect_text": {
+                                    "type": "string",
+                                    "description": "Fail the step unless this text is then visible on the page"
+                                },
+                                "expect_selector": {
+                                    "type": "string",
+                                    "description": "Fail the step unless this CSS selector then matches an element"
+                                }
+                            },
+                            "required": ["action"]
+                        }
+                    },
+                    "stop_on_failure": {
+                        "type": "boolean",
+                        "description": "Stop at the first failed step",
+                        "default": True
+                    }
+                },
+                "required": ["steps"]
+            }
+        }
+    })
+    @xml_schema(
+        tag_name="browser-batch",
+        mappings=[
+            {"param_name": "steps", "node_type": "content", "path": "."},
+            {"param_name": "stop_on_failure", "node_type": "attribute", "path": "."}
+        ],
+        example='''
+        <!-- Fill in and submit a form in one call; element indices come from the last browser state -->
+        <browser-batch>
+        [
+            {"action": "input_text", "params": {"index": 2, "text": "Jane Doe"}},
+            {"action": "input_text", "params": {"index": 3, "text": "jane@example.com"}},
+            {"action": "select_dropdown_option", "params": {"index": 4, "option_text": "France"}},
+            {"action": "click_element", "params": {"index": 5}, "expect_text": "Thank you"}
+        ]
+        </browser-batch>
+        '''
+    )
+    async def browser_batch(self, steps, stop_on_failure: bool = True) -> ToolResult:
+        """Run a sequence of browser actions in one request
+        
+        Args:
+            steps (list | str): The steps to run, or their JSON
+            stop_on_failure (bool, optional): Stop at the first failed step. Defaults to True.
+            
+        Returns:
+            dict: Result of the execution
+        """
+        if isinstance(steps, str):
+            try:
+                steps = json.loads(steps)
+            except json.JSONDecodeError as e:
+                return self.fail_response(f"steps must be a JSON list of actions: {e}")
+        if isinstance(stop_on_failure, str):
+            stop_on_failure = stop_on_failure.lower() not in ("false", "0", "no")
+        if not isinstance(steps, list) or not steps:
+            return self.fail_response("steps must be a non-empty list of actions")
+        if len(steps) > BATCH_MAX_STEPS:
+            return self.fail_response(f"A batch may have at most {BATCH_MAX_STEPS} steps")
+        
+        # A batch may take as long as all of its steps, far longer than a single action
+        timeout = config.SANDBOX_BROWSER_API_TIMEOUT + len(steps) * BATCH_STEP_TIMEOUT + BATCH_MAX_WAIT_SECONDS
+        logger.debug(f"\033[95mRunning a batch of {len(steps)} browser actions\033[0m")
+        return await self._execute_browser_action("batch", {"steps": steps, "stop_on_failure": stop_on_failure}, timeout=timeout)
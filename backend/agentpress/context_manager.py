@@ -3,38 +3,155 @@ Context Management for AgentPress Threads.
 
 This module handles token counting and thread summarization to prevent
 reaching the context window limitations of LLM models.
+
+Summarization runs as a background compaction: once a thread crosses the
+soft token threshold a summary is generated with a cheap model while the
+agent keeps running, and it is swapped in at the next iteration boundary.
+Only at the hard threshold does an iteration wait for the summary, starting
+one if none is in flight. The thresholds and the summary model come from
+utils.config.
 """
 
+import asyncio
 import json
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import List, Dict, Any, Optional
 
 from litellm import token_counter, completion, completion_cost
 from services.supabase import DBConnection
 from services.llm import make_llm_api_call
+from agentpress.token_ledger import TokenLedger, message_digest
+from utils.config import config
 from utils.logger import logger
 
 # Constants for token management
-DEFAULT_TOKEN_THRESHOLD = 120000  # 80k tokens threshold for summarization
 SUMMARY_TARGET_TOKENS = 10000    # Target ~10k tokens for the summary message
 RESERVE_TOKENS = 5000            # Reserve tokens for new messages
+SUMMARY_WINDOW_TOKENS = 40000    # Maximum conversation tokens per summarization request
+WINDOW_SUMMARY_TOKENS = 2000     # Target tokens for the summary of one window
+SUMMARY_CONCURRENCY = 4          # Summarization requests in flight per summary
+MAX_CACHED_WINDOW_SUMMARIES = 512  # Window summaries kept for reuse across compactions
+SUMMARY_HEADER = "======== CONVERSATION HISTORY SUMMARY ========"
+SUMMARY_FOOTER = "======== END OF SUMMARY ========"
+
+SUMMARY_INSTRUCTIONS = """You are a specialized summarization assistant. Your task is to create a concise but comprehensive summary of the conversation history.
+
+The summary should:
+1. Preserve all key information including decisions, conclusions, and important context
+2. Include any tools that were used and their results
+3. Maintain chronological order of events
+4. Be presented as a narrated list of key points with section headers
+5. Include only factual information from the conversation (no new information)
+6. Be concise but detailed enough that the conversation can continue with this summary as context
+
+VERY IMPORTANT: This summary will replace older parts of the conversation in the LLM's context window, so ensure it contains ALL key information and LATEST STATE OF THE CONVERSATION - SO WE WILL KNOW HOW TO PICK UP WHERE WE LEFT OFF.
+"""
+
+
+@dataclass
+class CompactionStats:
+    """Aggregated outcome of background compactions."""
+    started: int = 0
+    applied: int = 0
+    failed: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "started": self.started,
+            "applied": self.applied,
+            "failed": self.failed,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+class _Compaction:
+    """Background compaction state of one thread."""
+    __slots__ = ("task", "boundary", "tokens_before", "applied", "start_at")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.boundary: Optional[str] = None  # Database timestamp the summary is inserted at; None appends it
+        self.tokens_before = 0
+        self.applied = False  # A summary was applied and the next count sets start_at
+        self.start_at = 0  # Token count below which no background compaction starts
+
+
+class _SummaryCache:
+    """Least recently used cache of window summaries, bounded by entry count."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        summary = self._entries.get(key)
+        if summary is not None:
+            self._entries.move_to_end(key)
+        return summary
+
+    def put(self, key: str, summary: str) -> None:
+        self._entries[key] = summary
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
 
 class ContextManager:
     """Manages thread context including token counting and summarization."""
     
-    def __init__(self, token_threshold: int = DEFAULT_TOKEN_THRESHOLD):
+    # Window summaries keyed by a digest of model, target size and window text,
+    # shared by all instances so later runs reuse them
+    _window_summaries = _SummaryCache(MAX_CACHED_WINDOW_SUMMARIES)
+    
+    def __init__(
+        self,
+        token_threshold: Optional[int] = None,
+        soft_token_threshold: Optional[int] = None,
+        hysteresis_tokens: Optional[int] = None,
+        summary_model: Optional[str] = None
+    ):
         """Initialize the ContextManager.
         
         Args:
-            token_threshold: Token count threshold to trigger summarization
+            token_threshold: Token count at which an iteration waits for a summary.
+                             Defaults to CONTEXT_TOKEN_THRESHOLD.
+            soft_token_threshold: Token count that starts a background compaction.
+                                  Defaults to CONTEXT_SOFT_TOKEN_THRESHOLD.
+            hysteresis_tokens: How much a thread must grow after a summary before
+                               another background compaction starts. Defaults to
+                               CONTEXT_HYSTERESIS_TOKENS.
+            summary_model: LLM model used for summaries. Defaults to CONTEXT_SUMMARY_MODEL.
         """
         self.db = DBConnection()
-        self.token_threshold = token_threshold
+        self.token_threshold = token_threshold or config.CONTEXT_TOKEN_THRESHOLD
+        self.soft_token_threshold = min(soft_token_threshold or config.CONTEXT_SOFT_TOKEN_THRESHOLD, self.token_threshold)
+        self.hysteresis_tokens = config.CONTEXT_HYSTERESIS_TOKENS if hysteresis_tokens is None else hysteresis_tokens
+        self.summary_model = summary_model or config.CONTEXT_SUMMARY_MODEL
+        self.token_ledger = TokenLedger()
+        self.compaction_stats = CompactionStats()
+        self._compactions: Dict[str, _Compaction] = {}
     
-    async def get_thread_token_count(self, thread_id: str) -> int:
+    async def get_thread_token_count(self, thread_id: str, model: str = "gpt-4") -> int:
         """Get the current token count for a thread using LiteLLM.
         
+        Counts stored in message metadata or in the TokenLedger are reused, so
+        only messages that were never counted for this model are tokenized.
+        
         Args:
             thread_id: ID of the thread to analyze
+            model: Model whose tokenizer is used
             
         Returns:
             The total token count for relevant messages in the thread
@@ -42,16 +159,28 @@ class ContextManager:
         logger.debug(f"Getting token count for thread {thread_id}")
         
         try:
-            # Get messages for the thread
-            messages = await self.get_messages_for_summarization(thread_id)
+            # Get message rows for the thread
+            rows = await self._get_rows_for_summarization(thread_id)
             
-            if not messages:
+            if not rows:
                 logger.debug(f"No messages found for thread {thread_id}")
                 return 0
             
-            # Use litellm's token_counter for accurate model-specific counting
-            # This is much more accurate than the SQL-based estimation
-            token_count = token_counter(model="gpt-4", messages=messages)
+            token_count = 0
+            for row in rows:
+                metadata = row.get('metadata') or {}
+                if isinstance(metadata, str):
+                    try:
+                        metadata = json.loads(metadata)
+                    except json.JSONDecodeError:
+                        metadata = {}
+                stored_count = (metadata.get('token_counts') or {}).get(model) if isinstance(metadata, dict) else None
+                if stored_count is not None:
+                    self.token_ledger.record(model, row['message_id'], stored_count)
+                    token_count += stored_count
+                else:
+                    token_count += self.token_ledger.count_message(model, self._format_row(row), key=row['message_id'])
+            token_count -= self.token_ledger.request_overhead(model) * (len(rows) - 1)
             
             logger.info(f"Thread {thread_id} has {token_count} tokens (calculated with litellm)")
             return token_count
@@ -60,6 +189,75 @@ class ContextManager:
             logger.error(f"Error getting token count: {str(e)}")
             return 0
     
+    async def _get_rows_for_summarization(self, thread_id: str) -> List[Dict[str, Any]]:
+        """Get the LLM message rows after the most recent summary, excluding summaries."""
+        client = await self.db.client
+        
+        # Find the most recent summary message
+        # Messages are ordered by (created_at, seq): seq breaks ties between rows with the same timestamp
+        summary_result = await client.table('messages').select('created_at, seq') \
+            .eq('thread_id', thread_id) \
+            .eq('type', 'summary') \
+            .eq('is_llm_message', True) \
+            .order('created_at', desc=True) \
+            .order('seq', desc=True) \
+            .limit(1) \
+            .execute()
+        
+        # Get messages after the most recent summary or all messages if no summary
+        last_summary = None
+        if summary_result.data and len(summary_result.data) > 0:
+            last_summary = summary_result.data[0]
+            logger.debug(f"Found last summary at {last_summary['created_at']}")
+            
+            # Get all messages from the summary's timestamp on; those before it in seq are dropped below
+            messages_result = await client.table('messages').select('*') \
+                .eq('thread_id', thread_id) \
+                .eq('is_llm_message', True) \
+                .gte('created_at', last_summary['created_at']) \
+                .order('created_at') \
+                .order('seq') \
+                .execute()
+        else:
+            logger.debug("No previous summary found, getting all messages")
+            # Get all messages
+            messages_result = await client.table('messages').select('*') \
+                .eq('thread_id', thread_id) \
+                .eq('is_llm_message', True) \
+                .order('created_at') \
+                .order('seq') \
+                .execute()
+        
+        rows = []
+        for msg in messages_result.data:
+            # Skip existing summary messages - we don't want to summarize summaries
+            if msg.get('type') == 'summary':
+                logger.debug(f"Skipping summary message from {msg.get('created_at')}")
+                continue
+            if last_summary and msg['created_at'] == last_summary['created_at'] and msg['seq'] < last_summary['seq']:
+                continue
+            rows.append(msg)
+        return rows
+    
+    @staticmethod
+    def _format_row(msg: Dict[str, Any]) -> Any:
+        """Turn a messages row into an LLM-formatted message."""
+        # Parse content if it's a string
+        content = msg['content']
+        if isinstance(content, str):
+            try:
+                content = json.loads(content)
+            except json.JSONDecodeError:
+                pass  # Keep as string if not valid JSON
+        
+        # Ensure we have the proper format for the LLM
+        if 'role' not in content and 'type' in msg:
+            # Convert message type to role if needed
+            role = msg['type']
+            if role == 'assistant' or role == 'user' or role == 'system' or role == 'tool':
+                content = {'role': role, 'content': content}
+        return content
+    
     async def get_messages_for_summarization(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all LLM messages from the thread that need to be summarized.
         
@@ -74,63 +272,9 @@ class ContextManager:
             List of message objects to summarize
         """
         logger.debug(f"Getting messages for summarization for thread {thread_id}")
-        client = await self.db.client
         
         try:
-            # Find the most recent summary message
-            summary_result = await client.table('messages').select('created_at') \
-                .eq('thread_id', thread_id) \
-                .eq('type', 'summary') \
-                .eq('is_llm_message', True) \
-                .order('created_at', desc=True) \
-                .limit(1) \
-                .execute()
-            
-            # Get messages after the most recent summary or all messages if no summary
-            if summary_result.data and len(summary_result.data) > 0:
-                last_summary_time = summary_result.data[0]['created_at']
-                logger.debug(f"Found last summary at {last_summary_time}")
-                
-                # Get all messages after the summary, but NOT including the summary itself
-                messages_result = await client.table('messages').select('*') \
-                    .eq('thread_id', thread_id) \
-                    .eq('is_llm_message', True) \
-                    .gt('created_at', last_summary_time) \
-                    .order('created_at') \
-                    .execute()
-            else:
-                logger.debug("No previous summary found, getting all messages")
-                # Get all messages
-                messages_result = await client.table('messages').select('*') \
-                    .eq('thread_id', thread_id) \
-                    .eq('is_llm_message', True) \
-                    .order('created_at') \
-                    .execute()
-            
-            # Parse the message content if needed
-            messages = []
-            for msg in messages_result.data:
-                # Skip existing summary messages - we don't want to summarize summaries
-                if msg.get('type') == 'summary':
-                    logger.debug(f"Skipping summary message from {msg.get('created_at')}")
-                    continue
-                    
-                # Parse content if it's a string
-                content = msg['content']
-                if isinstance(content, str):
-                    try:
-                        content = json.loads(content)
-                    except json.JSONDecodeError:
-                        pass  # Keep as string if not valid JSON
-                
-                # Ensure we have the proper format for the LLM
-                if 'role' not in content and 'type' in msg:
-                    # Convert message type to role if needed
-                    role = msg['type']
-                    if role == 'assistant' or role == 'user' or role == 'system' or role == 'tool':
-                        content = {'role': role, 'content': content}
-                
-                messages.append(content)
+            messages = [self._format_row(row) for row in await self._get_rows_for_summarization(thread_id)]
             
             logger.info(f"Got {len(messages)} messages to summarize for thread {thread_id}")
             return messages
@@ -147,6 +291,14 @@ class ContextManager:
     ) -> Optional[Dict[str, Any]]:
         """Generate a summary of conversation messages.
         
+        Messages are split into token-bounded windows that are summarized
+        concurrently, and the window summaries are merged hierarchically until
+        one summary remains. No single request exceeds the window budget, and
+        window summaries are cached so later compactions of the same messages
+        reuse them. A previous summary among the messages is not summarized
+        again: it joins the merge as the oldest part, and the windows start
+        after it.
+        
         Args:
             thread_id: ID of the thread to summarize
             messages: Messages to summarize
@@ -161,59 +313,41 @@ class ContextManager:
         
         logger.info(f"Creating summary for thread {thread_id} with {len(messages)} messages")
         
-        # Create system message with summarization instructions
-        system_message = {
-            "role": "system",
-            "content": f"""You are a specialized summarization assistant. Your task is to create a concise but comprehensive summary of the conversation history.
-
-The summary should:
-1. Preserve all key information including decisions, conclusions, and important context
-2. Include any tools that were used and their results
-3. Maintain chronological order of events
-4. Be presented as a narrated list of key points with section headers
-5. Include only factual information from the conversation (no new information)
-6. Be concise but detailed enough that the conversation can continue with this summary as context
-
-VERY IMPORTANT: This summary will replace older parts of the conversation in the LLM's context window, so ensure it contains ALL key information and LATEST STATE OF THE CONVERSATION - SO WE WILL KNOW HOW TO PICK UP WHERE WE LEFT OFF.
-
-
-THE CONVERSATION HISTORY TO SUMMARIZE IS AS FOLLOWS:
-===============================================================
-==================== CONVERSATION HISTORY ====================
-{messages}
-==================== END OF CONVERSATION HISTORY ====================
-===============================================================
-"""
-        }
-        
         try:
-            # Call LLM to generate summary
-            response = await make_llm_api_call(
-                model_name=model,
-                messages=[system_message, {"role": "user", "content": "PLEASE PROVIDE THE SUMMARY NOW."}],
-                temperature=0,
-                max_tokens=SUMMARY_TARGET_TOKENS,
-                stream=False
-            )
+            # Windows are anchored on the last summary rather than the start of the
+            # list, so they stay the same while the thread grows after it; anything
+            # before that summary is already covered by it
+            previous_summary = None
+            for index in range(len(messages) - 1, -1, -1):
+                previous_summary = self._summary_text(messages[index])
+                if previous_summary is not None:
+                    messages = messages[index + 1:]
+                    break
+            windows = self._split_into_windows(messages, model)
+            semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
             
-            if response and hasattr(response, 'choices') and response.choices:
-                summary_content = response.choices[0].message.content
-                
-                # Track token usage
-                try:
-                    token_count = token_counter(model=model, messages=[{"role": "user", "content": summary_content}])
-                    cost = completion_cost(model=model, prompt="", completion=summary_content)
-                    logger.info(f"Summary generated with {token_count} tokens at cost ${cost:.6f}")
-                except Exception as e:
-                    logger.error(f"Error calculating token usage: {str(e)}")
-                
+            if len(windows) == 1 and previous_summary is None:
+                summary_content = await self._summarize_window(windows[0], model, SUMMARY_TARGET_TOKENS, semaphore)
+            else:
+                logger.info(f"Summarizing {len(windows)} windows of thread {thread_id} concurrently")
+                partials = await asyncio.gather(*[
+                    self._summarize_window(window, model, WINDOW_SUMMARY_TOKENS, semaphore)
+                    for window in windows
+                ])
+                summary_content = None
+                if all(partials):
+                    if previous_summary is not None:
+                        partials = [previous_summary, *partials]
+                    summary_content = await self._merge_summaries(list(partials), model, semaphore)
+            
+            if summary_content:
                 # Format the summary message with clear beginning and end markers
                 formatted_summary = f"""
-======== CONVERSATION HISTORY SUMMARY ========
+{SUMMARY_HEADER}
 
 {summary_content}
 
-======== END OF SUMMARY ========
+{SUMMARY_FOOTER}
 
 The above is a summary of the conversation history. The conversation continues below.
 """
@@ -232,6 +366,167 @@ The above is a summary of the conversation history. The conversation continues b
         except Exception as e:
             logger.error(f"Error creating summary: {str(e)}", exc_info=True)
             return None
+    
+    @staticmethod
+    def _summary_text(message: Any) -> Optional[str]:
+        """Text of a summary message created by create_summary, or None for other messages."""
+        if not isinstance(message, dict) or not isinstance(message.get('content'), str):
+            return None
+        content = message['content']
+        start = content.find(SUMMARY_HEADER)
+        end = content.find(SUMMARY_FOOTER)
+        if start == -1 or end < start:
+            return None
+        return content[start + len(SUMMARY_HEADER):end].strip()
+    
+    @staticmethod
+    def _render_message(message: Any) -> str:
+        """Render one message as plain text for the summarizer, without image data."""
+        if not isinstance(message, dict):
+            return str(message)
+        content = message.get('content')
+        if isinstance(content, list):
+            parts = []
+            for item in content:
+                if isinstance(item, dict) and item.get('type') == 'text':
+                    parts.append(item.get('text', ''))
+                elif isinstance(item, dict) and item.get('type') == 'image_url':
+                    parts.append('[image]')
+                else:
+                    parts.append(json.dumps(item))
+            content = "\n".join(parts)
+        elif not isinstance(content, str):
+            content = json.dumps(content)
+        if message.get('tool_calls'):
+            content += "\n[tool calls] " + json.dumps(message['tool_calls'])
+        return f"[{message.get('role', 'unknown')}]: {content}"
+    
+    def _split_into_windows(self, messages: List[Dict[str, Any]], model: str) -> List[List[str]]:
+        """Greedily split rendered messages into windows of at most SUMMARY_WINDOW_TOKENS.
+        
+        Windows are cut from the start of the list, which create_summary anchors
+        on the last summary, so a list that extends an earlier one yields the
+        same leading windows and reuses their summaries.
+        """
+        windows: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for message in messages:
+            rendered = self._render_message(message)
+            tokens = self.token_ledger.count_message(model, {"role": "user", "content": rendered})
+            if tokens > SUMMARY_WINDOW_TOKENS:
+                # Keep the head of an oversized message; ~3 characters per token is conservative
+                rendered = rendered[:SUMMARY_WINDOW_TOKENS * 3] + "\n[... truncated ...]"
+                tokens = SUMMARY_WINDOW_TOKENS
+            if current and current_tokens + tokens > SUMMARY_WINDOW_TOKENS:
+                windows.append(current)
+                current, current_tokens = [], 0
+            current.append(rendered)
+            current_tokens += tokens
+        if current:
+            windows.append(current)
+        return windows
+    
+    async def _summarize_window(
+        self,
+        window: List[str],
+        model: str,
+        max_tokens: int,
+        semaphore: asyncio.Semaphore
+    ) -> Optional[str]:
+        """Summarize one window of rendered messages, reusing a cached summary."""
+        conversation = "\n\n".join(window)
+        cache_key = message_digest(f"{model}:{max_tokens}:{conversation}")
+        cached = self._window_summaries.get(cache_key)
+        if cached is not None:
+            logger.debug(f"Reusing cached summary for window of {len(window)} messages")
+            return cached
+        
+        prompt = f"""{SUMMARY_INSTRUCTIONS}
+
+THE CONVERSATION HISTORY TO SUMMARIZE IS AS FOLLOWS:
+===============================================================
+==================== CONVERSATION HISTORY ====================
+{conversation}
+==================== END OF CONVERSATION HISTORY ====================
+===============================================================
+"""
+        summary = await self._call_summarizer(prompt, model, max_tokens, semaphore)
+        if summary:
+            self._window_summaries.put(cache_key, summary)
+        return summary
+    
+    async def _merge_summaries(self, summaries: List[str], model: str, semaphore: asyncio.Semaphore) -> Optional[str]:
+        """Merge consecutive summaries level by level until one remains."""
+        while len(summaries) > 1:
+            groups: List[List[str]] = []
+            current: List[str] = []
+            current_tokens = 0
+            for summary in summaries:
+                tokens = self.token_ledger.count_message(model, {"role": "user", "content": summary})
+                if len(current) >= 2 and current_tokens + tokens > SUMMARY_WINDOW_TOKENS:
+                    groups.append(current)
+                    current, current_tokens = [], 0
+                current.append(summary)
+                current_tokens += tokens
+            groups.append(current)
+            
+            final = len(groups) == 1
+            logger.info(f"Merging {len(summaries)} partial summaries in {len(groups)} groups")
+            merge_results = iter(await asyncio.gather(*[
+                self._merge_group(group, model, SUMMARY_TARGET_TOKENS if final else WINDOW_SUMMARY_TOKENS, semaphore)
+                for group in groups if len(group) > 1
+            ]))
+            merged = [next(merge_results) if len(group) > 1 else group[0] for group in groups]
+            if not all(merged):
+                return None
+            summaries = merged
+        return summaries[0]
+    
+    async def _merge_group(self, group: List[str], model: str, max_tokens: int, semaphore: asyncio.Semaphore) -> Optional[str]:
+        """Merge consecutive partial summaries into one."""
+        parts = "\n\n".join(
+            f"==================== PART {i} OF {len(group)} ====================\n{summary}"
+            for i, summary in enumerate(group, 1)
+        )
+        prompt = f"""{SUMMARY_INSTRUCTIONS}
+
+The conversation history has already been summarized in consecutive parts, oldest first.
+Merge them into a single summary, keeping chronological order and the latest state.
+
+THE PARTIAL SUMMARIES ARE AS FOLLOWS:
+===============================================================
+{parts}
+===============================================================
+"""
+        return await self._call_summarizer(prompt, model, max_tokens, semaphore)
+    
+    async def _call_summarizer(self, prompt: str, model: str, max_tokens: int, semaphore: asyncio.Semaphore) -> Optional[str]:
+        """Run one summarization request and return the summary text."""
+        async with semaphore:
+            # Call LLM to generate summary
+            response = await make_llm_api_call(
+                model_name=model,
+                messages=[{"role": "system", "content": prompt}, {"role": "user", "content": "PLEASE PROVIDE THE SUMMARY NOW."}],
+                temperature=0,
+                max_tokens=max_tokens,
+                stream=False
+            )
+        
+        if not (response and hasattr(response, 'choices') and response.choices):
+            logger.error("Failed to generate summary: Invalid response")
+            return None
+        summary_content = response.choices[0].message.content
+        
+        # Track token usage
+        try:
+            token_count = token_counter(model=model, messages=[{"role": "user", "content": summary_content}])
+            cost = completion_cost(model=model, prompt="", completion=summary_content)
+            logger.info(f"Summary generated with {token_count} tokens at cost ${cost:.6f}")
+        except Exception as e:
+            logger.error(f"Error calculating token usage: {str(e)}")
+        
+        return summary_content
         
     async def check_and_summarize_if_needed(
         self, 
@@ -295,4 +590,165 @@ The above is a summary of the conversation history. The conversation continues b
                 
         except Exception as e:
             logger.error(f"Error in check_and_summarize_if_needed: {str(e)}", exc_info=True)
-            return False 
\ No newline at end of file
+            return False 
+
+    def start_compaction_if_needed(
+        self,
+        thread_id: str,
+        token_count: int,
+        messages: List[Dict[str, Any]],
+        boundary: Optional[str],
+        model: str
+    ) -> bool:
+        """Start summarizing a thread in the background if it crossed the soft threshold.
+
+        After a summary is applied, the next background compaction waits until
+        the thread has grown by the hysteresis band, so a large summary does not
+        trigger another one right away. At the hard threshold a compaction is
+        started regardless.
+
+        Args:
+            thread_id: ID of the thread
+            token_count: Current token count of the thread
+            messages: LLM-formatted messages to summarize, as sent in this iteration
+            boundary: Database timestamp of the newest message, read before these
+                      messages were fetched; the summary is placed there so messages
+                      added while it is generated stay after it. Without one no
+                      background compaction is started.
+            model: Model whose tokenizer is used to measure the savings
+
+        Returns:
+            True if a compaction was started
+        """
+        state = self._compactions.setdefault(thread_id, _Compaction())
+        if state.task is not None:
+            return False
+        if state.applied:
+            # First count after a summary: the baseline the hysteresis is measured from
+            state.applied = False
+            state.start_at = token_count + self.hysteresis_tokens
+        if len(messages) < 3 or boundary is None:
+            return False
+        if token_count < self.token_threshold and token_count < max(self.soft_token_threshold, state.start_at):
+            return False
+
+        logger.info(f"Thread {thread_id} reached {token_count} tokens (soft threshold {self.soft_token_threshold}), starting background compaction")
+        # Tokens of the summarized messages alone, from the running total of the count just taken
+        tokens_before = self.token_ledger.message_token_count(thread_id, model)
+        if tokens_before is None:
+            tokens_before = self.token_ledger.thread_token_count(thread_id, model, None, messages)
+        self._start_compaction(state, thread_id, messages, boundary, tokens_before)
+        return True
+
+    def _start_compaction(
+        self,
+        state: _Compaction,
+        thread_id: str,
+        messages: List[Dict[str, Any]],
+        boundary: Optional[str],
+        tokens_before: int
+    ) -> None:
+        # Snapshot the messages: callers go on to mutate them while preparing the LLM call
+        snapshot = json.loads(json.dumps(messages))
+        state.boundary = boundary
+        state.tokens_before = tokens_before
+        state.task = asyncio.create_task(self.create_summary(thread_id, snapshot, self.summary_model))
+        self.compaction_stats.started += 1
+
+    async def apply_compaction(
+        self,
+        thread_id: str,
+        add_message_callback,
+        model: str,
+        wait: bool = False
+    ) -> bool:
+        """Swap in a finished background summary.
+
+        Args:
+            thread_id: ID of the thread
+            add_message_callback: Callback to add the summary message to the thread
+            model: Model whose tokenizer is used to measure the savings
+            wait: Wait for a summary that is still being generated, or summarize
+                  the thread now if none is; used at the hard threshold
+
+        Returns:
+            True if a summary was added to the thread
+        """
+        state = self._compactions.setdefault(thread_id, _Compaction())
+        if state.task is None:
+            if not wait:
+                return False
+            # Nothing in flight, e.g. the last summary failed: summarize now
+            messages = await self.get_messages_for_summarization(thread_id)
+            if len(messages) < 3:
+                return False
+            logger.info(f"Thread {thread_id} reached the hard token threshold, summarizing {len(messages)} messages")
+            tokens_before = sum(self.token_ledger.count_message(model, message) for message in messages)
+            tokens_before -= self.token_ledger.request_overhead(model) * (len(messages) - 1)
+            # The iteration waits for the summary, so no message is added before it and it is appended
+            self._start_compaction(state, thread_id, messages, None, tokens_before)
+        elif not state.task.done():
+            if not wait:
+                return False
+            logger.info(f"Thread {thread_id} reached the hard token threshold, waiting for background compaction")
+
+        try:
+            summary = await state.task
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Background compaction failed for thread {thread_id}: {str(e)}", exc_info=True)
+            summary = None
+        finally:
+            # Finished either way, so a later iteration can start another one
+            if state.task is not None and state.task.done():
+                state.task = None
+
+        if not summary:
+            self.compaction_stats.failed += 1
+            return False
+
+        try:
+            await add_message_callback(
+                thread_id=thread_id,
+                type="summary",
+                content=summary,
+                is_llm_message=True,
+                metadata={"token_count": state.tokens_before, "background_compaction": True},
+                created_at=state.boundary
+            )
+        except Exception as e:
+            logger.error(f"Failed to add compaction summary to thread {thread_id}: {str(e)}", exc_info=True)
+            self.compaction_stats.failed += 1
+            return False
+
+        state.applied = True
+        summary_tokens = self.token_ledger.count_message(model, summary)
+        self.compaction_stats.applied += 1
+        self.compaction_stats.tokens_before += state.tokens_before
+        self.compaction_stats.tokens_after += summary_tokens
+        logger.info(f"Applied background compaction to thread {thread_id}: "
+                    f"{state.tokens_before} tokens summarized into {summary_tokens} "
+                    f"(run total saved: {self.compaction_stats.tokens_saved})")
+        return True
+
+    async def finish_compactions(self, add_message_callback, model: str) -> None:
+        """Apply summaries that are ready and cancel those still being generated.
+
+        Called when a run ends, however it ends, so a finished summary still
+        benefits the next run and no summary keeps running after it.
+        """
+        for thread_id, state in list(self._compactions.items()):
+            if state.task is None:
+                continue
+            if state.task.done():
+                try:
+                    await self.apply_compaction(thread_id, add_message_callback, model)
+                except Exception as e:
+                    logger.error(f"Failed to apply compaction for thread {thread_id}: {str(e)}", exc_info=True)
+            else:
+                logger.info(f"Cancelling background compaction for thread {thread_id}")
+                state.task.cancel()
+                state.task = None
+        if self.compaction_stats.started:
+            logger.info(f"Compaction stats: {self.compaction_stats.as_dict()}")
@@ -0,0 +1,178 @@
+"""
+In-memory cache of the LLM-formatted messages of each thread.
+
+get_llm_messages runs on every iteration of an agent run. Instead of fetching
+and parsing the whole thread each time, the cache keeps it in process memory:
+- Messages are held as their JSON text and parsed in a single call on read,
+  so callers always get fresh objects they are free to mutate
+- Messages added through the ThreadManager are appended in place, and a
+  summary message replaces everything before it
+- Entries are validated against the thread's message_version column, which
+  the database bumps for every LLM message write from any writer
+- Threads are evicted least recently used first, bounded by count and bytes
+- Each entry has a lineage: an ID that changes whenever earlier messages may
+  have changed, so callers can keep per-message state for the messages read
+  before and only process the ones appended since
+"""
+
+import itertools
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from utils.logger import logger
+
+# Constants for cache bounds
+DEFAULT_MAX_THREADS = 256                    # Maximum number of cached threads
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024         # Maximum total size of cached message text
+
+
+_lineages = itertools.count(1)
+
+
+class _CachedThread:
+    """Cached messages of one thread."""
+    __slots__ = ("messages", "size", "version", "lineage")
+
+    def __init__(self, messages: List[str], version: int):
+        self.messages = messages
+        self.size = sum(len(message) for message in messages)
+        self.version = version
+        self.lineage = next(_lineages)
+
+
+class MessageCache:
+    """Singleton LRU cache of LLM-formatted thread messages.
+
+    The version of an entry is the message_version the database will report
+    once every message appended to it has been persisted. A lookup with any
+    other version is a miss and drops the entry.
+    """
+
+    _instance: Optional['MessageCache'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, max_threads: int = DEFAULT_MAX_THREADS, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Initialize the cache once per process.
+
+        Args:
+            max_threads: Maximum number of threads kept in memory
+            max_bytes: Maximum total length of the cached message text
+        """
+        if self._initialized:
+            return
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, _CachedThread]' = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._initialized = True
+
+    def get(self, thread_id: str, version: int) -> Optional[List[Any]]:
+        """Return the cached messages of a thread if they are still current.
+
+        Args:
+            thread_id: The ID of the thread
+            version: The thread's current message_version in the database
+
+        Returns:
+            Newly parsed list of messages, or None on a miss
+        """
+        entry = self._entries.get(thread_id)
+        if entry is None or entry.version != version:
+            if entry is not None:
+                logger.debug(f"Message cache for thread {thread_id} is stale (version {entry.version}, expected {version})")
+                self.invalidate(thread_id)
+            self.misses += 1
+            return None
+
+        try:
+            messages = json.loads("[" + ",".join(entry.messages) + "]")
+        except json.JSONDecodeError:
+            # A message whose content is not JSON text; let the database handle it
+            logger.debug(f"Message cache for thread {thread_id} holds non-JSON content, dropping it")
+            self.invalidate(thread_id)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(thread_id)
+        self.hits += 1
+        return messages
+
+    def put(self, thread_id: str, messages: List[str], version: int) -> None:
+        """Cache the messages of a thread as fetched from the database.
+
+        Args:
+            thread_id: The ID of the thread
+            messages: JSON text of each LLM-formatted message, in order
+            version: The message_version read before the messages were fetched
+        """
+        self.invalidate(thread_id)
+        entry = _CachedThread(list(messages), version)
+        self._entries[thread_id] = entry
+        self._total_bytes += entry.size
+        self._evict()
+
+    def append(self, thread_id: str, message: str, is_summary: bool = False) -> None:
+        """Append a newly added LLM message to a cached thread.
+
+        Does nothing if the thread is not cached.
+
+        Args:
+            thread_id: The ID of the thread
+            message: JSON text of the message content
+            is_summary: Whether the message is a summary, which replaces all earlier messages
+        """
+        entry = self._entries.get(thread_id)
+        if entry is None:
+            return
+
+        self._total_bytes -= entry.size
+        if is_summary:
+            entry.messages = [message]
+            entry.size = len(message)
+            entry.lineage = next(_lineages)
+        else:
+            entry.messages.append(message)
+            entry.size += len(message)
+        self._total_bytes += entry.size
+        entry.version += 1
+        self._entries.move_to_end(thread_id)
+        self._evict()
+
+    def lineage(self, thread_id: str) -> Optional[int]:
+        """Lineage of a cached thread, or None if it is not cached.
+
+        While the lineage is unchanged, messages are only appended to the
+        thread: every message read earlier is still at the same position.
+        """
+        entry = self._entries.get(thread_id)
+        return entry.lineage if entry is not None else None
+
+    def invalidate(self, thread_id: str) -> None:
+        """Drop the cached messages of a thread."""
+        entry = self._entries.pop(thread_id, None)
+        if entry is not None:
+            self._total_bytes -= entry.size
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache occupancy and hit counters."""
+        return {
+            "threads": len(self._entries),
+            "bytes": self._total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self) -> None:
+        """Evict least recently used threads until the cache is within bounds."""
+        while self._entries and (len(self._entries) > self.max_threads or self._total_bytes > self.max_bytes):
+            thread_id, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size
+            logger.debug(f"Evicted thread {thread_id} from message cache ({entry.size} bytes)")
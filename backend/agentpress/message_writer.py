@@ -0,0 +1,213 @@
+"""
+Write-behind persistence of thread messages for AgentPress.
+
+This module lets the streaming loop hand messages off without waiting on the
+database:
+- Message IDs are generated client-side, so callers get the message object
+  immediately; created_at comes from the database default, and rows inserted
+  in one batch keep their order through the messages.seq column
+- Each thread has its own ordered queue, drained by a single flusher task
+- Rows are inserted in batches bounded by size and by time
+- flush() waits until everything queued for a thread has been written, and
+  raises MessageWriteError if rows could not be written; those rows stay
+  queued and are retried by the next flush or enqueue
+"""
+
+import asyncio
+import uuid
+from typing import Any, Dict, List, Optional
+
+from services.supabase import DBConnection
+from utils.logger import logger
+
+# Constants for batching
+DEFAULT_MAX_BATCH_SIZE = 50      # Insert at most this many rows per request
+DEFAULT_MAX_BATCH_DELAY = 0.05   # Seconds to wait for more rows before inserting
+INSERT_RETRY_DELAY = 0.5         # Seconds to wait before the first retry of a failed batch
+INSERT_RETRY_MAX_DELAY = 5.0     # Longest wait between retries
+INSERT_RETRY_DEADLINE = 30.0     # Seconds a batch is retried before the failure is reported
+
+
+class MessageWriteError(Exception):
+    """Queued messages could not be written to the database."""
+
+    def __init__(self, thread_id: str, message_ids: List[str], cause: Optional[BaseException] = None):
+        self.thread_id = thread_id
+        self.message_ids = message_ids
+        self.cause = cause
+        super().__init__(f"Failed to write {len(message_ids)} messages for thread {thread_id}: {cause}")
+
+
+class _ThreadQueue:
+    """Pending rows and flusher state for one thread."""
+    __slots__ = ("rows", "wakeup", "task", "flush_requested", "error")
+
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.flush_requested = False
+        self.error: Optional[BaseException] = None
+
+
+class MessageWriter:
+    """Singleton write-behind writer for the messages table.
+
+    Rows for the same thread are inserted strictly in the order they were
+    enqueued. Timestamps are left to the database, like those of rows inserted
+    anywhere else, so messages are ordered by one clock; seq keeps the order
+    of rows that share a timestamp.
+    """
+
+    _instance: Optional['MessageWriter'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_batch_delay: float = DEFAULT_MAX_BATCH_DELAY):
+        """Initialize the writer once per process.
+
+        Args:
+            max_batch_size: Maximum number of rows per insert
+            max_batch_delay: Maximum time in seconds a row waits for a batch to fill
+        """
+        if self._initialized:
+            return
+        self.db = DBConnection()
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self._queues: Dict[str, _ThreadQueue] = {}
+        self.insert_count = 0
+        self.row_count = 0
+        self._initialized = True
+
+    def _get_queue(self, thread_id: str) -> _ThreadQueue:
+        queue = self._queues.get(thread_id)
+        if queue is None:
+            queue = _ThreadQueue()
+            self._queues[thread_id] = queue
+        return queue
+
+    def enqueue(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a row for insertion, assigning its message_id.
+
+        Args:
+            row: Row for the messages table; 'thread_id' is required. A given
+                 'created_at' is kept as is, for rows that are deliberately
+                 placed at a database timestamp read earlier (e.g. a summary).
+
+        Returns:
+            The row as it will be stored, including message_id
+        """
+        thread_id = row['thread_id']
+        queue = self._get_queue(thread_id)
+
+        stored_row = {
+            **row,
+            'message_id': row.get('message_id') or str(uuid.uuid4()),
+        }
+        queue.rows.append(stored_row)
+
+        if len(queue.rows) >= self.max_batch_size:
+            queue.wakeup.set()
+        self._start_drain(thread_id, queue)
+        return stored_row
+
+    def _start_drain(self, thread_id: str, queue: _ThreadQueue) -> None:
+        if queue.task is None:
+            queue.error = None
+            queue.task = asyncio.create_task(self._drain(thread_id, queue))
+
+    async def _drain(self, thread_id: str, queue: _ThreadQueue) -> None:
+        """Insert queued rows for a thread in order until the queue is empty."""
+        try:
+            while queue.rows:
+                if len(queue.rows) < self.max_batch_size and not queue.flush_requested:
+                    try:
+                        await asyncio.wait_for(queue.wakeup.wait(), timeout=self.max_batch_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                queue.wakeup.clear()
+
+                batch = queue.rows[:self.max_batch_size]
+                del queue.rows[:len(batch)]
+                try:
+                    await self._insert(thread_id, batch)
+                except BaseException as e:
+                    # Keep the rows, in order, for the next flush or enqueue to retry
+                    queue.rows[:0] = batch
+                    queue.error = e
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    break
+        finally:
+            queue.task = None
+            queue.flush_requested = False
+            if not queue.rows and self._queues.get(thread_id) is queue:
+                del self._queues[thread_id]
+
+    async def _insert(self, thread_id: str, batch: List[Dict[str, Any]]) -> None:
+        """Insert one batch, retrying with backoff until INSERT_RETRY_DEADLINE.
+
+        Raises:
+            Exception: The last insert error, once the deadline has passed
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + INSERT_RETRY_DEADLINE
+        delay = INSERT_RETRY_DELAY
+        while True:
+            try:
+                client = await self.db.client
+                # Columns a row leaves out, like created_at, take their database default
+                await client.table('messages').insert(batch, returning='minimal', default_to_null=False).execute()
+                self.insert_count += 1
+                self.row_count += len(batch)
+                logger.debug(f"Inserted batch of {len(batch)} messages for thread {thread_id}")
+                return
+            except Exception as e:
+                if loop.time() + delay > deadline:
+                    message_ids = [row['message_id'] for row in batch]
+                    logger.error(f"Failed to insert {len(batch)} messages for thread {thread_id}, keeping them queued: {message_ids}", exc_info=True)
+                    raise
+                logger.warning(f"Failed to insert {len(batch)} messages for thread {thread_id}, retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, INSERT_RETRY_MAX_DELAY)
+
+    async def flush(self, thread_id: Optional[str] = None) -> None:
+        """Wait until all queued rows are written.
+
+        Rows that failed earlier are retried first.
+
+        Args:
+            thread_id: Only flush this thread. Flushes every thread if None.
+
+        Raises:
+            MessageWriteError: If rows of a thread could not be written; they stay queued
+        """
+        thread_ids = [thread_id] if thread_id else list(self._queues.keys())
+        errors: List[MessageWriteError] = []
+        for tid in thread_ids:
+            queue = self._queues.get(tid)
+            if queue is not None and queue.rows:
+                self._start_drain(tid, queue)
+            while True:
+                queue = self._queues.get(tid)
+                if queue is None or queue.task is None:
+                    break
+                queue.flush_requested = True
+                queue.wakeup.set()
+                # Shield so a cancelled caller does not abort the in-flight insert
+                await asyncio.shield(queue.task)
+            if queue is not None and queue.rows and queue.error is not None:
+                errors.append(MessageWriteError(tid, [row['message_id'] for row in queue.rows], queue.error))
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise MessageWriteError(
+                ", ".join(e.thread_id for e in errors),
+                [message_id for e in errors for message_id in e.message_ids],
+                errors[0].cause
+            )
@@ -11,6 +11,7 @@ This module handles processing of LLM responses including:
 import json
 import asyncio
 import re
+import time
 import uuid
 from typing import List, Dict, Any, Optional, Tuple, AsyncGenerator, Callable, Union, Literal
 from dataclasses import dataclass
@@ -20,6 +21,9 @@ from litellm import completion_cost, token_counter
 
 from agentpress.tool import Tool, ToolResult
 from agentpress.tool_registry import ToolRegistry
+from agentpress.message_writer import MessageWriteError
+from agentpress.xml_tool_parser import StreamingXMLParser, XML_TAG_NAME_PATTERN, extract_xml_chunks
+from services.llm import PromptCacheStats
 from utils.logger import logger
 
 # Type alias for XML result adding strategy
@@ -81,17 +85,77 @@ class ProcessorConfig:
 class ResponseProcessor:
     """Processes LLM responses, extracting and executing tool calls."""
     
-    def __init__(self, tool_registry: ToolRegistry, add_message_callback: Callable):
+    def __init__(self, tool_registry: ToolRegistry, add_message_callback: Callable, flush_messages_callback: Optional[Callable] = None):
         """Initialize the ResponseProcessor.
         
         Args:
             tool_registry: Registry of available tools
             add_message_callback: Callback function to add messages to the thread.
                 MUST return the full saved message object (dict) or None.
+            flush_messages_callback: Optional async callback taking a thread_id that
+                waits until added messages are persisted. Called when a response finishes.
         """
         self.tool_registry = tool_registry
         self.add_message = add_message_callback
+        self.flush_messages = flush_messages_callback
+        self.prompt_cache_stats = PromptCacheStats()
+
+    def _record_prompt_cache_usage(self, usage: Any, llm_model: str) -> None:
+        """Add a response's token usage to the prompt cache stats of this run."""
+        try:
+            figures = self.prompt_cache_stats.record(usage)
+            logger.info(f"Prompt cache for {llm_model}: read {figures['cache_read_tokens']}, "
+                        f"wrote {figures['cache_write_tokens']} of {figures['prompt_tokens']} prompt tokens "
+                        f"(run hit rate {self.prompt_cache_stats.hit_rate:.1%})")
+        except Exception as e:
+            logger.warning(f"Failed to record prompt cache usage: {str(e)}")
+
+    async def _flush_messages(self, thread_id: str, thread_run_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Wait for write-behind persistence of the thread's messages, if configured.
+
+        Args:
+            thread_id: The thread whose messages to flush
+            thread_run_id: The current run, recorded in the metadata of the error status
+
+        Returns:
+            An unsaved error status message to yield if messages could not be persisted, else None
+        """
+        if not self.flush_messages:
+            return None
+        try:
+            await self.flush_messages(thread_id)
+            return None
+        except MessageWriteError as e:
+            logger.error(f"Messages of thread {thread_id} were not saved: {e.message_ids}")
+            message = f"{len(e.message_ids)} messages of this run could not be saved"
+            unsaved_message_ids = e.message_ids
+        except Exception as e:
+            logger.error(f"Error flushing messages for thread {thread_id}: {str(e)}", exc_info=True)
+            message = "Messages of this run could not be saved"
+            unsaved_message_ids = []
+        # Built locally rather than through add_message, which would queue behind the failed rows
+        timestamp = datetime.now(timezone.utc).isoformat()
+        return {
+            "message_id": None,
+            "thread_id": thread_id,
+            "type": "status",
+            "is_llm_message": False,
+            "content": json.dumps({"role": "system", "status_type": "error", "message": message}),
+            "metadata": json.dumps({"thread_run_id": thread_run_id, "unsaved_message_ids": unsaved_message_ids}),
+            "created_at": timestamp,
+            "updated_at": timestamp
+        }
         
+    async def _close_stream(self, llm_response: Any) -> None:
+        """Close an LLM response stream that may not have been read to the end."""
+        close = getattr(llm_response, "aclose", None)
+        if close is None:
+            return
+        try:
+            await close()
+        except Exception as e:
+            logger.warning(f"Error closing LLM response stream: {str(e)}")
+
     async def process_streaming_response(
         self,
         llm_response: AsyncGenerator,
@@ -114,7 +178,8 @@ class ResponseProcessor:
         """
         accumulated_content = ""
         tool_calls_buffer = {}
-        current_xml_content = ""
+        xml_parser = StreamingXMLParser(self.tool_registry.xml_tools.keys())
+        unprocessed_xml_chunks = [] # Complete chunks left over when the XML tool limit is hit
         xml_chunks_buffer = []
         pending_tool_executions = []
         yielded_tool_indices = set() # Stores indices of tools whose *status* has been yielded
@@ -124,6 +189,7 @@ class ResponseProcessor:
         last_assistant_message_object = None # Store the final saved assistant message object
         tool_result_message_objects = {} # tool_index -> full saved message object
         has_printed_thinking_prefix = False # Flag for printing thinking prefix only once
+        stream_usage = None # Usage reported by the provider, usually in the final chunk
 
         logger.info(f"Streaming Config: XML={config.xml_tool_calling}, Native={config.native_tool_calling}, "
                    f"Execute on stream={config.execute_on_stream}, Strategy={config.tool_execution_strategy}")
@@ -148,6 +214,9 @@ class ResponseProcessor:
             # --- End Start Events ---
 
             async for chunk in llm_response:
+                if getattr(chunk, 'usage', None):
+                    stream_usage = chunk.usage
+
                 if hasattr(chunk, 'choices') and chunk.choices and hasattr(chunk.choices[0], 'finish_reason') and chunk.choices[0].finish_reason:
                     finish_reason = chunk.choices[0].finish_reason
                     logger.debug(f"Detected finish_reason: {finish_reason}")
@@ -169,7 +238,6 @@ class ResponseProcessor:
                         chunk_content = delta.content
                         # print(chunk_content, end='', flush=True)
                         accumulated_content += chunk_content
-                        current_xml_content += chunk_content
 
                         if not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
                             # Yield ONLY content chunk (don't save)
@@ -186,9 +254,9 @@ class ResponseProcessor:
 
                         # --- Process XML Tool Calls (if enabled and limit not reached) ---
                         if config.xml_tool_calling and not (config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls):
-                            xml_chunks = self._extract_xml_chunks(current_xml_content)
-                            for xml_chunk in xml_chunks:
-                                current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
+                            # Each delta is consumed exactly once by the incremental parser
+                            xml_chunks = xml_parser.feed(chunk_content)
+                            for chunk_idx, xml_chunk in enumerate(xml_chunks):
                                 xml_chunks_buffer.append(xml_chunk)
                                 result = self._parse_xml_tool_call(xml_chunk)
                                 if result:
@@ -215,6 +283,7 @@ class ResponseProcessor:
                                     if config.max_xml_tool_calls > 0 and xml_tool_call_count >= config.max_xml_tool_calls:
                                         logger.debug(f"Reached XML tool call limit ({config.max_xml_tool_calls})")
                                         finish_reason = "xml_tool_limit_reached"
+                                        unprocessed_xml_chunks.extend(xml_chunks[chunk_idx + 1:])
                                         break # Stop processing more XML chunks in this delta
 
                     # --- Process Native Tool Call Chunks ---
@@ -290,6 +359,10 @@ class ResponseProcessor:
 
             # --- After Streaming Loop ---
 
+            # The loop may stop early at the XML tool limit; release the connection
+            # and the governor slot before the tools run
+            await self._close_stream(llm_response)
+
             # Wait for pending tool executions from streaming phase
             tool_results_buffer = [] # Stores (tool_call, result, tool_index, context)
             if pending_tool_executions:
@@ -413,9 +486,8 @@ class ResponseProcessor:
                  # Gather XML tool calls from buffer (up to limit)
                 parsed_xml_data = []
                 if config.xml_tool_calling:
-                    # Reparse remaining content just in case (should be empty if processed correctly)
-                    xml_chunks = self._extract_xml_chunks(current_xml_content)
-                    xml_chunks_buffer.extend(xml_chunks)
+                    # Add chunks completed in the same delta after the limit was hit
+                    xml_chunks_buffer.extend(unprocessed_xml_chunks)
                     # Process only chunks not already handled in the stream loop
                     remaining_limit = config.max_xml_tool_calls - xml_tool_call_count if config.max_xml_tool_calls > 0 else len(xml_chunks_buffer)
                     xml_chunks_to_process = xml_chunks_buffer[:remaining_limit] # Ensure limit is respected
@@ -517,6 +589,9 @@ class ResponseProcessor:
                              logger.error(f"Failed to save tool result for index {tool_idx}, not yielding result message.")
                              # Optionally yield error status for saving failure?
 
+            if stream_usage:
+                self._record_prompt_cache_usage(stream_usage, llm_model)
+
             # --- Calculate and Store Cost ---
             if last_assistant_message_object: # Only calculate if assistant message was saved
                 try:
@@ -562,12 +637,16 @@ class ResponseProcessor:
             if err_msg_obj: yield err_msg_obj # Yield the saved error message
 
         finally:
+            await self._close_stream(llm_response)
             # Save and Yield the final thread_run_end status
             end_content = {"status_type": "thread_run_end"}
             end_msg_obj = await self.add_message(
                 thread_id=thread_id, type="status", content=end_content, 
                 is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
             )
+            # Everything from this run must be persisted before the run is reported as ended
+            flush_error_msg = await self._flush_messages(thread_id, thread_run_id if 'thread_run_id' in locals() else None)
+            if flush_error_msg: yield flush_error_msg
             if end_msg_obj: yield end_msg_obj
 
     async def process_non_streaming_response(
@@ -667,6 +746,9 @@ class ResponseProcessor:
                  )
                  if err_msg_obj: yield err_msg_obj
 
+            if getattr(llm_response, 'usage', None):
+                self._record_prompt_cache_usage(llm_response.usage, llm_model)
+
             # --- Calculate and Store Cost ---
             if assistant_message_object: # Only calculate if assistant message was saved
                 try:
@@ -771,145 +853,20 @@ class ResponseProcessor:
                 thread_id=thread_id, type="status", content=end_content, 
                 is_llm_message=False, metadata={"thread_run_id": thread_run_id if 'thread_run_id' in locals() else None}
             )
+            # Everything from this run must be persisted before the run is reported as ended
+            flush_error_msg = await self._flush_messages(thread_id, thread_run_id if 'thread_run_id' in locals() else None)
+            if flush_error_msg: yield flush_error_msg
             if end_msg_obj: yield end_msg_obj
 
     # XML parsing methods
-    def _extract_tag_content(self, xml_chunk: str, tag_name: str) -> Tuple[Optional[str], Optional[str]]:
-        """Extract content between opening and closing tags, handling nested tags."""
-        start_tag = f'<{tag_name}'
-        end_tag = f'</{tag_name}>'
-        
-        try:
-            # Find start tag position
-            start_pos = xml_chunk.find(start_tag)
-            if start_pos == -1:
-                return None, xml_chunk
-                
-            # Find end of opening tag
-            tag_end = xml_chunk.find('>', start_pos)
-            if tag_end == -1:
-                return None, xml_chunk
-                
-            # Find matching closing tag
-            content_start = tag_end + 1
-            nesting_level = 1
-            pos = content_start
-            
-            while nesting_level > 0 and pos < len(xml_chunk):
-                next_start = xml_chunk.find(start_tag, pos)
-                next_end = xml_chunk.find(end_tag, pos)
-                
-                if next_end == -1:
-                    return None, xml_chunk
-                    
-                if next_start != -1 and next_start < next_end:
-                    nesting_level += 1
-                    pos = next_start + len(start_tag)
-                else:
-                    nesting_level -= 1
-                    if nesting_level == 0:
-                        content = xml_chunk[content_start:next_end]
-                        remaining = xml_chunk[next_end + len(end_tag):]
-                        return content, remaining
-                    else:
-                        pos = next_end + len(end_tag)
-            
-            return None, xml_chunk
-            
-        except Exception as e:
-            logger.error(f"Error extracting tag content: {e}")
-            return None, xml_chunk
-
-    def _extract_attribute(self, opening_tag: str, attr_name: str) -> Optional[str]:
-        """Extract attribute value from opening tag."""
-        try:
-            # Handle both single and double quotes with raw strings
-            patterns = [
-                fr'{attr_name}="([^"]*)"',  # Double quotes
-                fr"{attr_name}='([^']*)'",  # Single quotes
-                fr'{attr_name}=([^\s/>;]+)'  # No quotes - fixed escape sequence
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, opening_tag)
-                if match:
-                    value = match.group(1)
-                    # Unescape common XML entities
-                    value = value.replace('&quot;', '"').replace('&apos;', "'")
-                    value = value.replace('&lt;', '<').replace('&gt;', '>')
-                    value = value.replace('&amp;', '&')
-                    return value
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error extracting attribute: {e}")
-            return None
-
     def _extract_xml_chunks(self, content: str) -> List[str]:
-        """Extract complete XML chunks using start and end pattern matching."""
-        chunks = []
-        pos = 0
-        
+        """Extract complete XML chunks in a single pass over the content."""
         try:
-            while pos < len(content):
-                # Find the next tool tag
-                next_tag_start = -1
-                current_tag = None
-                
-                # Find the earliest occurrence of any registered tag
-                for tag_name in self.tool_registry.xml_tools.keys():
-                    start_pattern = f'<{tag_name}'
-                    tag_pos = content.find(start_pattern, pos)
-                    
-                    if tag_pos != -1 and (next_tag_start == -1 or tag_pos < next_tag_start):
-                        next_tag_start = tag_pos
-                        current_tag = tag_name
-                
-                if next_tag_start == -1 or not current_tag:
-                    break
-                
-                # Find the matching end tag
-                end_pattern = f'</{current_tag}>'
-                tag_stack = []
-                chunk_start = next_tag_start
-                current_pos = next_tag_start
-                
-                while current_pos < len(content):
-                    # Look for next start or end tag of the same type
-                    next_start = content.find(f'<{current_tag}', current_pos + 1)
-                    next_end = content.find(end_pattern, current_pos)
-                    
-                    if next_end == -1:  # No closing tag found
-                        break
-                    
-                    if next_start != -1 and next_start < next_end:
-                        # Found nested start tag
-                        tag_stack.append(next_start)
-                        current_pos = next_start + 1
-                    else:
-                        # Found end tag
-                        if not tag_stack:  # This is our matching end tag
-                            chunk_end = next_end + len(end_pattern)
-                            chunk = content[chunk_start:chunk_end]
-                            chunks.append(chunk)
-                            pos = chunk_end
-                            break
-                        else:
-                            # Pop nested tag
-                            tag_stack.pop()
-                            current_pos = next_end + 1
-                
-                if current_pos >= len(content):  # Reached end without finding closing tag
-                    break
-                
-                pos = max(pos + 1, current_pos)
-        
+            return extract_xml_chunks(content, self.tool_registry.xml_tools.keys())
         except Exception as e:
             logger.error(f"Error extracting XML chunks: {e}")
             logger.error(f"Content was: {content}")
-        
-        return chunks
+            return []
 
     def _parse_xml_tool_call(self, xml_chunk: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
         """Parse XML chunk into tool call format and return parsing details.
@@ -921,7 +878,7 @@ class ResponseProcessor:
         """
         try:
             # Extract tag name and validate
-            tag_match = re.match(r'<([^\s>]+)', xml_chunk)
+            tag_match = XML_TAG_NAME_PATTERN.match(xml_chunk)
             if not tag_match:
                 logger.error(f"No tag found in XML chunk: {xml_chunk}")
                 return None
@@ -930,7 +887,7 @@ class ResponseProcessor:
             xml_tag_name = tag_match.group(1)
             logger.info(f"Found XML tag: {xml_tag_name}")
             
-            # Get tool info and schema from registry
+            # Get tool info and precompiled extraction plan from registry
             tool_info = self.tool_registry.get_xml_tool(xml_tag_name)
             if not tool_info or not tool_info['schema'].xml_schema:
                 logger.error(f"No tool or schema found for tag: {xml_tag_name}")
@@ -938,63 +895,14 @@ class ResponseProcessor:
             
             # This is the actual function name to call (e.g., "create_file")
             function_name = tool_info['method']
+            plan = tool_info['plan']
             
-            schema = tool_info['schema'].xml_schema
-            params = {}
-            remaining_chunk = xml_chunk
-            
-            # --- Store detailed parsing info ---
-            parsing_details = {
-                "attributes": {},
-                "elements": {},
-                "text_content": None,
-                "root_content": None,
-                "raw_chunk": xml_chunk # Store the original chunk for reference
-            }
-            # ---
-            
-            # Process each mapping
-            for mapping in schema.mappings:
-                try:
-                    if mapping.node_type == "attribute":
-                        # Extract attribute from opening tag
-                        opening_tag = remaining_chunk.split('>', 1)[0]
-                        value = self._extract_attribute(opening_tag, mapping.param_name)
-                        if value is not None:
-                            params[mapping.param_name] = value
-                            parsing_details["attributes"][mapping.param_name] = value # Store raw attribute
-                            logger.info(f"Found attribute {mapping.param_name}: {value}")
-                
-                    elif mapping.node_type == "element":
-                        # Extract element content
-                        content, remaining_chunk = self._extract_tag_content(remaining_chunk, mapping.path)
-                        if content is not None:
-                            params[mapping.param_name] = content.strip()
-                            parsing_details["elements"][mapping.param_name] = content.strip() # Store raw element content
-                            logger.info(f"Found element {mapping.param_name}: {content.strip()}")
-                
-                    elif mapping.node_type == "text":
-                        # Extract text content
-                        content, _ = self._extract_tag_content(remaining_chunk, xml_tag_name)
-                        if content is not None:
-                            params[mapping.param_name] = content.strip()
-                            parsing_details["text_content"] = content.strip() # Store raw text content
-                            logger.info(f"Found text content for {mapping.param_name}: {content.strip()}")
-                
-                    elif mapping.node_type == "content":
-                        # Extract root content
-                        content, _ = self._extract_tag_content(remaining_chunk, xml_tag_name)
-                        if content is not None:
-                            params[mapping.param_name] = content.strip()
-                            parsing_details["root_content"] = content.strip() # Store raw root content
-                            logger.info(f"Found root content for {mapping.param_name}")
-                
-                except Exception as e:
-                    logger.error(f"Error processing mapping {mapping}: {e}")
-                    continue
+            # Run the plan in a single pass over the chunk
+            params, parsing_details = plan.extract(xml_chunk)
+            logger.debug(f"Extracted parameters for {xml_tag_name}: {list(params.keys())}")
             
             # Validate required parameters
-            missing = [mapping.param_name for mapping in schema.mappings if mapping.required and mapping.param_name not in params]
+            missing = plan.missing_params(params)
             if missing:
                 logger.error(f"Missing required parameters: {missing}")
                 logger.error(f"Current params: {params}")
@@ -1056,17 +964,28 @@ class ResponseProcessor:
                 except json.JSONDecodeError:
                     arguments = {"text": arguments}
             
-            # Get available functions from tool registry
-            available_functions = self.tool_registry.get_available_functions()
-            
-            # Look up the function by name
-            tool_fn = available_functions.get(function_name)
+            # Look up the function in the registry's dispatch table
+            tool_fn = self.tool_registry.get_function(function_name)
             if not tool_fn:
                 logger.error(f"Tool function '{function_name}' not found in registry")
                 return ToolResult(success=False, output=f"Tool function '{function_name}' not found")
             
+            arguments, error = tool_fn.prepare_arguments(arguments)
+            if error:
+                logger.error(error)
+                return ToolResult(success=False, output=error)
+            
             logger.debug(f"Found tool function for '{function_name}', executing...")
-            result = await tool_fn(**arguments)
+            start_time = time.perf_counter()
+            success = False
+            try:
+                if tool_fn.is_async:
+                    result = await tool_fn.function(**arguments)
+                else:
+                    result = tool_fn.function(**arguments)
+                success = bool(getattr(result, 'success', True))
+            finally:
+                tool_fn.stats.record(time.perf_counter() - start_time, success)
             logger.info(f"Tool execution complete: {function_name} -> {result}")
             return result
         except Exception as e:
@@ -11,11 +11,14 @@ This module provides comprehensive conversation management, including:
 """
 
 import json
-from typing import List, Dict, Any, Optional, Type, Union, AsyncGenerator, Literal
+from typing import List, Dict, Any, Optional, Tuple, Type, Union, AsyncGenerator, Literal
 from services.llm import make_llm_api_call
 from agentpress.tool import Tool
 from agentpress.tool_registry import ToolRegistry
 from agentpress.context_manager import ContextManager
+from agentpress.message_writer import MessageWriter
+from agentpress.message_cache import MessageCache
+from agentpress.token_ledger import TokenLedger
 from agentpress.response_processor import (
     ResponseProcessor, 
     ProcessorConfig    
@@ -39,10 +42,14 @@ class ThreadManager:
     
         """
         self.db = DBConnection()
+        self.message_writer = MessageWriter()
+        self.message_cache = MessageCache()
+        self.token_ledger = TokenLedger()
         self.tool_registry = ToolRegistry()
         self.response_processor = ResponseProcessor(
             tool_registry=self.tool_registry,
-            add_message_callback=self.add_message
+            add_message_callback=self.add_message,
+            flush_messages_callback=self.flush_messages
         )
         self.context_manager = ContextManager()
 
@@ -56,9 +63,15 @@ class ThreadManager:
         type: str, 
         content: Union[Dict[str, Any], List[Any], str], 
         is_llm_message: bool = False,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        created_at: Optional[str] = None
     ):
-        """Add a message to the thread in the database.
+        """Add a message to the thread.
+
+        The message is persisted write-behind: its ID and timestamps are
+        generated here and the full message object is returned immediately,
+        while the insert is batched with other messages of the same thread.
+        Use flush_messages to wait until the messages are in the database.
 
         Args:
             thread_id: The ID of the thread to add the message to.
@@ -69,38 +82,67 @@ class ThreadManager:
                             Defaults to False (user message).
             metadata: Optional dictionary for additional message metadata.
                       Defaults to None, stored as an empty JSONB object if None.
+            created_at: Optional ISO timestamp to place the message earlier in the
+                        thread than messages already added (e.g. a summary).
+
+        Returns:
+            The message object as it will be stored, including 'message_id'.
         """
         logger.debug(f"Adding message of type '{type}' to thread {thread_id}")
-        client = await self.db.client
         
+        content_json = json.dumps(content) if isinstance(content, (dict, list)) else content
+
+        # Record the token count while the message is at hand, so later
+        # iterations and other processes do not have to count it again
+        if is_llm_message and isinstance(content, dict):
+            model = self.token_ledger.thread_model(thread_id)
+            if model:
+                try:
+                    token_count = self.token_ledger.count_message(model, content)
+                    metadata = {**(metadata or {}), 'token_counts': {model: token_count}}
+                except Exception as e:
+                    logger.warning(f"Failed to count tokens for message in thread {thread_id}: {str(e)}")
+
         # Prepare data for insertion
         data_to_insert = {
             'thread_id': thread_id,
             'type': type,
-            'content': json.dumps(content) if isinstance(content, (dict, list)) else content,
+            'content': content_json,
             'is_llm_message': is_llm_message,
             'metadata': json.dumps(metadata or {}), # Ensure metadata is always a JSON object
         }
+        if created_at:
+            data_to_insert['created_at'] = created_at
         
         try:
-            # Add returning='representation' to get the inserted row data including the id
-            result = await client.table('messages').insert(data_to_insert, returning='representation').execute()
-            logger.info(f"Successfully added message to thread {thread_id}")
-            
-            if result.data and len(result.data) > 0 and isinstance(result.data[0], dict) and 'message_id' in result.data[0]:
-                return result.data[0]
-            else:
-                logger.error(f"Insert operation failed or did not return expected data structure for thread {thread_id}. Result data: {result.data}")
-                return None
+            stored_message = self.message_writer.enqueue(data_to_insert)
+            if created_at:
+                # Not an append: the cached messages must be refetched
+                self.message_cache.invalidate(thread_id)
+            elif is_llm_message:
+                self.message_cache.append(thread_id, stored_message['content'], is_summary=type == 'summary')
+            return stored_message
         except Exception as e:
             logger.error(f"Failed to add message to thread {thread_id}: {str(e)}", exc_info=True)
             raise
 
+    async def flush_messages(self, thread_id: Optional[str] = None):
+        """Wait until all messages added for a thread are persisted.
+
+        Args:
+            thread_id: The ID of the thread to flush. Flushes all threads if None.
+
+        Raises:
+            MessageWriteError: If messages could not be persisted; they stay queued for the next flush
+        """
+        await self.message_writer.flush(thread_id)
+
     async def get_llm_messages(self, thread_id: str) -> List[Dict[str, Any]]:
         """Get all messages for a thread.
         
         This method uses the SQL function which handles context truncation
-        by considering summary messages.
+        by considering summary messages. Results are served from the
+        in-process MessageCache while the thread's message_version is unchanged.
         
         Args:
             thread_id: The ID of the thread to get messages for.
@@ -108,27 +150,33 @@ class ThreadManager:
         Returns:
             List of message objects.
         """
+        messages, _, _ = await self._get_llm_messages(thread_id)
+        return messages
+
+    async def _get_llm_messages(self, thread_id: str) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[str]]:
+        """Get all messages for a thread along with their message cache lineage.
+
+        Returns:
+            Tuple of (messages, lineage of the cache entry they were read from
+            or None if they bypassed the cache, database timestamp of the newest
+            LLM message read before the messages or None if unavailable)
+        """
         logger.debug(f"Getting messages for thread {thread_id}")
+        # Read our own writes: make sure queued messages are in the database
+        await self.flush_messages(thread_id)
         client = await self.db.client
         
         try:
-            result = await client.rpc('get_llm_formatted_messages', {'p_thread_id': thread_id}).execute()
-            
-            # Parse the returned data which might be stringified JSON
-            if not result.data:
-                return []
-                
-            # Return properly parsed JSON objects
-            messages = []
-            for item in result.data:
-                if isinstance(item, str):
-                    try:
-                        parsed_item = json.loads(item)
-                        messages.append(parsed_item)
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse message: {item}")
-                else:
-                    messages.append(item)
+            # Read the version before the messages so a concurrent write can only make the cache stale-low
+            version, last_message_at = await self._get_message_version(client, thread_id)
+            messages = self.message_cache.get(thread_id, version) if version is not None else None
+
+            if messages is None:
+                messages, message_texts = await self._fetch_llm_messages(client, thread_id)
+                if version is not None:
+                    self.message_cache.put(thread_id, message_texts, version)
+            # No await since the cache was read, so the entry is still the one read
+            lineage = self.message_cache.lineage(thread_id) if version is not None else None
 
             # Ensure tool_calls have properly formatted function arguments
             for message in messages:
@@ -139,11 +187,50 @@ class ThreadManager:
                             if 'arguments' in tool_call['function'] and not isinstance(tool_call['function']['arguments'], str):
                                 tool_call['function']['arguments'] = json.dumps(tool_call['function']['arguments'])
 
-            return messages
+            return messages, lineage, last_message_at
             
         except Exception as e:
             logger.error(f"Failed to get messages for thread {thread_id}: {str(e)}", exc_info=True)
-            return []
+            return [], None, None
+
+    async def _get_message_version(self, client, thread_id: str) -> Tuple[Optional[int], Optional[str]]:
+        """Read the thread's message_version and last_message_at, each None if unavailable."""
+        try:
+            result = await client.table('threads').select('message_version, last_message_at').eq('thread_id', thread_id).execute()
+            if result.data:
+                return result.data[0].get('message_version'), result.data[0].get('last_message_at')
+        except Exception as e:
+            logger.debug(f"Could not read message version for thread {thread_id}, bypassing message cache: {str(e)}")
+        return None, None
+
+    async def _fetch_llm_messages(self, client, thread_id: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Fetch LLM-formatted messages from the database.
+
+        Returns:
+            Tuple of (parsed messages, JSON text of each parsed message)
+        """
+        result = await client.rpc('get_llm_formatted_messages', {'p_thread_id': thread_id}).execute()
+        
+        # Parse the returned data which might be stringified JSON
+        if not result.data:
+            return [], []
+            
+        # Return properly parsed JSON objects
+        messages = []
+        message_texts = []
+        for item in result.data:
+            if isinstance(item, str):
+                try:
+                    parsed_item = json.loads(item)
+                    messages.append(parsed_item)
+                    message_texts.append(item)
+                except json.JSONDecodeError:
+                    logger.error(f"Failed to parse message: {item}")
+            else:
+                messages.append(item)
+                message_texts.append(json.dumps(item))
+
+        return messages, message_texts
 
     async def run_thread(
         self,
@@ -161,7 +248,8 @@ class ThreadManager:
         include_xml_examples: bool = False,
         enable_thinking: Optional[bool] = False,
         reasoning_effort: Optional[str] = 'low',
-        enable_context_manager: bool = True
+        enable_context_manager: bool = True,
+        account_id: Optional[str] = None
     ) -> Union[Dict[str, Any], AsyncGenerator]:
         """Run a conversation thread with LLM integration and tool execution.
         
@@ -182,6 +270,7 @@ class ThreadManager:
             enable_thinking: Whether to enable thinking before making a decision
             reasoning_effort: The effort level for reasoning
             enable_context_manager: Whether to enable automatic context summarization.
+            account_id: Account the run belongs to, used for fair queuing of LLM calls
             
         Returns:
             An async generator yielding response chunks or error dict
@@ -249,35 +338,37 @@ Here are the XML tools available with examples:
                 # Note: processor_config is now guaranteed to exist due to check above
                 
                 # 1. Get messages from thread for LLM call
-                messages = await self.get_llm_messages(thread_id)
+                # A summary started in this iteration is placed at compaction_boundary, the database
+                # time of the newest message fetched, so messages added later stay after it
+                messages, lineage, compaction_boundary = await self._get_llm_messages(thread_id)
                 
                 # 2. Check token count before proceeding
                 token_count = 0
                 try:
-                    from litellm import token_counter
-                    # Use the potentially modified working_system_prompt for token counting
-                    token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages) 
+                    # Use the potentially modified working_system_prompt for token counting;
+                    # the ledger only counts messages added since the previous iteration
+                    token_count = self.token_ledger.thread_token_count(thread_id, llm_model, working_system_prompt, messages, lineage)
                     token_threshold = self.context_manager.token_threshold
                     logger.info(f"Thread {thread_id} token count: {token_count}/{token_threshold} ({(token_count/token_threshold)*100:.1f}%)")
                     
-                    # if token_count >= token_threshold and enable_context_manager:
-                    #     logger.info(f"Thread token count ({token_count}) exceeds threshold ({token_threshold}), summarizing...")
-                    #     summarized = await self.context_manager.check_and_summarize_if_needed(
-                    #         thread_id=thread_id,
-                    #         add_message_callback=self.add_message,
-                    #         model=llm_model,
-                    #         force=True
-                    #     )
-                    #     if summarized:
-                    #         logger.info("Summarization complete, fetching updated messages with summary")
-                    #         messages = await self.get_llm_messages(thread_id)
-                    #         # Recount tokens after summarization, using the modified prompt
-                    #         new_token_count = token_counter(model=llm_model, messages=[working_system_prompt] + messages) 
-                    #         logger.info(f"After summarization: token count reduced from {token_count} to {new_token_count}")
-                    #     else:
-                    #         logger.warning("Summarization failed or wasn't needed - proceeding with original messages")
-                    # elif not enable_context_manager: 
-                    #     logger.info("Automatic summarization disabled. Skipping token count check and summarization.")
+                    if enable_context_manager:
+                        # Start a background summary at the soft threshold, swap in a finished one,
+                        # and only block on a pending one at the hard threshold
+                        self.context_manager.start_compaction_if_needed(
+                            thread_id, token_count, messages, compaction_boundary, llm_model
+                        )
+                        compacted = await self.context_manager.apply_compaction(
+                            thread_id=thread_id,
+                            add_message_callback=self.add_message,
+                            model=llm_model,
+                            wait=token_count >= token_threshold
+                        )
+                        if compacted:
+                            logger.info("Compaction applied, fetching updated messages with summary")
+                            messages, lineage, _ = await self._get_llm_messages(thread_id)
+                            new_token_count = self.token_ledger.thread_token_count(thread_id, llm_model, working_system_prompt, messages, lineage)
+                            logger.info(f"After compaction: token count reduced from {token_count} to {new_token_count}")
+                            token_count = new_token_count
 
                 except Exception as e:
                     logger.error(f"Error counting tokens or summarizing: {str(e)}")
@@ -292,9 +383,14 @@ Here are the XML tools available with examples:
                     if msg.get('role') == 'user':
                         last_user_index = i
                 
+                # Messages before the temporary message are identical across iterations
+                # and may be prompt-cached; the temporary message and anything after it may not
+                stable_prefix_len = None
+
                 # Insert temporary message before the last user message if it exists
                 if temp_msg and last_user_index >= 0:
                     prepared_messages.extend(messages[:last_user_index])
+                    stable_prefix_len = len(prepared_messages)
                     prepared_messages.append(temp_msg)
                     prepared_messages.extend(messages[last_user_index:])
                     logger.debug("Added temporary message before the last user message")
@@ -302,6 +398,7 @@ Here are the XML tools available with examples:
                     # If no user message or no temporary message, just add all messages
                     prepared_messages.extend(messages)
                     if temp_msg:
+                        stable_prefix_len = len(prepared_messages)
                         prepared_messages.append(temp_msg)
                         logger.debug("Added temporary message to the end of prepared messages")
 
@@ -323,7 +420,10 @@ Here are the XML tools available with examples:
                         tool_choice=tool_choice if processor_config.native_tool_calling else None,
                         stream=stream,
                         enable_thinking=enable_thinking,
-                        reasoning_effort=reasoning_effort
+                        reasoning_effort=reasoning_effort,
+                        stable_prefix_len=stable_prefix_len,
+                        estimated_tokens=token_count or None,
+                        account_id=account_id
                     )
                     logger.debug("Successfully received raw LLM API response stream/object")
 
@@ -0,0 +1,244 @@
+"""
+Incremental token accounting for AgentPress threads.
+
+Counting a whole thread with litellm.token_counter on every iteration costs
+time proportional to the full history plus the (large) system prompt. The
+ledger counts each message once per model and reuses the result:
+- Per-message counts are cached in memory, keyed by model and by message_id
+  or a digest of the message's canonical JSON, so a message counted when it
+  is added is found again when it comes back from the database
+- System prompt counts are cached per prompt digest
+- Thread totals are kept as a running sum. While the message cache lineage
+  of the thread is unchanged, only the messages appended since the previous
+  call are digested and counted; otherwise all digests are compared with
+  the previous call to find what changed
+
+Thread totals are assembled from per-message counts; for tokenizers that
+encode the concatenated conversation they can differ slightly from counting
+the whole conversation at once.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from litellm import token_counter
+
+from utils.logger import logger
+
+# Constants for cache bounds
+DEFAULT_MAX_MESSAGE_COUNTS = 100000  # Maximum number of cached per-message counts
+DEFAULT_MAX_THREADS = 1024           # Maximum number of threads with a running total
+
+
+def message_digest(message_json: str) -> str:
+    """Digest of a message's JSON text, used as its ledger key."""
+    return hashlib.blake2b(message_json.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def message_key(message: Any) -> str:
+    """Ledger key of a message: the digest of its canonical JSON.
+
+    Keys are sorted, so a message read back from a JSONB column gets the same
+    key as when it was added.
+    """
+    return message_digest(json.dumps(message, sort_keys=True))
+
+
+class _ThreadTally:
+    """Running token total of one thread for one model."""
+    __slots__ = ("model", "keys", "tokens", "message_tokens", "lineage")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.keys: List[str] = []
+        self.tokens: List[int] = []  # Token count of the message with the same position in keys
+        self.message_tokens = 0
+        self.lineage: Optional[int] = None  # Message cache lineage of the messages counted
+
+
+class TokenLedger:
+    """Singleton cache of token counts per message, system prompt and thread."""
+
+    _instance: Optional['TokenLedger'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, max_message_counts: int = DEFAULT_MAX_MESSAGE_COUNTS, max_threads: int = DEFAULT_MAX_THREADS):
+        """Initialize the ledger once per process.
+
+        Args:
+            max_message_counts: Maximum number of per-message counts kept in memory
+            max_threads: Maximum number of threads with a running total
+        """
+        if self._initialized:
+            return
+        self.max_message_counts = max_message_counts
+        self.max_threads = max_threads
+        self._counts: 'OrderedDict[Tuple[str, str], int]' = OrderedDict()
+        self._threads: 'OrderedDict[str, _ThreadTally]' = OrderedDict()
+        self._overheads: Dict[str, int] = {}
+        self.counted = 0
+        self.reused = 0
+        self._initialized = True
+
+    def count_message(self, model: str, message: Any, key: Optional[str] = None) -> int:
+        """Count the tokens of one message, reusing a cached count if present.
+
+        Args:
+            model: Model whose tokenizer is used
+            message: The LLM-formatted message
+            key: Stable key of the message (e.g. its message_id). Defaults to
+                 message_key(message).
+
+        Returns:
+            Token count of the message
+        """
+        if key is None:
+            key = message_key(message)
+        return self._count(model, key, message)
+
+    def record(self, model: str, key: str, token_count: int) -> None:
+        """Store a count obtained elsewhere, e.g. from message metadata."""
+        self._counts[(model, key)] = token_count
+        self._counts.move_to_end((model, key))
+        self._evict_counts()
+
+    def count_system_prompt(self, model: str, system_prompt: Dict[str, Any]) -> int:
+        """Count the tokens of a system prompt once per prompt digest."""
+        key = "system:" + message_digest(json.dumps(system_prompt))
+        return self._count(model, key, system_prompt)
+
+    def thread_token_count(
+        self,
+        thread_id: str,
+        model: str,
+        system_prompt: Optional[Dict[str, Any]],
+        messages: List[Dict[str, Any]],
+        lineage: Optional[int] = None
+    ) -> int:
+        """Token count of the system prompt plus the thread's messages.
+
+        If the messages come from the same message cache lineage as in the
+        previous call for this thread, the messages counted then are known to
+        be unchanged and only the ones appended since are digested. Otherwise
+        the digests of all messages are compared with the previous call: the
+        running total is kept for the longest unchanged prefix, and only the
+        messages after it are counted, from cached per-message counts where
+        possible.
+
+        Args:
+            thread_id: ID of the thread
+            model: Model whose tokenizer is used
+            system_prompt: System prompt sent with the messages, if any
+            messages: LLM-formatted messages of the thread, in order
+            lineage: Message cache lineage the messages were read from, if any
+
+        Returns:
+            Total token count
+        """
+        tally = self._threads.get(thread_id)
+        if tally is None or tally.model != model:
+            tally = _ThreadTally(model)
+            self._threads[thread_id] = tally
+        self._threads.move_to_end(thread_id)
+        self._evict_threads()
+
+        keys: List[str] = []
+        if lineage is not None and lineage == tally.lineage and len(messages) >= len(tally.keys):
+            unchanged = len(tally.keys)
+        else:
+            keys = [message_key(message) for message in messages[:len(tally.keys)]]
+            unchanged = 0
+            while unchanged < len(keys) and keys[unchanged] == tally.keys[unchanged]:
+                unchanged += 1
+            if unchanged < len(tally.keys):
+                logger.debug(f"Messages of thread {thread_id} changed from message {unchanged}, recounting from cached message counts")
+                tally.message_tokens -= sum(tally.tokens[unchanged:])
+                del tally.keys[unchanged:]
+                del tally.tokens[unchanged:]
+        tally.lineage = lineage
+
+        for position in range(unchanged, len(messages)):
+            message = messages[position]
+            # Digests taken for the comparison are not taken again
+            key = keys[position] if position < len(keys) else message_key(message)
+            token_count = self._count(model, key, message)
+            tally.keys.append(key)
+            tally.tokens.append(token_count)
+            tally.message_tokens += token_count
+
+        total = tally.message_tokens
+        counted_messages = len(tally.keys)
+        if system_prompt is not None:
+            total += self.count_system_prompt(model, system_prompt)
+            counted_messages += 1
+        # Each per-message count includes the fixed overhead of a request,
+        # which a count of the whole conversation includes only once
+        if counted_messages > 1:
+            total -= self.request_overhead(model) * (counted_messages - 1)
+        return total
+
+    def message_token_count(self, thread_id: str, model: str) -> Optional[int]:
+        """Token count of the thread's messages alone, as of the last thread_token_count call.
+
+        Returns:
+            The count, or None if the thread has no running total for the model
+        """
+        tally = self._threads.get(thread_id)
+        if tally is None or tally.model != model:
+            return None
+        total = tally.message_tokens
+        if len(tally.keys) > 1:
+            total -= self.request_overhead(model) * (len(tally.keys) - 1)
+        return total
+
+    def thread_model(self, thread_id: str) -> Optional[str]:
+        """Model of the last token count taken for a thread, if any."""
+        tally = self._threads.get(thread_id)
+        return tally.model if tally is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache occupancy and reuse counters."""
+        return {
+            "message_counts": len(self._counts),
+            "threads": len(self._threads),
+            "counted": self.counted,
+            "reused": self.reused,
+        }
+
+    def _count(self, model: str, key: str, message: Any) -> int:
+        cache_key = (model, key)
+        cached = self._counts.get(cache_key)
+        if cached is not None:
+            self._counts.move_to_end(cache_key)
+            self.reused += 1
+            return cached
+
+        token_count = token_counter(model=model, messages=[message])
+        self._counts[cache_key] = token_count
+        self.counted += 1
+        self._evict_counts()
+        return token_count
+
+    def request_overhead(self, model: str) -> int:
+        """Tokens token_counter adds once per request rather than per message."""
+        overhead = self._overheads.get(model)
+        if overhead is None:
+            probe = {"role": "user", "content": "ok"}
+            overhead = 2 * token_counter(model=model, messages=[probe]) - token_counter(model=model, messages=[probe, probe])
+            self._overheads[model] = overhead
+        return overhead
+
+    def _evict_counts(self) -> None:
+        while len(self._counts) > self.max_message_counts:
+            self._counts.popitem(last=False)
+
+    def _evict_threads(self) -> None:
+        while len(self._threads) > self.max_threads:
+            self._threads.popitem(last=False)
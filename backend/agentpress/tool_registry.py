@@ -1,7 +1,173 @@
-from typing import Dict, Type, Any, List, Optional, Callable
+import inspect
+import typing
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, Type, Any, List, Optional, Callable, Mapping, Tuple, Union
 from agentpress.tool import Tool, SchemaType, ToolSchema
+from agentpress.xml_tool_parser import XMLExtractionPlan
 from utils.logger import logger
 
+_TRUE_STRINGS = frozenset({"true", "1", "yes", "y", "on"})
+_FALSE_STRINGS = frozenset({"false", "0", "no", "n", "off"})
+
+
+def _coerce_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in _TRUE_STRINGS:
+        return True
+    if lowered in _FALSE_STRINGS:
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+
+# Converters for string arguments (XML attributes and content are always strings)
+_STRING_COERCIONS: Dict[Any, Callable[[str], Any]] = {
+    int: lambda value: int(value.strip()),
+    float: lambda value: float(value.strip()),
+    bool: _coerce_bool,
+}
+
+
+def _coercion_for(annotation: Any) -> Optional[Callable[[str], Any]]:
+    """Return the string converter for a parameter annotation, unwrapping Optional."""
+    if typing.get_origin(annotation) is Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) != 1:
+            return None
+        annotation = args[0]
+    return _STRING_COERCIONS.get(annotation)
+
+
+@dataclass
+class ToolInvocationStats:
+    """Invocation counters for a single tool function.
+
+    Attributes:
+        calls (int): Number of invocations
+        failures (int): Invocations that raised or returned success=False
+        total_seconds (float): Summed execution time
+        max_seconds (float): Slowest execution time
+    """
+    calls: int = 0
+    failures: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, duration: float, success: bool) -> None:
+        """Record one invocation."""
+        self.calls += 1
+        if not success:
+            self.failures += 1
+        self.total_seconds += duration
+        if duration > self.max_seconds:
+            self.max_seconds = duration
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the counters with the derived average latency."""
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "total_seconds": self.total_seconds,
+            "avg_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+            "max_seconds": self.max_seconds,
+        }
+
+
+@dataclass
+class ToolFunction:
+    """Dispatch table entry for a registered tool function.
+
+    Built once in ToolRegistry.register_tool so tool calls need no
+    attribute lookups or signature inspection at execution time.
+
+    Attributes:
+        name (str): Function name used in tool calls
+        function (Callable): Bound method on the tool instance
+        is_async (bool): Whether the function must be awaited
+        param_names (frozenset): Accepted keyword argument names
+        required_params (Tuple[str, ...]): Parameters without a default
+        accepts_var_kwargs (bool): Whether the function takes **kwargs
+        coercions (Dict[str, Callable]): String converters by parameter name
+        stats (ToolInvocationStats): Invocation counters
+    """
+    name: str
+    function: Callable
+    is_async: bool
+    param_names: frozenset
+    required_params: Tuple[str, ...]
+    accepts_var_kwargs: bool
+    coercions: Dict[str, Callable[[str], Any]]
+    stats: ToolInvocationStats = field(default_factory=ToolInvocationStats)
+
+    @classmethod
+    def from_callable(cls, name: str, function: Callable) -> "ToolFunction":
+        """Inspect a bound tool method and build its dispatch entry."""
+        signature = inspect.signature(function)
+        try:
+            hints = typing.get_type_hints(function)
+        except Exception:
+            hints = {}
+
+        param_names = []
+        required_params = []
+        accepts_var_kwargs = False
+        coercions = {}
+        for param in signature.parameters.values():
+            if param.kind == inspect.Parameter.VAR_KEYWORD:
+                accepts_var_kwargs = True
+                continue
+            if param.kind in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.POSITIONAL_ONLY):
+                continue
+            param_names.append(param.name)
+            if param.default is inspect.Parameter.empty:
+                required_params.append(param.name)
+            coercion = _coercion_for(hints.get(param.name, param.annotation))
+            if coercion:
+                coercions[param.name] = coercion
+
+        return cls(
+            name=name,
+            function=function,
+            is_async=inspect.iscoroutinefunction(function),
+            param_names=frozenset(param_names),
+            required_params=tuple(required_params),
+            accepts_var_kwargs=accepts_var_kwargs,
+            coercions=coercions,
+        )
+
+    def prepare_arguments(self, arguments: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Validate and coerce call arguments.
+
+        Args:
+            arguments: Keyword arguments from the parsed tool call
+
+        Returns:
+            Tuple of (arguments, error). Arguments is None if validation failed.
+        """
+        if not self.accepts_var_kwargs:
+            unexpected = [key for key in arguments if key not in self.param_names]
+            if unexpected:
+                return None, f"Unexpected arguments for '{self.name}': {', '.join(unexpected)}"
+        missing = [key for key in self.required_params if key not in arguments]
+        if missing:
+            return None, f"Missing required arguments for '{self.name}': {', '.join(missing)}"
+
+        if self.coercions:
+            coerced = None
+            for key, convert in self.coercions.items():
+                value = arguments.get(key)
+                if isinstance(value, str):
+                    try:
+                        converted = convert(value)
+                    except ValueError:
+                        continue  # Leave invalid values for the tool to report
+                    if coerced is None:
+                        coerced = dict(arguments)
+                    coerced[key] = converted
+            if coerced is not None:
+                return coerced, None
+        return arguments, None
+
 
 class ToolRegistry:
     """Registry for managing and accessing tools.
@@ -11,10 +177,15 @@ class ToolRegistry:
     
     Attributes:
         tools (Dict[str, Dict[str, Any]]): OpenAPI-style tools and schemas
-        xml_tools (Dict[str, Dict[str, Any]]): XML-style tools and schemas
+        xml_tools (Dict[str, Dict[str, Any]]): XML-style tools, schemas and
+            precompiled extraction plans
+        dispatch_table (Mapping[str, ToolFunction]): Read-only function lookup,
+            replaced only by register_tool
         
     Methods:
         register_tool: Register a tool with optional function filtering
+        get_function: Get the dispatch entry for a function name
+        get_tool_stats: Get per-function invocation counters
         get_tool: Get a specific tool by name
         get_xml_tool: Get a tool by XML tag name
         get_openapi_schemas: Get OpenAPI schemas for function calling
@@ -25,6 +196,7 @@ class ToolRegistry:
         """Initialize a new ToolRegistry instance."""
         self.tools = {}
         self.xml_tools = {}
+        self.dispatch_table: Mapping[str, ToolFunction] = MappingProxyType({})
         logger.debug("Initialized new ToolRegistry instance")
     
     def register_tool(self, tool_class: Type[Tool], function_names: Optional[List[str]] = None, **kwargs):
@@ -38,6 +210,8 @@ class ToolRegistry:
         Notes:
             - If function_names is None, all functions are registered
             - Handles both OpenAPI and XML schema registration
+            - XML schemas are compiled into extraction plans once, here
+            - The dispatch table is rebuilt here and nowhere else
         """
         logger.debug(f"Registering tool class: {tool_class.__name__}")
         tool_instance = tool_class(**kwargs)
@@ -47,9 +221,11 @@ class ToolRegistry:
         
         registered_openapi = 0
         registered_xml = 0
+        dispatch = dict(self.dispatch_table)
         
         for func_name, schema_list in schemas.items():
             if function_names is None or func_name in function_names:
+                dispatch[func_name] = ToolFunction.from_callable(func_name, getattr(tool_instance, func_name))
                 for schema in schema_list:
                     if schema.schema_type == SchemaType.OPENAPI:
                         self.tools[func_name] = {
@@ -63,11 +239,13 @@ class ToolRegistry:
                         self.xml_tools[schema.xml_schema.tag_name] = {
                             "instance": tool_instance,
                             "method": func_name,
-                            "schema": schema
+                            "schema": schema,
+                            "plan": XMLExtractionPlan(schema.xml_schema)
                         }
                         registered_xml += 1
                         logger.debug(f"Registered XML tag {schema.xml_schema.tag_name} -> {func_name} from {tool_class.__name__}")
         
+        self.dispatch_table = MappingProxyType(dispatch)
         logger.debug(f"Tool registration complete for {tool_class.__name__}: {registered_openapi} OpenAPI functions, {registered_xml} XML tags")
 
     def get_available_functions(self) -> Dict[str, Callable]:
@@ -76,24 +254,30 @@ class ToolRegistry:
         Returns:
             Dict mapping function names to their implementations
         """
-        available_functions = {}
+        return {name: entry.function for name, entry in self.dispatch_table.items()}
+
+    def get_function(self, function_name: str) -> Optional[ToolFunction]:
+        """Get the dispatch entry for a function.
         
-        # Get OpenAPI tool functions
-        for tool_name, tool_info in self.tools.items():
-            tool_instance = tool_info['instance']
-            function_name = tool_name
-            function = getattr(tool_instance, function_name)
-            available_functions[function_name] = function
-            
-        # Get XML tool functions
-        for tag_name, tool_info in self.xml_tools.items():
-            tool_instance = tool_info['instance']
-            method_name = tool_info['method']
-            function = getattr(tool_instance, method_name)
-            available_functions[method_name] = function
+        Args:
+            function_name: Name of the tool function
             
-        logger.debug(f"Retrieved {len(available_functions)} available functions")
-        return available_functions
+        Returns:
+            ToolFunction with the bound method and its metadata, or None
+        """
+        return self.dispatch_table.get(function_name)
+
+    def get_tool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get invocation counters for every function that has been called.
+        
+        Returns:
+            Dict mapping function names to calls, failures and latency stats
+        """
+        return {
+            name: entry.stats.as_dict()
+            for name, entry in self.dispatch_table.items()
+            if entry.stats.calls
+        }
 
     def get_tool(self, tool_name: str) -> Dict[str, Any]:
         """Get a specific tool by name.
@@ -116,7 +300,7 @@ class ToolRegistry:
             tag_name: XML tag name for the tool
             
         Returns:
-            Dict containing tool instance, method name, and schema
+            Dict containing tool instance, method name, schema and extraction plan
         """
         tool = self.xml_tools.get(tag_name, {})
         if not tool:
@@ -0,0 +1,346 @@
+"""
+XML tool call tokenizing and parsing for AgentPress.
+
+This module provides the hot-path pieces of XML tool calling:
+- A resumable tokenizer that detects complete XML tool call chunks
+  (e.g. ``<create-file ...>...</create-file>``) in streamed LLM output,
+  consuming every character of every delta exactly once
+- Precompiled extraction plans that turn a chunk into tool arguments
+  according to its XMLTagSchema in a single forward pass
+
+All tag patterns begin with ``<`` and never contain another ``<``, so the
+Aho-Corasick failure function for the tag trie always points back to the
+root. The scanner therefore jumps between ``<`` characters with ``str.find``
+and only walks the trie from those positions.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from agentpress.tool import XMLTagSchema
+
+# Characters that may follow a tag name inside an opening tag
+TAG_BOUNDARY_CHARS = frozenset(" \t\r\n>/")
+
+# Tag name at the start of an XML chunk
+XML_TAG_NAME_PATTERN = re.compile(r'<([^\s>]+)')
+
+# XML entities unescaped in attribute values
+XML_ENTITY_TABLE = {
+    "&quot;": '"',
+    "&apos;": "'",
+    "&lt;": "<",
+    "&gt;": ">",
+    "&amp;": "&",
+}
+_XML_ENTITY_PATTERN = re.compile("|".join(re.escape(entity) for entity in XML_ENTITY_TABLE))
+
+
+class _TrieNode:
+    """Node of the tag trie.
+
+    Attributes:
+        children (Dict[str, _TrieNode]): Outgoing edges keyed by character
+        open_tag (str, optional): Tag name if this node completes ``<tag``
+        close_tag (str, optional): Tag name if this node completes ``</tag>``
+    """
+    __slots__ = ("children", "open_tag", "close_tag")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.open_tag: Optional[str] = None
+        self.close_tag: Optional[str] = None
+
+
+def build_tag_trie(tag_names: Iterable[str]) -> _TrieNode:
+    """Build a trie matching ``<tag`` and ``</tag>`` for every tag name.
+
+    Args:
+        tag_names: XML tag names of the registered tools
+
+    Returns:
+        Root node of the trie
+    """
+    root = _TrieNode()
+    for tag_name in tag_names:
+        node = root
+        for char in f"<{tag_name}":
+            node = node.children.setdefault(char, _TrieNode())
+        node.open_tag = tag_name
+
+        node = root
+        for char in f"</{tag_name}>":
+            node = node.children.setdefault(char, _TrieNode())
+        node.close_tag = tag_name
+    return root
+
+
+class StreamingXMLParser:
+    """Stateful tokenizer emitting complete XML tool call chunks from a stream.
+
+    Text outside of tool calls is not retained. Once an opening tag is seen the
+    parser buffers the call until the matching closing tag arrives. The body of
+    an open call is opaque: only nested tags of the same name are counted, so
+    file contents that happen to contain other tool tags stay part of the call.
+
+    Methods:
+        feed: Consume a delta and return the chunks it completed
+        reset: Discard all state
+    """
+
+    def __init__(self, tag_names: Iterable[str]):
+        """Initialize the parser.
+
+        Args:
+            tag_names: XML tag names to detect (e.g. ``tool_registry.xml_tools.keys()``)
+        """
+        self._root = build_tag_trie(tag_names)
+        self.reset()
+
+    def reset(self) -> None:
+        """Discard any buffered text, partial matches and open calls."""
+        self._parts: List[str] = []
+        self._open_tag: Optional[str] = None
+        self._depth = 0
+        self._node: Optional[_TrieNode] = None
+
+    @property
+    def has_open_call(self) -> bool:
+        """Whether an opening tag has been seen without its closing tag."""
+        return self._open_tag is not None
+
+    def feed(self, text: str) -> List[str]:
+        """Consume the next delta of streamed content.
+
+        Args:
+            text: The newly received content
+
+        Returns:
+            List of complete XML chunks found in this delta, in stream order
+        """
+        completed: List[str] = []
+        parts = self._parts
+        root = self._root
+        i = 0
+        n = len(text)
+
+        while i < n:
+            node = self._node
+            if node is None:
+                # Not inside a tag match: skip straight to the next '<'
+                j = text.find("<", i)
+                if j == -1:
+                    j = n
+                if self._open_tag is not None and j > i:
+                    parts.append(text[i:j])
+                i = j
+                if i == n:
+                    break
+                node = root
+
+            char = text[i]
+            if node.open_tag is not None and char in TAG_BOUNDARY_CHARS:
+                # Completed "<tag" followed by whitespace, '>' or '/'
+                self._node = None
+                if self._open_tag is None:
+                    self._open_tag = node.open_tag
+                    self._depth = 1
+                elif node.open_tag == self._open_tag:
+                    self._depth += 1
+                continue  # The boundary character is scanned as plain text
+
+            child = node.children.get(char)
+            if child is None:
+                # Mismatch: the failure link of every node is the root, and the
+                # current character is re-scanned from there
+                self._node = None
+                if self._open_tag is None:
+                    parts.clear()
+                if node is root:
+                    i += 1
+                continue
+
+            parts.append(char)
+            i += 1
+            self._node = child
+            if child.close_tag is None:
+                continue
+
+            self._node = None
+            if child.close_tag == self._open_tag:
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.append("".join(parts))
+                    parts.clear()
+                    self._open_tag = None
+            elif self._open_tag is None:
+                # Stray closing tag outside of any call
+                parts.clear()
+
+        return completed
+
+
+def extract_xml_chunks(content: str, tag_names: Iterable[str]) -> List[str]:
+    """Extract complete XML tool call chunks from a full string in one pass.
+
+    Args:
+        content: Text to scan
+        tag_names: XML tag names to detect
+
+    Returns:
+        List of complete XML chunks
+    """
+    return StreamingXMLParser(tag_names).feed(content)
+
+
+def unescape_xml_entities(value: str) -> str:
+    """Unescape the common XML entities in a single pass."""
+    if "&" not in value:
+        return value
+    return _XML_ENTITY_PATTERN.sub(lambda match: XML_ENTITY_TABLE[match.group(0)], value)
+
+
+def _find_element(xml_chunk: str, start_tag: str, end_tag: str, pos: int) -> Tuple[Optional[str], int]:
+    """Find the content of the next element at or after pos, handling nesting.
+
+    Returns:
+        Tuple of (content or None, position after the closing tag or pos if not found)
+    """
+    start_pos = xml_chunk.find(start_tag, pos)
+    if start_pos == -1:
+        return None, pos
+    tag_end = xml_chunk.find('>', start_pos)
+    if tag_end == -1:
+        return None, pos
+
+    content_start = tag_end + 1
+    nesting_level = 1
+    scan = content_start
+    while True:
+        next_end = xml_chunk.find(end_tag, scan)
+        if next_end == -1:
+            return None, pos
+        next_start = xml_chunk.find(start_tag, scan, next_end)
+        if next_start != -1:
+            nesting_level += 1
+            scan = next_start + len(start_tag)
+            continue
+        nesting_level -= 1
+        if nesting_level == 0:
+            return xml_chunk[content_start:next_end], next_end + len(end_tag)
+        scan = next_end + len(end_tag)
+
+
+class XMLExtractionPlan:
+    """Precompiled argument extraction for one XMLTagSchema.
+
+    Built once per tool in ToolRegistry.register_tool. Attribute mappings get
+    a compiled regex, element mappings get their start/end tag strings, and
+    content/text mappings share one lookup of the root content. Running the
+    plan walks the chunk forward once, in mapping order.
+
+    Attributes:
+        tag_name (str): Root tag name of the tool
+        required (Tuple[str, ...]): Names of the required parameters
+
+    Methods:
+        extract: Extract parameters and parsing details from a chunk
+        missing_params: List required parameters absent from extracted params
+    """
+    __slots__ = ("tag_name", "required", "_steps", "_end_tag")
+
+    def __init__(self, xml_schema: "XMLTagSchema"):
+        """Compile the extraction plan.
+
+        Args:
+            xml_schema: The XML schema of the tool
+        """
+        self.tag_name = xml_schema.tag_name
+        self.required = tuple(m.param_name for m in xml_schema.mappings if m.required)
+        self._end_tag = f'</{xml_schema.tag_name}>'
+        self._steps: List[Tuple[str, str, Any]] = []
+
+        for mapping in xml_schema.mappings:
+            if mapping.node_type == "attribute":
+                name = re.escape(mapping.param_name)
+                matcher = re.compile(
+                    fr'(?<![\w-]){name}=(?:"([^"]*)"|\'([^\']*)\'|([^\s/>;]+))'
+                )
+            elif mapping.node_type == "element":
+                matcher = (f'<{mapping.path}', f'</{mapping.path}>')
+            elif mapping.node_type in ("text", "content"):
+                matcher = None
+            else:
+                continue
+            self._steps.append((mapping.node_type, mapping.param_name, matcher))
+
+    def _root_content(self, xml_chunk: str) -> Optional[str]:
+        """Content between the end of the opening tag and the final closing tag."""
+        tag_end = xml_chunk.find('>')
+        if tag_end == -1:
+            return None
+        end_pos = xml_chunk.rfind(self._end_tag)
+        if end_pos <= tag_end:
+            return None
+        return xml_chunk[tag_end + 1:end_pos]
+
+    def extract(self, xml_chunk: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Run the plan over an XML chunk.
+
+        Args:
+            xml_chunk: A complete XML tool call chunk
+
+        Returns:
+            Tuple of (params, parsing_details)
+            - params: Dict of extracted function arguments
+            - parsing_details: Dict with 'attributes', 'elements', 'text_content',
+              'root_content' and 'raw_chunk'
+        """
+        params: Dict[str, Any] = {}
+        parsing_details: Dict[str, Any] = {
+            "attributes": {},
+            "elements": {},
+            "text_content": None,
+            "root_content": None,
+            "raw_chunk": xml_chunk
+        }
+
+        opening_end = xml_chunk.find('>')
+        opening_tag = xml_chunk if opening_end == -1 else xml_chunk[:opening_end]
+        pos = 0
+        root_content = None
+        root_content_found = False
+
+        for node_type, param_name, matcher in self._steps:
+            if node_type == "attribute":
+                match = matcher.search(opening_tag)
+                if match:
+                    value = unescape_xml_entities(match.group(match.lastindex))
+                    params[param_name] = value
+                    parsing_details["attributes"][param_name] = value
+
+            elif node_type == "element":
+                start_tag, end_tag = matcher
+                content, pos = _find_element(xml_chunk, start_tag, end_tag, pos)
+                if content is not None:
+                    value = content.strip()
+                    params[param_name] = value
+                    parsing_details["elements"][param_name] = value
+
+            else:
+                if not root_content_found:
+                    root_content = self._root_content(xml_chunk)
+                    if root_content is not None:
+                        root_content = root_content.strip()
+                    root_content_found = True
+                if root_content is not None:
+                    params[param_name] = root_content
+                    key = "text_content" if node_type == "text" else "root_content"
+                    parsing_details[key] = root_content
+
+        return params, parsing_details
+
+    def missing_params(self, params: Dict[str, Any]) -> List[str]:
+        """Return the required parameters that were not extracted."""
+        return [name for name in self.required if name not in params]
@@ -17,6 +17,12 @@ from collections import OrderedDict
 from agent import api as agent_api
 from sandbox import api as sandbox_api
 from services import billing as billing_api
+from services import llm
+from sandbox import async_daytona
+from sandbox.browser_client import close_browser_clients
+from sandbox.pool import SandboxPool
+from sandbox.prewarm import SandboxPrewarmer
+from services.screenshot_store import ScreenshotStore
 
 # Load environment variables (these will be available through config)
 load_dotenv()
@@ -51,6 +57,9 @@ async def lifespan(app: FastAPI):
         # Initialize the sandbox API with shared resources
         sandbox_api.initialize(db)
 
+        # Fails at startup if screenshots would not be shared between hosts
+        ScreenshotStore()
+
         # Initialize Redis connection
         from services import redis
         try:
@@ -63,12 +72,21 @@ async def lifespan(app: FastAPI):
         # Start background tasks
         asyncio.create_task(agent_api.restore_running_agent_runs())
 
+        # Start filling the warm sandbox pool
+        SandboxPool().start()
+
         yield
 
         # Clean up agent resources
         logger.info("Cleaning up agent resources")
         await agent_api.cleanup()
 
+        # Release sandboxes still waiting in the warm pool to the next worker; needs Redis
+        try:
+            await SandboxPool().drain()
+        except Exception as e:
+            logger.error(f"Error draining sandbox pool: {e}")
+
         # Clean up Redis connection
         try:
             logger.info("Closing Redis connection")
@@ -77,6 +95,24 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"Error closing Redis connection: {e}")
 
+        # Persist any messages still queued by the write-behind writer
+        try:
+            await thread_manager.flush_messages()
+        except Exception as e:
+            logger.error(f"Error flushing queued messages: {e}")
+
+        # Close pooled LLM HTTP connections
+        try:
+            await llm.close_llm_http_clients()
+        except Exception as e:
+            logger.error(f"Error closing LLM HTTP clients: {e}")
+
+        # Close pooled browser API connections
+        await close_browser_clients()
+
+        # Stop the thread pool running Daytona SDK calls
+        async_daytona.shutdown_executor()
+
         # Clean up database connection
         logger.info("Disconnecting from database")
         await db.disconnect()
@@ -145,7 +181,9 @@ async def health_check():
     return {
         "status": "ok",
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "instance_id": instance_id
+        "instance_id": instance_id,
+        "sandbox_pool": SandboxPool().stats(),
+        "sandbox_prewarm": SandboxPrewarmer().stats()
     }
 
 if __name__ == "__main__":
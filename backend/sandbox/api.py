@@ -6,9 +6,10 @@ from fastapi.responses import Response, JSONResponse
 from pydantic import BaseModel
 
 from utils.logger import logger
-from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, get_optional_user_id
-from sandbox.sandbox import get_or_start_sandbox
+from utils.auth_utils import get_current_user_id_from_jwt, get_user_id_from_stream_auth, get_optional_user_id, verify_thread_access
+from sandbox.sandbox import get_or_start_sandbox, SandboxHandleCache
 from services.supabase import DBConnection
+from services.screenshot_store import ScreenshotStore, image_media_type, is_screenshot_key
 from agent.api import get_or_create_project_sandbox
 
 
@@ -85,14 +86,16 @@ async def get_sandbox_by_id_safely(client, sandbox_id: str):
     Raises:
         HTTPException: If the sandbox doesn't exist or can't be retrieved
     """
-    # Find the project that owns this sandbox
-    project_result = await client.table('projects').select('project_id').filter('sandbox->>id', 'eq', sandbox_id).execute()
-    
-    if not project_result.data or len(project_result.data) == 0:
-        logger.error(f"No project found for sandbox ID: {sandbox_id}")
-        raise HTTPException(status_code=404, detail="Sandbox not found - no project owns this sandbox ID")
-    
-    project_id = project_result.data[0]['project_id']
+    # Find the project that owns this sandbox, skipping the query if its handle is cached
+    project_id = SandboxHandleCache().project_for_sandbox(sandbox_id)
+    if project_id is None:
+        project_result = await client.table('projects').select('project_id').filter('sandbox->>id', 'eq', sandbox_id).execute()
+        
+        if not project_result.data or len(project_result.data) == 0:
+            logger.error(f"No project found for sandbox ID: {sandbox_id}")
+            raise HTTPException(status_code=404, detail="Sandbox not found - no project owns this sandbox ID")
+        
+        project_id = project_result.data[0]['project_id']
     logger.debug(f"Found project {project_id} for sandbox {sandbox_id}")
     
     try:
@@ -133,7 +136,7 @@ async def create_file(
         content = await file.read()
         
         # Create file using raw binary content
-        sandbox.fs.upload_file(path, content)
+        await sandbox.fs.upload_file(path, content)
         logger.info(f"File created at {path} in sandbox {sandbox_id}")
         
         return {"status": "success", "created": True, "path": path}
@@ -173,7 +176,7 @@ async def create_file_json(
             content = content.encode('utf-8')
         
         # Create file
-        sandbox.fs.upload_file(path, content)
+        await sandbox.fs.upload_file(path, content)
         logger.info(f"File created at {path} in sandbox {sandbox_id}")
         
         return {"status": "success", "created": True, "path": path}
@@ -200,7 +203,7 @@ async def list_files(
         sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
         
         # List files
-        files = sandbox.fs.list_files(path)
+        files = await sandbox.fs.list_files(path)
         result = []
         
         for file in files:
@@ -242,7 +245,7 @@ async def read_file(
         sandbox = await get_sandbox_by_id_safely(client, sandbox_id)
         
         # Read file
-        content = sandbox.fs.download_file(path)
+        content = await sandbox.fs.download_file(path)
         
         # Return a Response object with the content directly
         filename = os.path.basename(path)
@@ -309,3 +312,33 @@ async def ensure_project_sandbox_active(
     except Exception as e:
         logger.error(f"Error ensuring sandbox is active for project {project_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/threads/{thread_id}/screenshots/{screenshot_key}")
+async def get_screenshot(
+    thread_id: str,
+    screenshot_key: str,
+    user_id: Optional[str] = Depends(get_optional_user_id)
+):
+    """
+    Serve a browser screenshot of a thread.
+
+    The user needs access to the thread, and the screenshot must be referenced
+    by one of the thread's browser_state messages.
+    """
+    if not is_screenshot_key(screenshot_key):
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+
+    client = await db.client
+    await verify_thread_access(client, thread_id, user_id)
+
+    # Content is stored as a JSON string, so the reference is matched in the text
+    messages_result = await client.table('messages').select('content').eq('thread_id', thread_id).eq('type', 'browser_state').execute()
+    if not any(screenshot_key in str(message['content']) for message in messages_result.data or []):
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+
+    data = await ScreenshotStore().get(screenshot_key)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+
+    # Content-addressed, so the image under a key never changes
+    return Response(content=data, media_type=image_media_type(data), headers={"Cache-Control": "private, max-age=31536000, immutable"})
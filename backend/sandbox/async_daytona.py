@@ -0,0 +1,217 @@
+"""
+Async facade over the synchronous Daytona SDK.
+
+Every Daytona SDK call is a blocking HTTP request, and shell commands block
+for as long as the command runs. Calling the SDK directly from async code
+freezes the event loop, and with it every other agent run and SSE stream of
+the worker. This module runs those calls on a bounded thread pool instead:
+- AsyncDaytona, AsyncSandbox, AsyncFileSystem and AsyncProcess mirror the
+  SDK methods used by the backend as coroutines
+- Commands in the same session and writes to the same path of a sandbox are
+  serialized, since tools may run in parallel
+- The underlying SDK objects remain available as `.sync` for code that
+  needs attributes rather than calls
+- A sandbox given a `recover` callback (see SandboxHandleCache) has it called
+  when a filesystem, process or preview call fails; if the sandbox turns out
+  to have been stopped and is restarted, the call is retried once
+"""
+
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from daytona_sdk import Daytona, CreateSandboxParams, Sandbox, SessionExecuteRequest
+
+from utils.config import config
+from utils.logger import logger
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Locks serializing operations on the same sandbox resource, keyed by
+# (sandbox_id, resource); a lock is dropped once nobody holds or waits for it
+_locks: 'weakref.WeakValueDictionary[tuple, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the thread pool that runs Daytona SDK calls."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=config.SANDBOX_EXECUTOR_WORKERS, thread_name_prefix="daytona")
+        logger.debug(f"Created Daytona executor with {config.SANDBOX_EXECUTOR_WORKERS} workers")
+    return _executor
+
+
+async def run_sync(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking Daytona SDK call on the executor and wait for its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executor() -> None:
+    """Shut down the executor without waiting for running calls."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _lock_for(sandbox_id: str, resource: str) -> asyncio.Lock:
+    key = (sandbox_id, resource)
+    lock = _locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[key] = lock
+    return lock
+
+
+async def _run_serialized(sandbox_id: str, resource: str, func: Callable[..., T], *args, **kwargs) -> T:
+    async with _lock_for(sandbox_id, resource):
+        return await run_sync(func, *args, **kwargs)
+
+
+async def _call(owner: Optional['AsyncSandbox'], operation: Callable[[], Awaitable[T]]) -> T:
+    """Run a call of a sandbox's filesystem or process, recovering the sandbox if it belongs to one."""
+    if owner is None:
+        return await operation()
+    return await owner._call(operation)
+
+
+class AsyncFileSystem:
+    """Coroutine versions of the sandbox filesystem operations."""
+
+    def __init__(self, sandbox: Sandbox, owner: Optional['AsyncSandbox'] = None):
+        self.sync = sandbox.fs
+        self._sandbox_id = sandbox.id
+        self._owner = owner
+
+    # Calls look up self.sync when they run, so a retry uses the restarted sandbox
+
+    async def upload_file(self, path: str, content: bytes) -> None:
+        await _call(self._owner, lambda: _run_serialized(self._sandbox_id, f"path:{path}", self.sync.upload_file, path, content))
+
+    async def download_file(self, path: str) -> bytes:
+        return await _call(self._owner, lambda: run_sync(self.sync.download_file, path))
+
+    async def list_files(self, path: str) -> List[Any]:
+        return await _call(self._owner, lambda: run_sync(self.sync.list_files, path))
+
+    async def get_file_info(self, path: str) -> Any:
+        return await _call(self._owner, lambda: run_sync(self.sync.get_file_info, path))
+
+    async def create_folder(self, path: str, mode: str) -> None:
+        await _call(self._owner, lambda: _run_serialized(self._sandbox_id, f"path:{path}", self.sync.create_folder, path, mode))
+
+    async def set_file_permissions(self, path: str, mode: str) -> None:
+        await _call(self._owner, lambda: _run_serialized(self._sandbox_id, f"path:{path}", self.sync.set_file_permissions, path, mode=mode))
+
+    async def delete_file(self, path: str) -> None:
+        await _call(self._owner, lambda: _run_serialized(self._sandbox_id, f"path:{path}", self.sync.delete_file, path))
+
+
+class AsyncProcess:
+    """Coroutine versions of the sandbox process and session operations."""
+
+    def __init__(self, sandbox: Sandbox, owner: Optional['AsyncSandbox'] = None):
+        self.sync = sandbox.process
+        self._sandbox_id = sandbox.id
+        self._owner = owner
+
+    async def exec(self, command: str, cwd: Optional[str] = None, timeout: Optional[int] = None) -> Any:
+        return await _call(self._owner, lambda: run_sync(self.sync.exec, command, cwd=cwd, timeout=timeout))
+
+    async def create_session(self, session_id: str) -> None:
+        await _call(self._owner, lambda: _run_serialized(self._sandbox_id, f"session:{session_id}", self.sync.create_session, session_id))
+
+    async def delete_session(self, session_id: str) -> None:
+        await _call(self._owner, lambda: _run_serialized(self._sandbox_id, f"session:{session_id}", self.sync.delete_session, session_id))
+
+    async def execute_session_command(self, session_id: str, req: SessionExecuteRequest, timeout: Optional[int] = None) -> Any:
+        # Commands of one session share its shell state and must not interleave
+        return await _call(self._owner, lambda: _run_serialized(
+            self._sandbox_id, f"session:{session_id}",
+            self.sync.execute_session_command, session_id, req, timeout=timeout
+        ))
+
+    async def get_session_command_logs(self, session_id: str, command_id: str) -> str:
+        return await _call(self._owner, lambda: run_sync(self.sync.get_session_command_logs, session_id, command_id))
+
+
+class AsyncSandbox:
+    """Async wrapper of a Daytona Sandbox."""
+
+    def __init__(self, sandbox: Sandbox):
+        self.sync = sandbox
+        self.fs = AsyncFileSystem(sandbox, self)
+        self.process = AsyncProcess(sandbox, self)
+        # Called with the start time of a failed call; returns the restarted
+        # sandbox if it had been stopped, None if the failure has another cause
+        self.recover: Optional[Callable[[float], Awaitable[Optional['AsyncSandbox']]]] = None
+
+    @property
+    def id(self) -> str:
+        return self.sync.id
+
+    @property
+    def instance(self) -> Any:
+        return self.sync.instance
+
+    async def get_preview_link(self, port: int) -> Any:
+        return await self._call(lambda: run_sync(self.sync.get_preview_link, port))
+
+    async def _call(self, operation: Callable[[], Awaitable[T]]) -> T:
+        """Run an operation, retrying it once if the sandbox was stopped and got restarted."""
+        started = time.monotonic()
+        try:
+            return await operation()
+        except Exception as e:
+            if self.recover is None:
+                raise
+            try:
+                restarted = await self.recover(started)
+            except Exception as recover_error:
+                logger.warning(f"Could not check the state of sandbox {self.id}: {str(recover_error)}")
+                raise e
+            if restarted is None:
+                raise
+            logger.info(f"Retrying operation on restarted sandbox {self.id} after: {str(e)}")
+            self._use(restarted)
+        return await operation()
+
+    def _use(self, other: 'AsyncSandbox') -> None:
+        """Switch to the SDK objects of another handle of the same sandbox."""
+        self.sync = other.sync
+        self.fs.sync = other.sync.fs
+        self.process.sync = other.sync.process
+
+    async def set_labels(self, labels: Dict[str, str]) -> Dict[str, str]:
+        return await _run_serialized(self.id, "lifecycle", self.sync.set_labels, labels)
+
+    async def set_autostop_interval(self, interval: int) -> None:
+        await _run_serialized(self.id, "lifecycle", self.sync.set_autostop_interval, interval)
+
+
+class AsyncDaytona:
+    """Async wrapper of the Daytona client."""
+
+    def __init__(self, daytona: Daytona):
+        self.sync = daytona
+
+    async def get_current_sandbox(self, sandbox_id: str) -> AsyncSandbox:
+        return AsyncSandbox(await run_sync(self.sync.get_current_sandbox, sandbox_id))
+
+    async def list(self) -> List[AsyncSandbox]:
+        return [AsyncSandbox(sandbox) for sandbox in await run_sync(self.sync.list)]
+
+    async def create(self, params: CreateSandboxParams) -> AsyncSandbox:
+        return AsyncSandbox(await run_sync(self.sync.create, params))
+
+    async def start(self, sandbox: AsyncSandbox) -> None:
+        await _run_serialized(sandbox.id, "lifecycle", self.sync.start, sandbox.sync)
+
+    async def remove(self, sandbox: AsyncSandbox) -> None:
+        await _run_serialized(sandbox.id, "lifecycle", self.sync.remove, sandbox.sync)
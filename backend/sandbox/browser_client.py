@@ -0,0 +1,148 @@
+"""
+HTTP client for the browser automation API running inside a sandbox.
+
+The browser API (sandbox/docker/browser_api.py) listens on port 8002 of the
+sandbox. Calling it with curl through process.exec spawned a shell and a curl
+process per action and sent the whole response, screenshot included, through
+the exec API's stdout. This module calls it directly over HTTP instead:
+- The sandbox's preview link for the port is resolved once per sandbox and
+  its token sent as the preview token header
+- One keep-alive client per event loop is shared by all sandboxes
+- Response bodies are streamed with a size limit and separate connect and
+  read timeouts
+
+BrowserAPIUnavailable is raised only when the request cannot have reached the
+browser API (no preview link, connection refused, rejected by the proxy), so
+callers can fall back to the exec path without running an action twice. The
+browser API marks its own responses with a header; a gateway error from the
+proxy may come after the request was forwarded and is not retried.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from utils.config import config
+from utils.logger import logger
+
+# Constants for the browser API
+BROWSER_API_PORT = 8002                       # Port of the browser API inside the sandbox
+PREVIEW_TOKEN_HEADER = "x-daytona-preview-token"  # Header authenticating preview link requests
+MAX_RESPONSE_BYTES = 32 * 1024 * 1024          # Largest response body accepted
+CONNECT_TIMEOUT = 5.0                         # Seconds to establish a connection
+PROXY_AUTH_STATUSES = (401, 403)               # Preview proxy rejections; the browser API never returns them
+BROWSER_API_HEADER = "x-browser-api"           # Header set on every browser API response, absent on proxy errors
+
+# Shared HTTP clients keyed by event loop, and preview endpoints keyed by sandbox ID
+_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+_endpoints: Dict[str, Tuple[str, Optional[str]]] = {}
+
+
+class BrowserAPIUnavailable(Exception):
+    """The browser API could not be reached over HTTP."""
+    pass
+
+
+class BrowserAPIError(Exception):
+    """The browser API answered a request with an error."""
+    pass
+
+
+def _get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(config.SANDBOX_BROWSER_API_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def _endpoint(sandbox: Any) -> Tuple[str, Optional[str]]:
+    """Base URL and preview token of a sandbox's browser API."""
+    endpoint = _endpoints.get(sandbox.id)
+    if endpoint is None:
+        link = await sandbox.get_preview_link(BROWSER_API_PORT)
+        url = link.url if hasattr(link, 'url') else str(link).split("url='")[1].split("'")[0]
+        endpoint = (url.rstrip("/"), getattr(link, 'token', None))
+        _endpoints[sandbox.id] = endpoint
+    return endpoint
+
+
+def forget_sandbox(sandbox_id: str) -> None:
+    """Drop the cached preview endpoint of a sandbox."""
+    _endpoints.pop(sandbox_id, None)
+
+
+async def browser_api_request(sandbox: Any, endpoint: str, params: Optional[Dict[str, Any]] = None, method: str = "POST",
+                              query: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Call a browser automation endpoint of a sandbox.
+
+    Args:
+        sandbox: The sandbox running the browser API
+        endpoint: Automation endpoint, e.g. "navigate_to"
+        params: JSON body, or query parameters for GET
+        method: HTTP method
+        query: Additional query parameters, e.g. the screenshot options
+        timeout: Seconds the request may take. Defaults to SANDBOX_BROWSER_API_TIMEOUT.
+
+    Returns:
+        The decoded JSON response
+
+    Raises:
+        BrowserAPIUnavailable: If the request did not reach the browser API
+        BrowserAPIError: If the browser API answered with an error status
+        httpx.HTTPError: If the request failed after it was sent, e.g. timed out
+    """
+    try:
+        base_url, token = await _endpoint(sandbox)
+    except Exception as e:
+        raise BrowserAPIUnavailable(f"No preview link for port {BROWSER_API_PORT}: {str(e)}") from e
+
+    url = f"{base_url}/api/automation/{endpoint}"
+    headers = {PREVIEW_TOKEN_HEADER: token} if token else {}
+    if method == "GET":
+        request_kwargs = {"params": {**(query or {}), **(params or {})}}
+    else:
+        request_kwargs = {"params": query or {}, "json": params}
+    if timeout is not None:
+        request_kwargs["timeout"] = httpx.Timeout(timeout, connect=CONNECT_TIMEOUT)
+    try:
+        async with _get_client().stream(method, url, headers=headers, **request_kwargs) as response:
+            if response.status_code >= 400:
+                body = (await response.aread())[:500].decode(errors="replace")
+                if BROWSER_API_HEADER in response.headers:
+                    raise BrowserAPIError(f"Browser API returned {response.status_code}: {body}")
+                # The preview link may have expired or the sandbox restarted
+                forget_sandbox(sandbox.id)
+                if response.status_code in PROXY_AUTH_STATUSES or response.status_code == 404:
+                    # Rejected or not routed by the proxy, so the action did not run
+                    raise BrowserAPIUnavailable(f"Preview proxy returned {response.status_code}: {body}")
+                # A gateway error may come after the request was forwarded
+                raise BrowserAPIError(f"Preview proxy returned {response.status_code}: {body}")
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > MAX_RESPONSE_BYTES:
+                    raise BrowserAPIError(f"Browser API response exceeds {MAX_RESPONSE_BYTES} bytes")
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        forget_sandbox(sandbox.id)
+        raise BrowserAPIUnavailable(f"Browser API request failed: {type(e).__name__}: {str(e)}") from e
+
+    logger.debug(f"Browser API {endpoint} returned {len(body)} bytes")
+    return json.loads(body)
+
+
+async def close_browser_clients() -> None:
+    """Close the shared browser API HTTP clients."""
+    for client in list(_clients.values()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing browser API client: {str(e)}")
+    _clients.clear()
@@ -1,6 +1,6 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Body
-from playwright.async_api import async_playwright, Browser, Page, ElementHandle
-from pydantic import BaseModel
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Depends, Query
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, ElementHandle
+from pydantic import BaseModel, Field, ValidationError
 from typing import Optional, List, Dict, Any, Union
 import asyncio
 import json
@@ -16,6 +16,14 @@ import traceback
 import pytesseract
 from PIL import Image
 import io
+import time
+import hashlib
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor
+
+from element_table import ElementTable
 
 #######################################################
 # Action model definitions
@@ -60,6 +68,19 @@ class CloseTabAction(BaseModel):
 class NoParamsAction(BaseModel):
     pass
 
+class WaitAction(BaseModel):
+    seconds: int = Field(3, ge=0)
+
+class ScrollToTextAction(BaseModel):
+    text: str
+
+class GetDropdownOptionsAction(BaseModel):
+    index: int
+
+class SelectDropdownOptionAction(BaseModel):
+    index: int
+    option_text: str
+
 class DragDropAction(BaseModel):
     element_source: Optional[str] = None
     element_target: Optional[str] = None
@@ -76,6 +97,18 @@ class DoneAction(BaseModel):
     success: bool = True
     text: str = ""
 
+class BatchStep(BaseModel):
+    action: str  # Name of an automation endpoint, e.g. "input_text"
+    params: Dict[str, Any] = {}
+    checkpoint: bool = False  # Capture the browser state after this step
+    expect_url_contains: Optional[str] = None
+    expect_text: Optional[str] = None  # Text that must be visible on the page after the step
+    expect_selector: Optional[str] = None  # CSS selector that must match after the step
+
+class BatchAction(BaseModel):
+    steps: List[BatchStep]
+    stop_on_failure: bool = True
+
 #######################################################
 # DOM Structure Models
 #######################################################
@@ -101,12 +134,12 @@ class HashedDomElement:
     is_visible: bool
     page_coordinates: Optional[CoordinateSet] = None
 
-@dataclass
+@dataclass(slots=True)
 class DOMBaseNode:
     is_visible: bool
     parent: Optional['DOMElementNode'] = None
 
-@dataclass
+@dataclass(slots=True)
 class DOMTextNode(DOMBaseNode):
     text: str = field(default="")
     type: str = 'TEXT_NODE'
@@ -119,7 +152,7 @@ class DOMTextNode(DOMBaseNode):
             current = current.parent
         return False
 
-@dataclass
+@dataclass(slots=True)
 class DOMElementNode(DOMBaseNode):
     tag_name: str = field(default="")
     xpath: str = field(default="")
@@ -154,7 +187,7 @@ class DOMElementNode(DOMBaseNode):
             
         return tag_str
     
-    @cached_property
+    @property
     def hash(self) -> HashedDomElement:
         return HashedDomElement(
             tag_name=self.tag_name,
@@ -247,6 +280,532 @@ class DOMState:
     pixels_above: int = 0
     pixels_below: int = 0
 
+#######################################################
+# Columnar element table
+#######################################################
+
+ELEMENTS_FORMAT = os.getenv("BROWSER_ELEMENTS_FORMAT", "table")  # "table", or "full" to also send elements and interactive_elements
+ELEMENTS_FORMATS = ("table", "full")
+
+# Element format of the request being handled
+_elements_format: ContextVar[Optional[str]] = ContextVar("elements_format", default=None)
+
+MAX_BATCH_STEPS = 20  # Steps a batch may contain
+MAX_BATCH_WAIT_SECONDS = 30  # Total seconds the wait steps of a batch may take
+
+# Set while a batch step runs that does not need the browser state captured
+_defer_state: ContextVar[bool] = ContextVar("defer_browser_state", default=False)
+
+#######################################################
+# Page settle detection
+#######################################################
+
+SETTLE_MAX_MS = int(os.getenv("BROWSER_SETTLE_MAX_MS", "5000"))  # Longest wait for a page to settle after an action
+SETTLE_QUIET_MS = int(os.getenv("BROWSER_SETTLE_QUIET_MS", "300"))  # DOM quiet time that counts as settled
+SETTLE_LAYOUT_SHIFT_BUDGET = float(os.getenv("BROWSER_SETTLE_LAYOUT_SHIFT_BUDGET", "0.02"))  # Layout shift tolerated while quiet
+
+# Resolves once the document has finished parsing and has had no DOM
+# mutation, and no more layout shift than the budget, for quietMs; or once
+# maxMs has passed. Small layout shifts (e.g. a caret or a spinner) do not
+# restart the quiet period until they add up to the budget.
+SETTLE_JS = """
+(opts) => new Promise((resolve) => {
+    const start = performance.now();
+    let lastChange = start;
+    let mutations = 0;
+    let layoutShift = 0;
+    let pendingShift = 0;
+    const mutationObserver = new MutationObserver((records) => {
+        mutations += records.length;
+        lastChange = performance.now();
+    });
+    mutationObserver.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    let shiftObserver = null;
+    try {
+        shiftObserver = new PerformanceObserver((list) => {
+            for (const entry of list.getEntries()) {
+                if (entry.hadRecentInput) continue;
+                layoutShift += entry.value;
+                pendingShift += entry.value;
+                if (pendingShift > opts.layoutShiftBudget) {
+                    pendingShift = 0;
+                    lastChange = performance.now();
+                }
+            }
+        });
+        shiftObserver.observe({type: 'layout-shift', buffered: false});
+    } catch (e) {
+        shiftObserver = null;
+    }
+    const check = () => {
+        const now = performance.now();
+        const quiet = document.readyState !== 'loading' && now - lastChange >= opts.quietMs;
+        if (quiet || now - start >= opts.maxMs) {
+            mutationObserver.disconnect();
+            if (shiftObserver) shiftObserver.disconnect();
+            resolve({settled: quiet, waitedMs: now - start, mutations: mutations, layoutShift: layoutShift});
+        } else {
+            setTimeout(check, 25);
+        }
+    };
+    setTimeout(check, 25);
+})
+"""
+
+#######################################################
+# Screenshot OCR
+#######################################################
+
+OCR_MODE = os.getenv("BROWSER_OCR_MODE", "off")  # "off", "always", or "auto" to skip pages whose DOM has enough text
+OCR_WORKERS = int(os.getenv("BROWSER_OCR_WORKERS", "2"))  # Processes running tesseract
+OCR_MIN_DOM_TEXT = int(os.getenv("BROWSER_OCR_MIN_DOM_TEXT", "200"))  # Visible DOM characters above which "auto" skips OCR
+OCR_CACHE_SIZE = 256  # OCR results kept, keyed by perceptual hash
+OCR_JOBS_SIZE = 512  # Screenshot IDs whose OCR status can be queried
+OCR_HASH_DISTANCE = 4  # Differing bits of the perceptual hash still treated as the same frame
+
+def perceptual_hash(image_bytes: bytes) -> int:
+    """64-bit difference hash of an image; near-identical frames differ in few bits"""
+    image = Image.open(io.BytesIO(image_bytes)).convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def ocr_image(image_bytes: bytes) -> str:
+    """Run tesseract on an image; executed in the OCR process pool"""
+    return pytesseract.image_to_string(Image.open(io.BytesIO(image_bytes))).strip()
+
+class OCRService:
+    """Extracts screenshot text in a process pool, off the browser action path
+
+    Actions return as soon as the screenshot is taken; OCR of the screenshot
+    runs in the background and is fetched later by screenshot ID (the SHA-256
+    of the image). Results are cached by perceptual hash, so identical or
+    near-identical frames, e.g. after a wait or a no-op click, reuse them.
+    """
+
+    def __init__(self, mode: str = OCR_MODE, workers: int = OCR_WORKERS):
+        self.mode = mode
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.jobs: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self.cache: "OrderedDict[int, str]" = OrderedDict()
+        self.stats = {"submitted": 0, "skipped": 0, "cache_hits": 0, "extracted": 0, "failed": 0}
+
+    def should_run(self, dom_text_chars: int) -> bool:
+        if self.mode == "always":
+            return True
+        if self.mode == "auto":
+            return dom_text_chars < OCR_MIN_DOM_TEXT
+        return False
+
+    def submit(self, image_bytes: bytes, screenshot_id: str, dom_text_chars: int = 0) -> bool:
+        """Schedule OCR of a screenshot, fetched later by its ID; False if OCR is skipped"""
+        if not self.should_run(dom_text_chars):
+            self.stats["skipped"] += 1
+            return False
+
+        if screenshot_id in self.jobs:
+            self.jobs.move_to_end(screenshot_id)
+            return True
+
+        self.stats["submitted"] += 1
+        self.jobs[screenshot_id] = asyncio.ensure_future(self._extract(image_bytes))
+        while len(self.jobs) > OCR_JOBS_SIZE:
+            _, evicted = self.jobs.popitem(last=False)
+            if not evicted.done():
+                evicted.cancel()
+        return True
+
+    async def _extract(self, image_bytes: bytes) -> str:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            image_hash = await loop.run_in_executor(self.executor, perceptual_hash, image_bytes)
+            for cached_hash, text in self.cache.items():
+                if bin(cached_hash ^ image_hash).count("1") <= OCR_HASH_DISTANCE:
+                    self.stats["cache_hits"] += 1
+                    self.cache.move_to_end(cached_hash)
+                    return text
+
+            text = await loop.run_in_executor(self.executor, ocr_image, image_bytes)
+            self.stats["extracted"] += 1
+            self.cache[image_hash] = text
+            while len(self.cache) > OCR_CACHE_SIZE:
+                self.cache.popitem(last=False)
+            return text
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Error performing OCR: {e}")
+            traceback.print_exc()
+            return ""
+
+    def peek(self, screenshot_id: Optional[str]) -> Optional[str]:
+        """OCR text of a screenshot if it is already available"""
+        job = self.jobs.get(screenshot_id) if screenshot_id else None
+        if job is not None and job.done() and not job.cancelled():
+            return job.result()
+        return None
+
+    async def get(self, screenshot_id: str, wait: bool = False, timeout: float = 30) -> Dict[str, Any]:
+        """Status and text of the OCR of a screenshot, optionally waiting for it"""
+        job = self.jobs.get(screenshot_id)
+        if job is None:
+            return {"screenshot_id": screenshot_id, "status": "unknown", "ocr_text": None}
+        if wait and not job.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(job), timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+        if not job.done() or job.cancelled():
+            return {"screenshot_id": screenshot_id, "status": "pending", "ocr_text": None}
+        return {"screenshot_id": screenshot_id, "status": "done", "ocr_text": job.result()}
+
+    def shutdown(self):
+        for job in self.jobs.values():
+            job.cancel()
+        self.jobs.clear()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+#######################################################
+# Incremental DOM tracking
+#######################################################
+
+# Installs a tracker in the page on first use and returns the interactive
+# elements that changed since a given version. A MutationObserver (plus
+# scroll and resize listeners) marks the page dirty, so an unchanged page is
+# not rescanned at all. Elements keep a stable ID for the lifetime of the
+# document; a new document gets a new documentId and a full snapshot.
+DOM_TRACKER_JS = """
+(args) => {
+    if (!window.__sunaDomTracker) {
+        const SELECTOR = 'a, button, input, select, textarea, [role="button"], [role="link"], [role="checkbox"], [role="radio"], [tabindex]:not([tabindex="-1"])';
+        const tracker = {
+            documentId: Date.now().toString(36) + Math.random().toString(36).slice(2),
+            version: 0,
+            dirty: true,
+            nextId: 1,
+            ids: new WeakMap(),
+            elements: new Map(),
+            signatures: new Map(),
+            descriptions: new Map(),
+            changedAt: new Map(),
+            removedAt: new Map(),
+            order: []
+        };
+        const markDirty = () => { tracker.dirty = true; };
+        new MutationObserver(markDirty).observe(document, {
+            subtree: true, childList: true, attributes: true, characterData: true
+        });
+        window.addEventListener('scroll', markDirty, {passive: true, capture: true});
+        window.addEventListener('resize', markDirty);
+
+        const getAttributes = (el) => {
+            const attributes = {};
+            for (const attr of el.attributes) {
+                attributes[attr.name] = attr.value;
+            }
+            return attributes;
+        };
+
+        const describe = (el) => {
+            const style = window.getComputedStyle(el);
+            const rect = el.getBoundingClientRect();
+            if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0' ||
+                rect.width <= 0 || rect.height <= 0) {
+                return null;
+            }
+            return {
+                tagName: el.tagName.toLowerCase(),
+                text: el.innerText || el.value || '',
+                attributes: getAttributes(el),
+                pageCoordinates: {
+                    x: rect.left + window.scrollX, y: rect.top + window.scrollY,
+                    width: rect.width, height: rect.height
+                },
+                viewportCoordinates: {x: rect.left, y: rect.top, width: rect.width, height: rect.height},
+                isInViewport: rect.top >= 0 && rect.left >= 0 &&
+                    rect.bottom <= window.innerHeight && rect.right <= window.innerWidth
+            };
+        };
+
+        const rescan = () => {
+            const next = tracker.version + 1;
+            const order = [];
+            const seen = new Set();
+            let changed = false;
+            for (const el of document.querySelectorAll(SELECTOR)) {
+                const description = describe(el);
+                if (!description) continue;
+                let id = tracker.ids.get(el);
+                if (id === undefined) {
+                    id = tracker.nextId++;
+                    tracker.ids.set(el, id);
+                }
+                tracker.elements.set(id, el);
+                tracker.removedAt.delete(id);
+                seen.add(id);
+                order.push(id);
+                const signature = JSON.stringify(description);
+                if (tracker.signatures.get(id) !== signature) {
+                    tracker.signatures.set(id, signature);
+                    tracker.descriptions.set(id, description);
+                    tracker.changedAt.set(id, next);
+                    changed = true;
+                }
+            }
+            for (const id of Array.from(tracker.signatures.keys())) {
+                if (!seen.has(id)) {
+                    tracker.signatures.delete(id);
+                    tracker.descriptions.delete(id);
+                    tracker.changedAt.delete(id);
+                    tracker.elements.delete(id);
+                    tracker.removedAt.set(id, next);
+                    changed = true;
+                }
+            }
+            if (!changed && order.join() !== tracker.order.join()) changed = true;
+            tracker.order = order;
+            tracker.dirty = false;
+            if (changed) tracker.version = next;
+        };
+
+        tracker.snapshot = (since, documentId) => {
+            const full = documentId !== tracker.documentId || since === null || since === undefined;
+            if (tracker.dirty) rescan();
+            if (!full && since === tracker.version) {
+                return {documentId: tracker.documentId, version: tracker.version, unchanged: true};
+            }
+            const changed = [];
+            for (const id of tracker.order) {
+                if (full || tracker.changedAt.get(id) > since) {
+                    changed.push(Object.assign({id: id}, tracker.descriptions.get(id)));
+                }
+            }
+            const removed = [];
+            if (!full) {
+                for (const [id, version] of tracker.removedAt) {
+                    if (version > since) removed.push(id);
+                }
+            }
+            return {
+                documentId: tracker.documentId, version: tracker.version, full: full,
+                order: tracker.order, changed: changed, removed: removed
+            };
+        };
+
+        tracker.get = (id, documentId) => {
+            if (documentId !== tracker.documentId) return null;
+            const el = tracker.elements.get(id);
+            return el && el.isConnected ? el : null;
+        };
+
+        window.__sunaDomTracker = tracker;
+    }
+    return window.__sunaDomTracker.snapshot(args.since, args.documentId);
+}
+"""
+
+
+class DOMTracker:
+    """Python side of the in-page DOM tracker for one page.
+
+    Keeps a DOMElementNode per interactive element and only rebuilds the
+    nodes of elements the page reports as changed. Element IDs are stable
+    across actions on the same document and are used as highlight indices.
+    """
+
+    def __init__(self):
+        self.document_id: Optional[str] = None
+        self.version: Optional[int] = None
+        self.nodes: Dict[int, DOMElementNode] = {}
+        self.order: List[int] = []
+        self.changed: List[int] = []
+
+    async def sync(self, page: Page) -> Dict[int, DOMElementNode]:
+        """Apply the changes since the last sync and return the selector map."""
+        snapshot = await page.evaluate(DOM_TRACKER_JS, {"since": self.version, "documentId": self.document_id})
+
+        if snapshot["documentId"] != self.document_id:
+            # A new document (navigation or reload): rebuild everything
+            self.document_id = snapshot["documentId"]
+            self.nodes = {}
+
+        if snapshot.get("unchanged"):
+            self.changed = []
+        else:
+            for description in snapshot["changed"]:
+                self.nodes[description["id"]] = self._element_node(description)
+            for element_id in snapshot["removed"]:
+                self.nodes.pop(element_id, None)
+            self.order = snapshot["order"]
+            self.changed = [description["id"] for description in snapshot["changed"]]
+        self.version = snapshot["version"]
+
+        return {element_id: self.nodes[element_id] for element_id in self.order if element_id in self.nodes}
+
+    async def locate(self, page: Page, element_id: int) -> Optional[ElementHandle]:
+        """Return a handle to a tracked element, or None if it is gone."""
+        if self.document_id is None:
+            return None
+        handle = await page.evaluate_handle(
+            "([id, documentId]) => window.__sunaDomTracker ? window.__sunaDomTracker.get(id, documentId) : null",
+            [element_id, self.document_id]
+        )
+        element = handle.as_element()
+        if element is None:
+            await handle.dispose()
+        return element
+
+    @staticmethod
+    def _element_node(description: Dict[str, Any]) -> DOMElementNode:
+        def coordinates(key: str) -> Optional[CoordinateSet]:
+            coords = description.get(key)
+            if not coords:
+                return None
+            return CoordinateSet(
+                x=coords.get('x', 0),
+                y=coords.get('y', 0),
+                width=coords.get('width', 0),
+                height=coords.get('height', 0)
+            )
+
+        element_node = DOMElementNode(
+            is_visible=True,
+            tag_name=description.get('tagName', 'div'),
+            attributes=description.get('attributes', {}),
+            is_interactive=True,
+            is_in_viewport=description.get('isInViewport', False),
+            highlight_index=description['id'],
+            page_coordinates=coordinates('pageCoordinates'),
+            viewport_coordinates=coordinates('viewportCoordinates')
+        )
+        if description.get('text'):
+            text_node = DOMTextNode(is_visible=True, text=description['text'])
+            text_node.parent = element_node
+            element_node.children.append(text_node)
+        return element_node
+
+#######################################################
+# Screenshot policy
+#######################################################
+
+# Capture settings per tier; "skip" captures nothing
+SCREENSHOT_TIERS: Dict[str, Optional[Dict[str, Any]]] = {
+    "skip": None,
+    "thumbnail": {"full_page": False, "max_width": 512, "quality": 50},
+    "standard": {"full_page": False, "max_width": None, "quality": 60},
+    "full_page": {"full_page": True, "max_width": None, "quality": 50},
+}
+SCREENSHOT_FORMATS = ("jpeg", "webp")  # Formats accepted by the vision models in use
+DEFAULT_SCREENSHOT_TIER = os.getenv("BROWSER_SCREENSHOT_TIER", "standard")
+DEFAULT_SCREENSHOT_FORMAT = os.getenv("BROWSER_SCREENSHOT_FORMAT", "jpeg")
+FULL_PAGE_MAX_HEIGHT = 8192  # Pixels of a full page screenshot kept
+
+@dataclass
+class ScreenshotRequest:
+    """How the caller wants the screenshot of an action"""
+    tier: str = DEFAULT_SCREENSHOT_TIER
+    format: str = DEFAULT_SCREENSHOT_FORMAT
+    known_screenshot_id: Optional[str] = None  # Screenshot the caller already has; not sent again
+
+@dataclass
+class Screenshot:
+    data: bytes
+    tier: str
+    format: str
+
+    @cached_property
+    def id(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+def encode_screenshot(data: bytes, fmt: str, quality: int, max_width: Optional[int]) -> bytes:
+    """Downscale and re-encode a lossless capture"""
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    if max_width and image.width > max_width:
+        image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, format=fmt.upper(), quality=quality)
+    return output.getvalue()
+
+# Screenshot options of the request being handled
+_screenshot_request: ContextVar[Optional[ScreenshotRequest]] = ContextVar("screenshot_request", default=None)
+
+#######################################################
+# Browser contexts
+#######################################################
+
+DEFAULT_CONTEXT_ID = "default"  # Context used by requests without a context_id
+MAX_CONTEXTS = int(os.getenv("BROWSER_MAX_CONTEXTS", "8"))  # Isolated contexts open at once
+MAX_PAGES_PER_CONTEXT = int(os.getenv("BROWSER_MAX_PAGES_PER_CONTEXT", "10"))  # Tabs a context may open
+CONTEXT_IDLE_TIMEOUT = int(os.getenv("BROWSER_CONTEXT_IDLE_TIMEOUT", "900"))  # Seconds before an idle context is closed
+MEMORY_WATERMARK_MB = int(os.getenv("BROWSER_MEMORY_WATERMARK_MB", "1536"))  # JS heap of all contexts above which idle ones are closed
+CONTEXT_CHECK_INTERVAL = 30  # Seconds between idle and memory checks
+_CONTEXT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class BrowserSession:
+    """An isolated browser context with its own tabs and action queue
+
+    Actions on a session run one at a time, in arrival order, while actions
+    on different sessions run concurrently. Cookies, storage and tabs are
+    not shared between sessions.
+    """
+
+    def __init__(self, context_id: str, context: BrowserContext):
+        self.context_id = context_id
+        self.context = context
+        self.pages: List[Page] = []
+        self.current_page_index: int = 0
+        self.dom_trackers: Dict[Page, "DOMTracker"] = {}
+        self.lock = asyncio.Lock()
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self.actions = 0
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_used
+
+    async def memory_bytes(self) -> int:
+        """JS heap used by the pages of the session"""
+        total = 0
+        for page in self.pages:
+            try:
+                total += await page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : 0")
+            except Exception:
+                pass
+        return total
+
+    async def close(self):
+        try:
+            await self.context.close()
+        except Exception as e:
+            print(f"Error closing browser context {self.context_id}: {e}")
+        self.pages.clear()
+        self.dom_trackers.clear()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "context_id": self.context_id,
+            "pages": len(self.pages),
+            "current_page_index": self.current_page_index,
+            "busy": self.busy,
+            "actions": self.actions,
+            "idle_seconds": int(self.idle_seconds()),
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat()
+        }
+
+# Session of the request being handled
+_current_session: ContextVar[Optional[BrowserSession]] = ContextVar("current_browser_session", default=None)
+
 #######################################################
 # Browser Action Result Model
 #######################################################
@@ -264,11 +823,24 @@ class BrowserActionResult(BaseModel):
     pixels_above: int = 0
     pixels_below: int = 0
     content: Optional[str] = None
-    ocr_text: Optional[str] = None  # Added field for OCR text
+    ocr_text: Optional[str] = None  # OCR text, if already extracted when the action returned
+    screenshot_id: Optional[str] = None  # SHA-256 of the screenshot, also the ID to fetch its OCR text from /automation/ocr
+    screenshot_tier: Optional[str] = None  # Tier the screenshot was taken at
+    screenshot_format: Optional[str] = None  # Image format of the screenshot
+    screenshot_bytes: int = 0  # Size of the encoded screenshot
+    screenshot_sent_bytes: int = 0  # Size of screenshot_base64 in this result
+    screenshot_unchanged: bool = False  # The screenshot equals known_screenshot_id and was left out
     
     # Additional metadata
     element_count: int = 0  # Number of interactive elements found
-    interactive_elements: Optional[List[Dict[str, Any]]] = None  # Simplified list of interactive elements
+    interactive_elements: Optional[List[Dict[str, Any]]] = None  # Simplified list of interactive elements, with elements_format=full
+    element_table: Optional[Dict[str, Any]] = None  # Columnar table of the interactive elements, see ElementTable
+    dom_version: Optional[int] = None  # Version of the tracked DOM the elements belong to
+    changed_elements: Optional[List[int]] = None  # Indices of elements added or changed by the action
+    settle_ms: Optional[int] = None  # Time spent waiting for the page to settle after the action
+    settled: Optional[bool] = None  # Whether the page settled before the maximum wait
+    steps: Optional[List[Dict[str, Any]]] = None  # Outcome of each step of a batch
+    checkpoints: Optional[List[Dict[str, Any]]] = None  # Browser state at the checkpoints of a batch
     viewport_width: Optional[int] = None
     viewport_height: Optional[int] = None
     
@@ -283,8 +855,10 @@ class BrowserAutomation:
     def __init__(self):
         self.router = APIRouter()
         self.browser: Browser = None
-        self.pages: List[Page] = []
-        self.current_page_index: int = 0
+        self.sessions: Dict[str, BrowserSession] = {}
+        self._sessions_lock = asyncio.Lock()
+        self._context_monitor: Optional[asyncio.Task] = None
+        self.ocr = OCRService()
         self.logger = logging.getLogger("browser_automation")
         self.include_attributes = ["id", "href", "src", "alt", "aria-label", "placeholder", "name", "role", "title", "value"]
         self.screenshot_dir = os.path.join(os.getcwd(), "screenshots")
@@ -295,37 +869,70 @@ class BrowserAutomation:
         self.router.on_shutdown.append(self.shutdown)
         
         # Basic navigation
-        self.router.post("/automation/navigate_to")(self.navigate_to)
-        self.router.post("/automation/search_google")(self.search_google)
-        self.router.post("/automation/go_back")(self.go_back)
-        self.router.post("/automation/wait")(self.wait)
+        self.router.post("/automation/navigate_to", dependencies=[Depends(self.session_scope)])(self.navigate_to)
+        self.router.post("/automation/search_google", dependencies=[Depends(self.session_scope)])(self.search_google)
+        self.router.post("/automation/go_back", dependencies=[Depends(self.session_scope)])(self.go_back)
+        self.router.post("/automation/wait", dependencies=[Depends(self.session_scope)])(self.wait)
         
         # Element interaction
-        self.router.post("/automation/click_element")(self.click_element)
-        self.router.post("/automation/click_coordinates")(self.click_coordinates)
-        self.router.post("/automation/input_text")(self.input_text)
-        self.router.post("/automation/send_keys")(self.send_keys)
+        self.router.post("/automation/click_element", dependencies=[Depends(self.session_scope)])(self.click_element)
+        self.router.post("/automation/click_coordinates", dependencies=[Depends(self.session_scope)])(self.click_coordinates)
+        self.router.post("/automation/input_text", dependencies=[Depends(self.session_scope)])(self.input_text)
+        self.router.post("/automation/send_keys", dependencies=[Depends(self.session_scope)])(self.send_keys)
         
         # Tab management
-        self.router.post("/automation/switch_tab")(self.switch_tab)
-        self.router.post("/automation/open_tab")(self.open_tab)
-        self.router.post("/automation/close_tab")(self.close_tab)
+        self.router.post("/automation/switch_tab", dependencies=[Depends(self.session_scope)])(self.switch_tab)
+        self.router.post("/automation/open_tab", dependencies=[Depends(self.session_scope)])(self.open_tab)
+        self.router.post("/automation/close_tab", dependencies=[Depends(self.session_scope)])(self.close_tab)
         
         # Content actions
-        self.router.post("/automation/extract_content")(self.extract_content)
-        self.router.post("/automation/save_pdf")(self.save_pdf)
+        self.router.post("/automation/extract_content", dependencies=[Depends(self.session_scope)])(self.extract_content)
+        self.router.post("/automation/save_pdf", dependencies=[Depends(self.session_scope)])(self.save_pdf)
         
         # Scroll actions
-        self.router.post("/automation/scroll_down")(self.scroll_down)
-        self.router.post("/automation/scroll_up")(self.scroll_up)
-        self.router.post("/automation/scroll_to_text")(self.scroll_to_text)
+        self.router.post("/automation/scroll_down", dependencies=[Depends(self.session_scope)])(self.scroll_down)
+        self.router.post("/automation/scroll_up", dependencies=[Depends(self.session_scope)])(self.scroll_up)
+        self.router.post("/automation/scroll_to_text", dependencies=[Depends(self.session_scope)])(self.scroll_to_text)
         
         # Dropdown actions
-        self.router.post("/automation/get_dropdown_options")(self.get_dropdown_options)
-        self.router.post("/automation/select_dropdown_option")(self.select_dropdown_option)
+        self.router.post("/automation/get_dropdown_options", dependencies=[Depends(self.session_scope)])(self.get_dropdown_options)
+        self.router.post("/automation/select_dropdown_option", dependencies=[Depends(self.session_scope)])(self.select_dropdown_option)
         
         # Drag and drop
-        self.router.post("/automation/drag_drop")(self.drag_drop)
+        self.router.post("/automation/drag_drop", dependencies=[Depends(self.session_scope)])(self.drag_drop)
+        
+        # Batches of actions
+        self.router.post("/automation/batch", dependencies=[Depends(self.session_scope)])(self.batch)
+        
+        # Actions a batch can run, with the model validating their parameters and
+        # whether the handler takes the fields as keywords rather than the model
+        self.batch_actions = {
+            "navigate_to": (self.navigate_to, GoToUrlAction, False),
+            "search_google": (self.search_google, SearchGoogleAction, False),
+            "go_back": (self.go_back, NoParamsAction, False),
+            "wait": (self.wait, WaitAction, True),
+            "click_element": (self.click_element, ClickElementAction, False),
+            "click_coordinates": (self.click_coordinates, ClickCoordinatesAction, False),
+            "input_text": (self.input_text, InputTextAction, False),
+            "send_keys": (self.send_keys, SendKeysAction, False),
+            "switch_tab": (self.switch_tab, SwitchTabAction, False),
+            "open_tab": (self.open_tab, OpenTabAction, False),
+            "close_tab": (self.close_tab, CloseTabAction, False),
+            "scroll_down": (self.scroll_down, ScrollAction, False),
+            "scroll_up": (self.scroll_up, ScrollAction, False),
+            "scroll_to_text": (self.scroll_to_text, ScrollToTextAction, True),
+            "get_dropdown_options": (self.get_dropdown_options, GetDropdownOptionsAction, True),
+            "select_dropdown_option": (self.select_dropdown_option, SelectDropdownOptionAction, True),
+            "drag_drop": (self.drag_drop, DragDropAction, False),
+        }
+        
+        # Screenshot OCR
+        self.router.get("/automation/ocr/{screenshot_id}")(self.get_ocr_text)
+        
+        # Browser contexts
+        self.router.get("/automation/contexts")(self.list_contexts)
+        self.router.post("/automation/contexts")(self.create_context)
+        self.router.delete("/automation/contexts/{context_id}")(self.close_context)
 
     async def startup(self):
         """Initialize the browser instance on startup"""
@@ -351,21 +958,9 @@ class BrowserAutomation:
                 self.browser = await playwright.chromium.launch(**launch_options)
                 print("Browser launched with minimal options")
 
-            try:
-                await self.get_current_page()
-                print("Found existing page, using it")
-                self.current_page_index = 0
-            except Exception as page_error:
-                print(f"Error finding existing page, creating new one. ( {page_error})")
-                page = await self.browser.new_page()
-                print("New page created successfully")
-                self.pages.append(page)
-                self.current_page_index = 0
-                # Navigate to about:blank to ensure page is ready
-                # await page.goto("google.com", timeout=30000)
-                print("Navigated to google.com")
-                
-                print("Browser initialization completed successfully")
+            await self.get_session(DEFAULT_CONTEXT_ID)
+            self._context_monitor = asyncio.create_task(self.monitor_contexts())
+            print("Browser initialization completed successfully")
         except Exception as e:
             print(f"Browser startup error: {str(e)}")
             traceback.print_exc()
@@ -373,9 +968,160 @@ class BrowserAutomation:
             
     async def shutdown(self):
         """Clean up browser instance on shutdown"""
+        self.ocr.shutdown()
+        if self._context_monitor:
+            self._context_monitor.cancel()
+        for session in list(self.sessions.values()):
+            await session.close()
+        self.sessions.clear()
         if self.browser:
             await self.browser.close()
     
+    # Browser contexts
+    
+    @property
+    def session(self) -> BrowserSession:
+        """Session of the current request, or the default session"""
+        session = _current_session.get()
+        if session is None:
+            session = self.sessions.get(DEFAULT_CONTEXT_ID)
+            if session is None:
+                raise HTTPException(status_code=500, detail="Browser is not initialized")
+        return session
+    
+    @property
+    def pages(self) -> List[Page]:
+        return self.session.pages
+    
+    @property
+    def current_page_index(self) -> int:
+        return self.session.current_page_index
+    
+    @current_page_index.setter
+    def current_page_index(self, index: int):
+        self.session.current_page_index = index
+    
+    @property
+    def dom_trackers(self) -> Dict[Page, "DOMTracker"]:
+        return self.session.dom_trackers
+    
+    async def get_session(self, context_id: str) -> BrowserSession:
+        """Get a browser session, opening a new context with one tab if needed"""
+        session = self.sessions.get(context_id)
+        if session is not None:
+            return session
+        if not _CONTEXT_ID_PATTERN.match(context_id):
+            raise HTTPException(status_code=400, detail=f"Invalid context ID: {context_id}")
+        
+        async with self._sessions_lock:
+            session = self.sessions.get(context_id)
+            if session is not None:
+                return session
+            if len(self.sessions) >= MAX_CONTEXTS and not await self.evict_idle_session():
+                raise HTTPException(status_code=429, detail=f"All {MAX_CONTEXTS} browser contexts are in use")
+            
+            context = await self.browser.new_context()
+            session = BrowserSession(context_id, context)
+            session.pages.append(await context.new_page())
+            self.sessions[context_id] = session
+            print(f"Opened browser context {context_id} ({len(self.sessions)} open)")
+            return session
+    
+    async def session_scope(self, context_id: str = Query(DEFAULT_CONTEXT_ID, description="Browser context to run the action in"),
+                            screenshot_tier: str = Query(DEFAULT_SCREENSHOT_TIER, description="skip, thumbnail, standard or full_page"),
+                            screenshot_format: str = Query(DEFAULT_SCREENSHOT_FORMAT, description="jpeg or webp"),
+                            known_screenshot_id: Optional[str] = Query(None, description="Screenshot the caller already has"),
+                            elements_format: str = Query(ELEMENTS_FORMAT, description="table, or full to also get the elements as text and dicts")):
+        """Run the request in a browser session, after the session's earlier actions"""
+        if screenshot_tier not in SCREENSHOT_TIERS:
+            raise HTTPException(status_code=400, detail=f"Unknown screenshot tier: {screenshot_tier}")
+        if screenshot_format not in SCREENSHOT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported screenshot format: {screenshot_format}")
+        if elements_format not in ELEMENTS_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unknown elements format: {elements_format}")
+        
+        session = await self.get_session(context_id)
+        async with session.lock:
+            if self.sessions.get(context_id) is not session:
+                raise HTTPException(status_code=409, detail=f"Browser context {context_id} was closed")
+            session.actions += 1
+            token = _current_session.set(session)
+            screenshot_token = _screenshot_request.set(ScreenshotRequest(screenshot_tier, screenshot_format, known_screenshot_id))
+            elements_token = _elements_format.set(elements_format)
+            try:
+                yield session
+            finally:
+                _elements_format.reset(elements_token)
+                _screenshot_request.reset(screenshot_token)
+                _current_session.reset(token)
+                session.last_used = time.monotonic()
+    
+    async def close_session(self, context_id: str) -> bool:
+        """Close a session once its pending actions are done; the default session is kept"""
+        session = self.sessions.get(context_id)
+        if session is None or context_id == DEFAULT_CONTEXT_ID:
+            return False
+        async with session.lock:
+            if self.sessions.get(context_id) is not session:
+                return False
+            del self.sessions[context_id]
+            await session.close()
+        print(f"Closed browser context {context_id} ({len(self.sessions)} open)")
+        return True
+    
+    async def evict_idle_session(self) -> bool:
+        """Close the least recently used idle session other than the default one"""
+        idle = [s for s in self.sessions.values() if s.context_id != DEFAULT_CONTEXT_ID and not s.busy]
+        if not idle:
+            return False
+        session = max(idle, key=lambda s: s.idle_seconds())
+        return await self.close_session(session.context_id)
+    
+    async def monitor_contexts(self):
+        """Close sessions idle past the timeout, and idle sessions while memory is above the watermark"""
+        while True:
+            await asyncio.sleep(CONTEXT_CHECK_INTERVAL)
+            try:
+                for session in list(self.sessions.values()):
+                    if (session.context_id != DEFAULT_CONTEXT_ID and not session.busy
+                            and session.idle_seconds() > CONTEXT_IDLE_TIMEOUT):
+                        await self.close_session(session.context_id)
+                
+                watermark = MEMORY_WATERMARK_MB * 1024 * 1024
+                usage = sum([await session.memory_bytes() for session in list(self.sessions.values())])
+                while usage > watermark:
+                    print(f"Browser JS heap {usage // (1024 * 1024)} MB above watermark, closing an idle context")
+                    if not await self.evict_idle_session():
+                        break
+                    usage = sum([await session.memory_bytes() for session in list(self.sessions.values())])
+            except Exception as e:
+                print(f"Error checking browser contexts: {e}")
+                traceback.print_exc()
+    
+    async def list_contexts(self):
+        """List the open browser contexts"""
+        return {
+            "contexts": [session.as_dict() for session in self.sessions.values()],
+            "max_contexts": MAX_CONTEXTS,
+            "max_pages_per_context": MAX_PAGES_PER_CONTEXT
+        }
+    
+    async def create_context(self, context_id: Optional[str] = Query(None, description="ID of the new context, generated if omitted")):
+        """Open a new isolated browser context"""
+        context_id = context_id or uuid.uuid4().hex
+        if context_id in self.sessions:
+            raise HTTPException(status_code=409, detail=f"Browser context {context_id} already exists")
+        session = await self.get_session(context_id)
+        return session.as_dict()
+    
+    async def close_context(self, context_id: str):
+        """Close a browser context and its tabs"""
+        if context_id == DEFAULT_CONTEXT_ID:
+            raise HTTPException(status_code=400, detail="The default browser context cannot be closed")
+        if not await self.close_session(context_id):
+            raise HTTPException(status_code=404, detail=f"Browser context {context_id} not found")
+        return {"context_id": context_id, "closed": True}
+    
     async def get_current_page(self) -> Page:
         """Get the current active page"""
         if not self.pages:
@@ -383,7 +1129,21 @@ class BrowserAutomation:
         return self.pages[self.current_page_index]
     
     async def get_selector_map(self) -> Dict[int, DOMElementNode]:
-        """Get a map of selectable elements on the page"""
+        """Get a map of selectable elements on the page, keyed by stable element ID"""
+        page = await self.get_current_page()
+        tracker = self.dom_trackers.setdefault(page, DOMTracker())
+        try:
+            selector_map = await tracker.sync(page)
+            print(f"Found {len(selector_map)} interactive elements in selector map "
+                  f"({len(tracker.changed)} changed, DOM version {tracker.version})")
+            return selector_map
+        except Exception as e:
+            print(f"DOM tracker unavailable, scanning the page: {e}")
+            self.dom_trackers.pop(page, None)
+            return await self.scan_selector_map()
+
+    async def scan_selector_map(self) -> Dict[int, DOMElementNode]:
+        """Get a map of selectable elements by a full scan, keyed by position"""
         page = await self.get_current_page()
         
         # Create a selector map for interactive elements
@@ -540,11 +1300,11 @@ class BrowserAutomation:
                 is_top_element=True
             )
             
-            # Add all elements from selector map as children of root
+            # Add all elements from selector map as children of root; tracked
+            # elements are reused across states, so they are re-parented each time
             for element in selector_map.values():
-                if element.parent is None:
-                    element.parent = root
-                    root.children.append(element)
+                element.parent = root
+                root.children.append(element)
             
             # Get basic page info
             url = page.url
@@ -609,16 +1369,32 @@ class BrowserAutomation:
                 pixels_below=0
             )
     
-    async def take_screenshot(self) -> str:
-        """Take a screenshot and return as base64 encoded string"""
+    async def take_screenshot(self, request: Optional[ScreenshotRequest] = None) -> Optional[Screenshot]:
+        """Take a screenshot of the current page at the tier and in the format requested"""
+        request = request or ScreenshotRequest()
+        settings = SCREENSHOT_TIERS[request.tier]
+        if settings is None:
+            return None
         try:
             page = await self.get_current_page()
-            screenshot_bytes = await page.screenshot(type='jpeg', quality=60, full_page=False)
-            return base64.b64encode(screenshot_bytes).decode('utf-8')
+            options: Dict[str, Any] = {"full_page": settings["full_page"]}
+            if settings["full_page"]:
+                height = await page.evaluate("() => document.documentElement.scrollHeight")
+                if height > FULL_PAGE_MAX_HEIGHT:
+                    width = await page.evaluate("() => document.documentElement.scrollWidth")
+                    options["clip"] = {"x": 0, "y": 0, "width": width, "height": FULL_PAGE_MAX_HEIGHT}
+            
+            if request.format == "jpeg" and not settings["max_width"]:
+                # Chromium encodes JPEG itself, no need to re-encode
+                data = await page.screenshot(type='jpeg', quality=settings["quality"], **options)
+            else:
+                capture = await page.screenshot(type='png', **options)
+                data = await asyncio.to_thread(encode_screenshot, capture, request.format, settings["quality"], settings["max_width"])
+            return Screenshot(data, request.tier, request.format)
         except Exception as e:
             print(f"Error taking screenshot: {e}")
-            # Return an empty string rather than failing
-            return ""
+            # Return no screenshot rather than failing
+            return None
     
     async def save_screenshot_to_file(self) -> str:
         """Take a screenshot and save to file, returning the path"""
@@ -635,70 +1411,90 @@ class BrowserAutomation:
             print(f"Error saving screenshot: {e}")
             return ""
     
-    async def extract_ocr_text_from_screenshot(self, screenshot_base64: str) -> str:
-        """Extract text from screenshot using OCR"""
-        if not screenshot_base64:
-            return ""
-            
-        try:
-            # Decode base64 to image
-            image_bytes = base64.b64decode(screenshot_base64)
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Extract text using pytesseract
-            ocr_text = pytesseract.image_to_string(image)
-            
-            # Clean up the text
-            ocr_text = ocr_text.strip()
-            
-            return ocr_text
-        except Exception as e:
-            print(f"Error performing OCR: {e}")
-            traceback.print_exc()
-            return ""
+    async def get_ocr_text(self, screenshot_id: str, wait: bool = False):
+        """Get the OCR text of a screenshot returned by an action, optionally waiting for it"""
+        return await self.ocr.get(screenshot_id, wait=wait)
     
+    async def wait_for_settle(self, page: Page, max_ms: int = SETTLE_MAX_MS) -> Dict[str, Any]:
+        """Wait until the page has settled after an action, for at most max_ms
+
+        The page is settled once the network is idle, the DOM has not changed
+        for SETTLE_QUIET_MS and layout shifts stay within the budget. Fast
+        pages return after the quiet period; slow ones are waited for.
+        Returns the time waited and whether the page settled in time.
+        """
+        start = time.monotonic()
+
+        async def network_idle() -> bool:
+            try:
+                await page.wait_for_load_state("networkidle", timeout=max_ms)
+                return True
+            except Exception:
+                return False
+
+        async def dom_quiet() -> Dict[str, Any]:
+            # A navigation destroys the context of the check; run it again on
+            # the new document with whatever time is left
+            while True:
+                remaining = max_ms - (time.monotonic() - start) * 1000
+                if remaining <= 0:
+                    return {"settled": False}
+                try:
+                    return await page.evaluate(SETTLE_JS, {
+                        "quietMs": SETTLE_QUIET_MS,
+                        "maxMs": int(remaining),
+                        "layoutShiftBudget": SETTLE_LAYOUT_SHIFT_BUDGET
+                    })
+                except Exception as e:
+                    print(f"DOM settle check interrupted: {e}")
+                    await asyncio.sleep(0.05)
+
+        network_settled, dom = await asyncio.gather(network_idle(), dom_quiet())
+
+        settle_ms = int((time.monotonic() - start) * 1000)
+        settled = network_settled and bool(dom.get("settled"))
+        print(f"Page settled in {settle_ms} ms" if settled else f"Page did not settle, waited {settle_ms} ms")
+        return {"settle_ms": settle_ms, "settled": settled}
+
     async def get_updated_browser_state(self, action_name: str) -> tuple:
         """Helper method to get updated browser state after any action
         Returns a tuple of (dom_state, screenshot, elements, metadata)
         """
         try:
-            # Wait a moment for any potential async processes to settle
-            await asyncio.sleep(0.5)
+            # Wait for network, DOM and layout to settle instead of a fixed delay
+            page = await self.get_current_page()
+            settle = await self.wait_for_settle(page)
+            if _defer_state.get():
+                # Inside a batch the state is only captured at checkpoints and at the end
+                settle['url'] = page.url
+                return None, "", None, settle
             
             # Get updated state
             dom_state = await self.get_current_dom_state()
-            screenshot = await self.take_screenshot()
+            screenshot_request = _screenshot_request.get() or ScreenshotRequest()
+            shot = await self.take_screenshot(screenshot_request)
             
-            # Format elements for output
-            elements = dom_state.element_tree.clickable_elements_to_string(
-                include_attributes=self.include_attributes
-            )
+            # Tabulate the elements; the text forms are only rendered when asked for
+            table = ElementTable.from_selector_map(dom_state.selector_map, self.include_attributes)
+            elements_format = _elements_format.get() or ELEMENTS_FORMAT
+            elements = table.to_string() if elements_format == "full" else None
             
             # Collect additional metadata
             page = await self.get_current_page()
-            metadata = {}
+            metadata = dict(settle)
             
             # Get element count
             metadata['element_count'] = len(dom_state.selector_map)
+
+            # Report which elements the action changed
+            tracker = self.dom_trackers.get(page)
+            if tracker is not None:
+                metadata['dom_version'] = tracker.version
+                metadata['changed_elements'] = tracker.changed
             
-            # Create simplified interactive elements list
-            interactive_elements = []
-            for idx, element in dom_state.selector_map.items():
-                element_info = {
-                    'index': idx,
-                    'tag_name': element.tag_name,
-                    'text': element.get_all_text_till_next_clickable_element(),
-                    'is_in_viewport': element.is_in_viewport
-                }
-                
-                # Add key attributes
-                for attr_name in ['id', 'href', 'src', 'alt', 'placeholder', 'name', 'role', 'title', 'type']:
-                    if attr_name in element.attributes:
-                        element_info[attr_name] = element.attributes[attr_name]
-                
-                interactive_elements.append(element_info)
-            
-            metadata['interactive_elements'] = interactive_elements
+            metadata['element_table'] = table.as_dict()
+            if elements_format == "full":
+                metadata['interactive_elements'] = table.interactive_elements()
             
             # Get viewport dimensions - Fix syntax error in JavaScript
             try:
@@ -717,11 +1513,29 @@ class BrowserAutomation:
                 metadata['viewport_width'] = 0
                 metadata['viewport_height'] = 0
             
-            # Extract OCR text from screenshot if available
-            ocr_text = ""
-            if screenshot:
-                ocr_text = await self.extract_ocr_text_from_screenshot(screenshot)
-                metadata['ocr_text'] = ocr_text
+            # Send the screenshot unless the caller already has the same frame
+            screenshot = ""
+            metadata['screenshot_tier'] = screenshot_request.tier
+            if shot:
+                metadata['screenshot_id'] = shot.id
+                metadata['screenshot_format'] = shot.format
+                metadata['screenshot_bytes'] = len(shot.data)
+                if shot.id == screenshot_request.known_screenshot_id:
+                    metadata['screenshot_unchanged'] = True
+                else:
+                    screenshot = base64.b64encode(shot.data).decode('utf-8')
+            metadata['screenshot_sent_bytes'] = len(screenshot)
+            
+            # Schedule OCR of the screenshot in the background
+            if shot and self.ocr.mode != "off":
+                dom_text_chars = 0
+                if self.ocr.mode == "auto":
+                    try:
+                        dom_text_chars = await page.evaluate("() => document.body ? document.body.innerText.length : 0")
+                    except Exception as e:
+                        print(f"Error measuring visible text: {e}")
+                if self.ocr.submit(shot.data, shot.id, dom_text_chars):
+                    metadata['ocr_text'] = self.ocr.peek(shot.id)
             
             print(f"Got updated state after {action_name}: {len(dom_state.selector_map)} elements")
             return dom_state, screenshot, elements, metadata
@@ -735,26 +1549,37 @@ class BrowserAutomation:
                               elements: str, metadata: dict, error: str = "", content: str = None,
                               fallback_url: str = None) -> BrowserActionResult:
         """Helper method to build a consistent BrowserActionResult"""
-        # Ensure elements is never None to avoid display issues
-        if elements is None:
+        # Ensure elements is never None to avoid display issues, unless the element table replaces it
+        if elements is None and metadata.get('element_table') is None:
             elements = ""
             
         return BrowserActionResult(
             success=success,
             message=message,
             error=error,
-            url=dom_state.url if dom_state else fallback_url or "",
+            url=dom_state.url if dom_state else metadata.get('url') or fallback_url or "",
             title=dom_state.title if dom_state else "",
             elements=elements,
             screenshot_base64=screenshot,
             pixels_above=dom_state.pixels_above if dom_state else 0,
             pixels_below=dom_state.pixels_below if dom_state else 0,
             content=content,
-            ocr_text=metadata.get('ocr_text', ""),
+            ocr_text=metadata.get('ocr_text'),
+            screenshot_id=metadata.get('screenshot_id'),
+            screenshot_tier=metadata.get('screenshot_tier'),
+            screenshot_format=metadata.get('screenshot_format'),
+            screenshot_bytes=metadata.get('screenshot_bytes', 0),
+            screenshot_sent_bytes=metadata.get('screenshot_sent_bytes', 0),
+            screenshot_unchanged=metadata.get('screenshot_unchanged', False),
             element_count=metadata.get('element_count', 0),
-            interactive_elements=metadata.get('interactive_elements', []),
+            interactive_elements=metadata.get('interactive_elements'),
+            element_table=metadata.get('element_table'),
             viewport_width=metadata.get('viewport_width', 0),
-            viewport_height=metadata.get('viewport_height', 0)
+            viewport_height=metadata.get('viewport_height', 0),
+            dom_version=metadata.get('dom_version'),
+            changed_elements=metadata.get('changed_elements'),
+            settle_ms=metadata.get('settle_ms'),
+            settled=metadata.get('settled')
         )
 
     # Basic Navigation Actions
@@ -764,7 +1589,6 @@ class BrowserAutomation:
         try:
             page = await self.get_current_page()
             await page.goto(action.url, wait_until="domcontentloaded")
-            await page.wait_for_load_state("networkidle", timeout=10000)
             
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"navigate_to({action.url})")
@@ -931,9 +1755,6 @@ class BrowserAutomation:
             # Perform the click at the specified coordinates
             await page.mouse.click(action.x, action.y)
             
-            # Give time for any navigation or DOM updates to occur
-            await page.wait_for_load_state("networkidle", timeout=5000)
-            
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"click_coordinates({action.x}, {action.y})")
             
@@ -1023,14 +1844,18 @@ class BrowserAutomation:
             }
             """
             
-            element_info = {'index': action.index} # Pass the target index to the script
-            
-            target_element_handle = await page.evaluate_handle(js_selector_script, element_info)
+            tracker = self.dom_trackers.get(page)
+            if tracker is not None:
+                # Indices are stable element IDs of the DOM tracker
+                target_element_handle = await tracker.locate(page, action.index)
+            else:
+                element_info = {'index': action.index} # Pass the target index to the script
+                target_element_handle = (await page.evaluate_handle(js_selector_script, element_info)).as_element()
 
             click_success = False
             error_message = ""
 
-            if await target_element_handle.evaluate("node => node !== null"):
+            if target_element_handle is not None:
                 try:
                     # Use Playwright's recommended way: click the handle
                     # Add timeout and wait for element to be stable
@@ -1047,13 +1872,6 @@ class BrowserAutomation:
                  print(error_message)
 
 
-            # Wait for potential page changes/network activity
-            try:
-                await page.wait_for_load_state("networkidle", timeout=5000)
-            except Exception as wait_error:
-                print(f"Timeout or error waiting for network idle after click: {wait_error}")
-                await asyncio.sleep(1) # Fallback wait
-
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"click_element({action.index})")
 
@@ -1127,8 +1945,12 @@ class BrowserAutomation:
             # Use CSS selector or XPath to locate and type into the element
             await page.wait_for_timeout(500)  # Small delay before typing
             
+            tracker = self.dom_trackers.get(page)
+            target_element_handle = await tracker.locate(page, action.index) if tracker is not None else None
+            if target_element_handle is not None:
+                await target_element_handle.fill(action.text)
             # Demo implementation - would use proper selectors in production
-            if element.attributes.get("id"):
+            elif element.attributes.get("id"):
                 await page.fill(f"#{element.attributes['id']}", action.text)
             elif element.attributes.get("class"):
                 class_selector = f".{element.attributes['class'].replace(' ', '.')}"
@@ -1242,13 +2064,16 @@ class BrowserAutomation:
         """Open a new tab with the specified URL"""
         try:
             print(f"Attempting to open new tab with URL: {action.url}")
-            # Create new page in same browser instance
-            new_page = await self.browser.new_page()
+            if len(self.pages) >= MAX_PAGES_PER_CONTEXT:
+                message = f"Tab limit of {MAX_PAGES_PER_CONTEXT} reached, close a tab first"
+                return self.build_action_result(False, message, None, "", "", {}, error=message)
+            
+            # Create new page in the context of the session
+            new_page = await self.session.context.new_page()
             print(f"New page created successfully")
             
             # Navigate to the URL
             await new_page.goto(action.url, wait_until="domcontentloaded")
-            await new_page.wait_for_load_state("networkidle", timeout=10000)
             print(f"Navigated to URL in new tab: {action.url}")
             
             # Add to page list and make it current
@@ -1293,6 +2118,7 @@ class BrowserAutomation:
                 url = page.url
                 await page.close()
                 self.pages.pop(action.page_id)
+                self.dom_trackers.pop(page, None)
                 
                 # Adjust current index if needed
                 if self.current_page_index >= len(self.pages):
@@ -1434,8 +2260,6 @@ class BrowserAutomation:
                 await page.evaluate("window.scrollBy(0, window.innerHeight);")
                 amount_str = "one page"
             
-            await page.wait_for_timeout(500)  # Wait for scroll to complete
-            
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"scroll_down({amount_str})")
             
@@ -1472,8 +2296,6 @@ class BrowserAutomation:
                 await page.evaluate("window.scrollBy(0, -window.innerHeight);")
                 amount_str = "one page"
             
-            await page.wait_for_timeout(500)  # Wait for scroll to complete
-            
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"scroll_up({amount_str})")
             
@@ -1678,8 +2500,6 @@ class BrowserAutomation:
                 # Then try to click the option
                 await page.click(f"text={option_text}")
             
-            await page.wait_for_timeout(500)
-            
             # Get updated state after action
             dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"select_dropdown_option({index}, '{option_text}')")
             
@@ -1705,6 +2525,97 @@ class BrowserAutomation:
                 content=None
             )
     
+    # Batches of actions
+    
+    async def check_expectations(self, step: BatchStep) -> Optional[str]:
+        """Check the assertions of a batch step, returning the first that fails"""
+        try:
+            page = await self.get_current_page()
+            if step.expect_url_contains and step.expect_url_contains not in page.url:
+                return f"Expected URL to contain '{step.expect_url_contains}', got {page.url}"
+            if step.expect_text:
+                found = await page.evaluate("(text) => !!document.body && document.body.innerText.includes(text)", step.expect_text)
+                if not found:
+                    return f"Expected text '{step.expect_text}' not found on the page"
+            if step.expect_selector and await page.locator(step.expect_selector).count() == 0:
+                return f"Expected element '{step.expect_selector}' not found on the page"
+            return None
+        except Exception as e:
+            return f"Error checking expectations: {e}"
+    
+    async def batch(self, action: BatchAction = Body(...)):
+        """Run a sequence of actions in one request
+        
+        The page is left to settle after every step, but the browser state
+        (DOM, screenshot, OCR) is only captured after steps marked as
+        checkpoints and after the last step.
+        """
+        if not action.steps or len(action.steps) > MAX_BATCH_STEPS:
+            error = f"A batch must have between 1 and {MAX_BATCH_STEPS} steps"
+            return self.build_action_result(False, error, None, "", "", {}, error=error)
+        
+        step_results = []
+        checkpoints = []
+        last_result = None
+        wait_budget = MAX_BATCH_WAIT_SECONDS
+        for index, step in enumerate(action.steps):
+            entry = self.batch_actions.get(step.action)
+            token = _defer_state.set(not step.checkpoint)
+            try:
+                if entry is None:
+                    raise ValueError(f"Unknown action: {step.action}")
+                handler, model, keywords = entry
+                try:
+                    params = model.model_validate(step.params)
+                except ValidationError as e:
+                    problems = "; ".join(f"{'.'.join(str(loc) for loc in error['loc']) or 'params'}: {error['msg']}" for error in e.errors())
+                    raise ValueError(f"Invalid parameters for {step.action}: {problems}")
+                if isinstance(params, WaitAction):
+                    # Bounded, so callers can derive a timeout for the whole batch
+                    if params.seconds > wait_budget:
+                        raise ValueError(f"The wait steps of a batch may take at most {MAX_BATCH_WAIT_SECONDS} seconds in total")
+                    wait_budget -= params.seconds
+                result = await (handler(**params.model_dump()) if keywords else handler(params))
+            except Exception as e:
+                result = self.build_action_result(False, str(e), None, "", "", {}, error=str(e))
+            finally:
+                _defer_state.reset(token)
+            
+            error = (result.error or result.message) if not result.success else await self.check_expectations(step)
+            step_results.append({
+                "index": index,
+                "action": step.action,
+                "success": error is None,
+                "message": result.message,
+                "error": error or "",
+                "url": result.url,
+                "settle_ms": result.settle_ms
+            })
+            if step.checkpoint:
+                checkpoints.append(result)
+            last_result = result
+            print(f"Batch step {index} {step.action}: {'ok' if error is None else error}")
+            if error is not None and action.stop_on_failure:
+                break
+        
+        failed = [step for step in step_results if not step["success"]]
+        message = f"Ran {len(step_results)} of {len(action.steps)} steps"
+        if failed:
+            message += f", {len(failed)} failed"
+        
+        if checkpoints and checkpoints[-1] is last_result:
+            # The last step already captured the state
+            result = checkpoints.pop()
+        else:
+            dom_state, screenshot, elements, metadata = await self.get_updated_browser_state(f"batch({len(step_results)} steps)")
+            result = self.build_action_result(True, message, dom_state, screenshot, elements, metadata)
+        result.success = not failed
+        result.message = message
+        result.error = failed[0]["error"] if failed else ""
+        result.steps = step_results
+        result.checkpoints = [checkpoint.model_dump() for checkpoint in checkpoints]
+        return result
+    
     # Drag and Drop
     
     async def drag_drop(self, action: DragDropAction = Body(...)):
@@ -1797,6 +2708,13 @@ automation_service = BrowserAutomation()
 # Create API app
 api_app = FastAPI()
 
+@api_app.middleware("http")
+async def mark_browser_api_response(request, call_next):
+    # Lets clients tell the API's own errors from those of the preview proxy in front of it
+    response = await call_next(request)
+    response.headers["X-Browser-API"] = "1"
+    return response
+
 @api_app.get("/api")
 async def health_check():
     return {"status": "ok", "message": "API server is running"}
@@ -1807,6 +2725,8 @@ api_app.include_router(automation_service.router, prefix="/api")
 async def test_browser_api():
     """Test the browser automation API functionality"""
     try:
+        # Print the elements as text and dicts
+        _elements_format.set("full")
         # Initialize browser automation
         print("\n=== Starting Browser Automation Test ===")
         await automation_service.startup()
@@ -1843,13 +2763,13 @@ async def test_browser_api():
         
         # Test OCR extraction from screenshot
         print("\n--- Testing OCR Text Extraction ---")
-        if result.ocr_text:
+        ocr_text = (await automation_service.get_ocr_text(result.screenshot_id, wait=True))["ocr_text"] if result.screenshot_id else None
+        if ocr_text:
             print("OCR text extracted from screenshot:")
             print("=== OCR TEXT START ===")
-            print(result.ocr_text)
+            print(ocr_text)
             print("=== OCR TEXT END ===")
-            print(f"OCR text length: {len(result.ocr_text)} characters")
-            print(result.ocr_text)
+            print(f"OCR text length: {len(ocr_text)} characters")
         else:
             print("No OCR text extracted from screenshot")
         
@@ -1866,10 +2786,11 @@ async def test_browser_api():
             print(f"Page title: {result.title}")
             
             # Test OCR extraction from search results
-            if result.ocr_text:
+            ocr_text = (await automation_service.get_ocr_text(result.screenshot_id, wait=True))["ocr_text"] if result.screenshot_id else None
+            if ocr_text:
                 print("\nOCR text from search results:")
                 print("=== OCR TEXT START ===")
-                print(result.ocr_text)
+                print(ocr_text)
                 print("=== OCR TEXT END ===")
             else:
                 print("\nNo OCR text extracted from search results")
@@ -1940,6 +2861,8 @@ async def test_browser_api():
 async def test_browser_api_2():
     """Test the browser automation API functionality on the chess page"""
     try:
+        # Print the elements as text and dicts
+        _elements_format.set("full")
         # Initialize browser automation
         print("\n=== Starting Browser Automation Test 2 (Chess Page) ===")
         await automation_service.startup()
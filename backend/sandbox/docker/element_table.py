@@ -0,0 +1,154 @@
+"""
+Columnar table of the interactive elements of a page.
+
+Built by the browser API (browser_api.py) and sent in the element_table field
+of action results. The backend imports this module too, so the text shown to
+the LLM is rendered by the same code on both sides. It only uses the
+standard library.
+"""
+
+from array import array
+from typing import Any, Dict, List, Optional
+
+# Constants for the table
+IDENTIFYING_ATTRIBUTES = ['id', 'href', 'name', 'value', 'type']  # Shown on every element line
+SUMMARY_ATTRIBUTES = ['id', 'href', 'src', 'alt', 'placeholder', 'name', 'role', 'title', 'type']  # Copied into interactive_elements
+
+
+class ElementTable:
+    """Interactive elements of a page stored column by column
+
+    Each element is a row: its index, a tag ID into `tags`, its viewport
+    box, flags, a span of the shared `text` buffer and the few attributes
+    the text rendering uses. Serialized as a handful of arrays, a page with
+    thousands of elements stays small, and the LLM text rendering and the
+    interactive_elements list are derived from it only when needed.
+    """
+
+    __slots__ = ("indices", "tag_ids", "tags", "boxes", "flags", "text", "text_offsets", "attributes", "display_attributes")
+
+    IN_VIEWPORT = 1
+    HAS_BOX = 2
+
+    def __init__(self, display_attributes: Optional[List[str]] = None):
+        self.indices = array('i')
+        self.tag_ids = array('H')
+        self.tags: List[str] = []
+        self.boxes = array('i')  # x, y, width, height per element
+        self.flags = array('B')
+        self.text = ""
+        self.text_offsets = array('I', [0])  # Text of element i is text[text_offsets[i]:text_offsets[i + 1]]
+        self.attributes: List[Optional[Dict[str, str]]] = []
+        self.display_attributes: List[str] = list(display_attributes or [])
+
+    @classmethod
+    def from_selector_map(cls, selector_map: Dict[int, Any], display_attributes: Optional[List[str]] = None) -> "ElementTable":
+        """Build the table in one pass over the selector map"""
+        table = cls(display_attributes)
+        kept_attributes = set(table.display_attributes) | set(IDENTIFYING_ATTRIBUTES) | set(SUMMARY_ATTRIBUTES)
+        tag_lookup: Dict[str, int] = {}
+        texts: List[str] = []
+        offset = 0
+        for index, element in selector_map.items():
+            tag_id = tag_lookup.get(element.tag_name)
+            if tag_id is None:
+                tag_id = tag_lookup[element.tag_name] = len(table.tags)
+                table.tags.append(element.tag_name)
+            table.indices.append(index)
+            table.tag_ids.append(tag_id)
+
+            coords = element.viewport_coordinates
+            flags = table.IN_VIEWPORT if element.is_in_viewport else 0
+            if coords is not None:
+                flags |= table.HAS_BOX
+                table.boxes.extend((int(coords.x), int(coords.y), int(coords.width), int(coords.height)))
+            else:
+                table.boxes.extend((0, 0, 0, 0))
+            table.flags.append(flags)
+
+            text = element.get_all_text_till_next_clickable_element()
+            texts.append(text)
+            offset += len(text)
+            table.text_offsets.append(offset)
+
+            attributes = {key: value for key, value in element.attributes.items() if key in kept_attributes}
+            table.attributes.append(attributes or None)
+        table.text = "".join(texts)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def text_of(self, row: int) -> str:
+        return self.text[self.text_offsets[row]:self.text_offsets[row + 1]]
+
+    def to_string(self) -> str:
+        """Render the elements as the text shown to the LLM"""
+        lines = []
+        for row in range(len(self)):
+            tag = self.tags[self.tag_ids[row]]
+            attributes = self.attributes[row] or {}
+            text = self.text_of(row)
+
+            display_attributes = []
+            for key, value in attributes.items():
+                if key in self.display_attributes and value and value != tag:
+                    if text and value in text:
+                        continue  # Skip if attribute value is already in the text
+                    display_attributes.append(str(value))
+
+            line = f'[{self.indices[row]}]<{tag}'
+            for attr_name in IDENTIFYING_ATTRIBUTES:
+                if attributes.get(attr_name):
+                    line += f' {attr_name}="{attributes[attr_name]}"'
+            if text:
+                line += f'> {text}'
+            elif display_attributes:
+                line += f'> {";".join(display_attributes)}'
+            else:
+                line += f'> {tag.upper()}'
+            lines.append(line + ' </>')
+        return '\n'.join(lines) if lines else "No interactive elements found"
+
+    def interactive_elements(self) -> List[Dict[str, Any]]:
+        """Expand the table into one dict per element"""
+        elements = []
+        for row in range(len(self)):
+            element_info = {
+                'index': self.indices[row],
+                'tag_name': self.tags[self.tag_ids[row]],
+                'text': self.text_of(row),
+                'is_in_viewport': bool(self.flags[row] & self.IN_VIEWPORT)
+            }
+            attributes = self.attributes[row] or {}
+            for attr_name in SUMMARY_ATTRIBUTES:
+                if attr_name in attributes:
+                    element_info[attr_name] = attributes[attr_name]
+            elements.append(element_info)
+        return elements
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.indices.tolist(),
+            "tag": self.tag_ids.tolist(),
+            "tags": self.tags,
+            "box": self.boxes.tolist(),
+            "flags": self.flags.tolist(),
+            "text": self.text,
+            "text_offsets": self.text_offsets.tolist(),
+            "attributes": self.attributes,
+            "display_attributes": self.display_attributes
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ElementTable":
+        table = cls(data.get("display_attributes"))
+        table.indices = array('i', data["index"])
+        table.tag_ids = array('H', data["tag"])
+        table.tags = list(data["tags"])
+        table.boxes = array('i', data["box"])
+        table.flags = array('B', data["flags"])
+        table.text = data["text"]
+        table.text_offsets = array('I', data["text_offsets"])
+        table.attributes = list(data["attributes"])
+        return table
@@ -0,0 +1,68 @@
+"""
+In-memory stand-in for Daytona sandboxes.
+
+FakeSandboxBackend implements the backend interface of SandboxPool without a
+Daytona server, with a configurable latency for creating a sandbox, so the
+pool can be exercised in tests and benchmarks.
+"""
+
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class FakeSandbox:
+    """Sandbox kept in memory by FakeSandboxBackend."""
+    id: str
+    password: str
+    labels: Dict[str, str] = field(default_factory=dict)
+    autostop_interval: int = 15
+    running: bool = True
+
+
+class FakeSandboxBackend:
+    """Pool backend whose sandboxes live in a dictionary."""
+
+    def __init__(self, create_latency: float = 0.0, fail_creates: int = 0):
+        """
+        Args:
+            create_latency: Seconds creating a sandbox takes
+            fail_creates: Number of initial create calls that raise
+        """
+        self.create_latency = create_latency
+        self.fail_creates = fail_creates
+        self.sandboxes: Dict[str, FakeSandbox] = {}
+        self.released: Dict[str, str] = {}  # Passwords of released sandboxes, as kept in Redis
+
+    async def create(self, password: str) -> FakeSandbox:
+        await asyncio.sleep(self.create_latency)
+        if self.fail_creates > 0:
+            self.fail_creates -= 1
+            raise RuntimeError("fake sandbox creation failed")
+        sandbox = FakeSandbox(id=str(uuid.uuid4()), password=password, labels={"pool": "warm"}, autostop_interval=60)
+        self.sandboxes[sandbox.id] = sandbox
+        return sandbox
+
+    async def checkout(self, sandbox: FakeSandbox) -> FakeSandbox:
+        if sandbox.id not in self.sandboxes:
+            raise RuntimeError("fake sandbox was removed")
+        sandbox.running = True
+        return sandbox
+
+    async def list_pooled(self) -> List[Tuple[FakeSandbox, bool]]:
+        return [(sandbox, not sandbox.running) for sandbox in self.sandboxes.values() if sandbox.labels.get("pool") == "warm"]
+
+    async def release(self, sandbox: FakeSandbox, password: str) -> None:
+        self.released[sandbox.id] = password
+
+    async def adopt(self, sandbox: FakeSandbox) -> Optional[str]:
+        return self.released.pop(sandbox.id, None)
+
+    async def assign(self, sandbox: FakeSandbox, project_id: str) -> None:
+        sandbox.labels = {"id": project_id}
+        sandbox.autostop_interval = 15
+
+    async def remove(self, sandbox: FakeSandbox) -> None:
+        self.sandboxes.pop(sandbox.id, None)
@@ -0,0 +1,308 @@
+"""
+Warm pool of pre-created sandboxes.
+
+Creating a sandbox provisions a Daytona workspace from the agent image and
+starts supervisord, which the first run of a new project had to wait for.
+The pool keeps SANDBOX_POOL_SIZE sandboxes created and started ahead of time:
+- claim() hands a ready sandbox to a project: it is relabeled with the
+  project ID, gets its normal auto-stop interval back and its VNC password is
+  returned for the project to store
+- Claimed sandboxes are replaced in the background
+- Pooled sandboxes are labeled POOL_LABELS and auto-stop after
+  POOL_AUTOSTOP_MINUTES while waiting; a stopped one is restarted when it is
+  claimed
+- Draining the pool on shutdown leaves the waiting sandboxes running and
+  releases them: their passwords are kept in Redis for POOL_AUTOSTOP_MINUTES.
+  start() adopts released sandboxes before creating new ones; taking the
+  password from Redis is atomic, so no two workers adopt the same sandbox
+- Sandboxes left behind by a worker that did not drain stop on their own;
+  start() removes stopped pooled sandboxes
+- A disabled pool (size 0) neither lists, adopts nor removes sandboxes
+
+The pool is per worker process. Sandbox operations go through a backend, so
+the pool can run against FakeSandboxBackend (sandbox/fake_backend.py) in
+tests and benchmarks.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from daytona_api_client.models.workspace_state import WorkspaceState
+
+from sandbox.sandbox import async_daytona, create_sandbox, get_or_start_sandbox
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+# Constants for the pool
+POOL_LABELS = {"pool": "warm"}           # Labels of sandboxes waiting in the pool
+DEFAULT_AUTOSTOP_MINUTES = 15            # Auto-stop interval restored when a sandbox is claimed
+POOL_AUTOSTOP_MINUTES = 60               # Auto-stop interval of sandboxes waiting in the pool
+STOPPED_STATES = (WorkspaceState.STOPPED, WorkspaceState.ARCHIVED, WorkspaceState.ERROR)
+MAX_CONCURRENT_CREATES = 2               # Sandboxes created in parallel while replenishing
+RELEASED_KEY_PREFIX = "sandbox_pool:released:"  # Redis key prefix of the password of a released sandbox
+REPLENISH_RETRY_DELAY = 30               # Seconds to wait after a failed create
+
+
+class DaytonaPoolBackend:
+    """Pool backend creating real Daytona sandboxes."""
+
+    async def create(self, password: str) -> Any:
+        sandbox = await create_sandbox(password, labels=dict(POOL_LABELS))
+        # Bounded, so a sandbox orphaned by a crashed worker does not run forever
+        await sandbox.set_autostop_interval(POOL_AUTOSTOP_MINUTES)
+        return sandbox
+
+    async def checkout(self, sandbox: Any) -> Any:
+        # Restarts the sandbox and its supervisord if it auto-stopped while waiting
+        return await get_or_start_sandbox(sandbox.id)
+
+    async def list_pooled(self) -> List[Tuple[Any, bool]]:
+        """Return (sandbox, stopped) for every sandbox labeled POOL_LABELS, by any worker."""
+        return [
+            (sandbox, sandbox.instance.state in STOPPED_STATES)
+            for sandbox in await async_daytona.list()
+            if all((sandbox.instance.labels or {}).get(k) == v for k, v in POOL_LABELS.items())
+        ]
+
+    async def release(self, sandbox: Any, password: str) -> None:
+        """Keep the password of a sandbox left running for another worker to adopt."""
+        # Past the auto-stop interval the sandbox is stopped and removed instead
+        await redis.set(f"{RELEASED_KEY_PREFIX}{sandbox.id}", password, ex=POOL_AUTOSTOP_MINUTES * 60)
+
+    async def adopt(self, sandbox: Any) -> Optional[str]:
+        """Take a released sandbox; returns its password, or None if it is not released or already taken."""
+        return await redis.getdel(f"{RELEASED_KEY_PREFIX}{sandbox.id}")
+
+    async def assign(self, sandbox: Any, project_id: str) -> None:
+        await sandbox.set_labels({"id": project_id})
+        await sandbox.set_autostop_interval(DEFAULT_AUTOSTOP_MINUTES)
+
+    async def remove(self, sandbox: Any) -> None:
+        await async_daytona.remove(sandbox)
+
+
+@dataclass
+class SandboxPoolStats:
+    """Counters of the warm sandbox pool."""
+    hits: int = 0
+    misses: int = 0
+    created: int = 0
+    failed: int = 0
+    discarded: int = 0
+    adopted: int = 0
+    reclaimed: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "created": self.created,
+            "failed": self.failed,
+            "discarded": self.discarded,
+            "adopted": self.adopted,
+            "reclaimed": self.reclaimed,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+@dataclass
+class _PooledSandbox:
+    sandbox: Any
+    password: str
+    created_at: float
+
+
+class SandboxPool:
+    """Singleton pool of ready sandboxes for new projects."""
+
+    _instance: Optional['SandboxPool'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, size: Optional[int] = None, backend: Optional[Any] = None):
+        """Initialize the pool once per process.
+
+        Args:
+            size: Number of sandboxes to keep ready. Defaults to SANDBOX_POOL_SIZE.
+            backend: Backend creating and assigning sandboxes. Defaults to DaytonaPoolBackend.
+        """
+        if self._initialized:
+            return
+        self.size = config.SANDBOX_POOL_SIZE if size is None else size
+        self.backend = backend or DaytonaPoolBackend()
+        self.counters = SandboxPoolStats()
+        self._ready: Deque[_PooledSandbox] = deque()
+        self._creating = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._closed = False
+        self._initialized = True
+
+    @property
+    def ready(self) -> int:
+        return len(self._ready)
+
+    def start(self) -> None:
+        """Adopt or remove leftover pooled sandboxes, then fill the pool, in the background."""
+        if self.size <= 0:
+            return
+        self._closed = False
+        self._spawn(self._start())
+
+    async def _start(self) -> None:
+        await self._reclaim()
+        logger.info(f"Filling warm sandbox pool to {self.size} sandboxes ({len(self._ready)} adopted)")
+        self.replenish()
+
+    def replenish(self) -> None:
+        """Start creating sandboxes until the pool is back at its target size."""
+        if self._closed:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_CREATES)
+        while len(self._ready) + self._creating < self.size:
+            self._creating += 1
+            task = asyncio.create_task(self._create_one())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _create_one(self) -> None:
+        try:
+            async with self._semaphore:
+                password = str(uuid.uuid4())
+                start = time.monotonic()
+                sandbox = await self.backend.create(password)
+                self.counters.created += 1
+                logger.info(f"Created pooled sandbox {sandbox.id} in {time.monotonic() - start:.1f}s")
+        except asyncio.CancelledError:
+            self._creating -= 1
+            raise
+        except Exception as e:
+            self.counters.failed += 1
+            self._creating -= 1
+            logger.error(f"Failed to create pooled sandbox: {str(e)}")
+            await asyncio.sleep(REPLENISH_RETRY_DELAY)
+            self.replenish()
+            return
+
+        self._creating -= 1
+        if self._closed:
+            await self._remove(sandbox)
+            return
+        self._ready.append(_PooledSandbox(sandbox, password, time.monotonic()))
+
+    async def _reclaim(self) -> None:
+        """Adopt released pooled sandboxes and remove stopped ones.
+
+        Other workers share the labels, so a running sandbox is only taken if
+        it was released; otherwise it may be waiting in another worker's pool.
+        """
+        try:
+            pooled = await self.backend.list_pooled()
+        except Exception as e:
+            logger.warning(f"Failed to list leftover pooled sandboxes: {str(e)}")
+            return
+        ours = {entry.sandbox.id for entry in self._ready}
+        for sandbox, stopped in pooled:
+            if stopped or sandbox.id in ours or len(self._ready) + self._creating >= self.size:
+                continue
+            try:
+                password = await self.backend.adopt(sandbox)
+            except Exception as e:
+                logger.warning(f"Failed to adopt pooled sandbox {sandbox.id}: {str(e)}")
+                continue
+            if password is not None and not self._closed:
+                self._ready.append(_PooledSandbox(sandbox, password, time.monotonic()))
+                self.counters.adopted += 1
+                logger.info(f"Adopted released pooled sandbox {sandbox.id}")
+
+        stopped = [sandbox for sandbox, stopped in pooled if stopped and sandbox.id not in ours]
+        if stopped:
+            logger.info(f"Removing {len(stopped)} stopped pooled sandboxes")
+            await asyncio.gather(*(self._remove(sandbox) for sandbox in stopped))
+            self.counters.reclaimed += len(stopped)
+
+    async def claim(self, project_id: str) -> Optional[Tuple[Any, str]]:
+        """Take a ready sandbox for a project.
+
+        Args:
+            project_id: Project the sandbox is assigned to
+
+        Returns:
+            (sandbox, password) of the claimed sandbox, or None if none is ready
+        """
+        try:
+            while self._ready:
+                # popleft is atomic within the event loop, so no two projects get the same sandbox
+                pooled = self._ready.popleft()
+                try:
+                    pooled.sandbox = await self.backend.checkout(pooled.sandbox)
+                    await self.backend.assign(pooled.sandbox, project_id)
+                except Exception as e:
+                    self.counters.discarded += 1
+                    logger.warning(f"Discarding pooled sandbox {pooled.sandbox.id}: {str(e)}")
+                    self._spawn(self._remove(pooled.sandbox))
+                    continue
+
+                self.counters.hits += 1
+                logger.info(f"Claimed pooled sandbox {pooled.sandbox.id} for project {project_id}")
+                return pooled.sandbox, pooled.password
+
+            if self.size > 0:
+                self.counters.misses += 1
+                logger.info(f"Warm sandbox pool is empty, project {project_id} gets a new sandbox")
+            return None
+        finally:
+            if self.size > 0:
+                self.replenish()
+
+    async def drain(self) -> None:
+        """Stop replenishing and release the sandboxes waiting in the pool to the next worker.
+
+        Released sandboxes keep running; one that cannot be released is removed.
+        """
+        if self.size <= 0:
+            return
+        self._closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Tasks cancelled before they started never ran their cleanup
+        self._creating = 0
+        while self._ready:
+            pooled = self._ready.popleft()
+            try:
+                await self.backend.release(pooled.sandbox, pooled.password)
+            except Exception as e:
+                logger.warning(f"Failed to release pooled sandbox {pooled.sandbox.id}, removing it: {str(e)}")
+                await self._remove(pooled.sandbox)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool size, occupancy and hit/miss counters."""
+        return {"size": self.size, "ready": len(self._ready), "creating": self._creating, **self.counters.as_dict()}
+
+    async def _remove(self, sandbox: Any) -> None:
+        try:
+            await self.backend.remove(sandbox)
+        except Exception as e:
+            logger.warning(f"Failed to remove pooled sandbox {sandbox.id}: {str(e)}")
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
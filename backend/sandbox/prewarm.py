@@ -0,0 +1,73 @@
+"""
+Predictive sandbox pre-warm.
+
+A stopped or archived sandbox used to be started only when the first tool
+of an agent run needed it, so the run paused mid-way for `daytona.start` and
+supervisord. SandboxPrewarmer starts a project's sandbox in the background as
+soon as an agent run is accepted, concurrently with the first LLM call:
+- The tools then find the started sandbox in SandboxHandleCache
+- Requests of the same project in this worker share one pre-warm task
+- Starts across workers are de-duplicated by the start lock of
+  get_or_start_sandbox
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.logger import logger
+
+
+class SandboxPrewarmer:
+    """Singleton running at most one background sandbox start per project."""
+
+    _instance: Optional['SandboxPrewarmer'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the pre-warmer once per process."""
+        if self._initialized:
+            return
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.scheduled = 0
+        self.joined = 0
+        self.failed = 0
+        self._initialized = True
+
+    def schedule(self, project_id: str, warm: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Start warming a project's sandbox unless that is already in progress.
+
+        Args:
+            project_id: Project whose sandbox is warmed
+            warm: Coroutine function retrieving the sandbox, starting it if needed
+
+        Returns:
+            The task warming the sandbox
+        """
+        task = self._tasks.get(project_id)
+        if task is not None and not task.done():
+            self.joined += 1
+            return task
+
+        self.scheduled += 1
+        task = asyncio.create_task(self._warm(project_id, warm))
+        self._tasks[project_id] = task
+        task.add_done_callback(lambda t: self._tasks.pop(project_id, None) if self._tasks.get(project_id) is t else None)
+        return task
+
+    async def _warm(self, project_id: str, warm: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            await warm()
+            logger.debug(f"Pre-warmed sandbox of project {project_id}")
+        except Exception as e:
+            # Not fatal: the first tool call retries and reports the error
+            self.failed += 1
+            logger.warning(f"Failed to pre-warm sandbox of project {project_id}: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return in-flight and scheduled pre-warm counters."""
+        return {"in_flight": len(self._tasks), "scheduled": self.scheduled, "joined": self.joined, "failed": self.failed}
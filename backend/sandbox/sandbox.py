@@ -1,5 +1,11 @@
+import asyncio
+import functools
 import os
-from typing import Optional
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional
 
 from daytona_sdk import Daytona, DaytonaConfig, CreateSandboxParams, Sandbox, SessionExecuteRequest
 from daytona_api_client.models.workspace_state import WorkspaceState
@@ -10,9 +16,20 @@ from utils.logger import logger
 from utils.config import config
 from utils.files_utils import clean_path
 from agentpress.thread_manager import ThreadManager
+from services import redis
+from sandbox.async_daytona import AsyncDaytona, AsyncSandbox
 
 load_dotenv()
 
+# Constants for the sandbox handle cache
+DEFAULT_HANDLE_TTL = 300            # Seconds a handle is used before its state is checked again
+DEFAULT_MAX_CACHED_HANDLES = 1024   # Maximum number of projects with a cached handle
+
+# Constants for de-duplicating sandbox starts
+START_LOCK_PREFIX = "sandbox_start_lock:"   # Redis key prefix of the per-sandbox start lock
+START_LOCK_TTL = 300                        # Seconds a start lock is held at most
+START_LOCK_POLL_INTERVAL = 1.0              # Seconds between checks while another request starts a sandbox
+
 logger.debug("Initializing Daytona sandbox configuration")
 daytona_config = DaytonaConfig(
     api_key=config.DAYTONA_API_KEY,
@@ -36,31 +53,46 @@ else:
     logger.warning("No Daytona target found in environment variables")
 
 daytona = Daytona(daytona_config)
+# Async facade running the blocking SDK calls off the event loop
+async_daytona = AsyncDaytona(daytona)
 logger.debug("Daytona client initialized")
 
-async def get_or_start_sandbox(sandbox_id: str):
-    """Retrieve a sandbox by ID, check its state, and start it if needed."""
+async def get_or_start_sandbox(sandbox_id: str) -> AsyncSandbox:
+    """Retrieve a sandbox by ID, check its state, and start it if needed.
+
+    Starts are de-duplicated across workers with a Redis lock: a caller that
+    finds the sandbox already being started waits for that start instead.
+    """
     
     logger.info(f"Getting or starting sandbox with ID: {sandbox_id}")
     
     try:
-        sandbox = daytona.get_current_sandbox(sandbox_id)
+        sandbox = await async_daytona.get_current_sandbox(sandbox_id)
         
         # Check if sandbox needs to be started
-        if sandbox.instance.state == WorkspaceState.ARCHIVED or sandbox.instance.state == WorkspaceState.STOPPED:
-            logger.info(f"Sandbox is in {sandbox.instance.state} state. Starting...")
+        if _needs_start(sandbox):
+            token = str(uuid.uuid4())
+            if not await _acquire_start_lock(sandbox_id, token):
+                logger.info(f"Sandbox {sandbox_id} is being started by another request, waiting")
+                await _wait_for_start_lock(sandbox_id)
+                return await get_or_start_sandbox(sandbox_id)
+
             try:
-                daytona.start(sandbox)
-                # Wait a moment for the sandbox to initialize
-                # sleep(5)
-                # Refresh sandbox state after starting
-                sandbox = daytona.get_current_sandbox(sandbox_id)
-                
-                # Start supervisord in a session when restarting
-                start_supervisord_session(sandbox)
+                # The previous lock holder may have started it since we checked
+                sandbox = await async_daytona.get_current_sandbox(sandbox_id)
+                if _needs_start(sandbox):
+                    logger.info(f"Sandbox is in {sandbox.instance.state} state. Starting...")
+                    await async_daytona.start(sandbox)
+                    # Refresh sandbox state after starting
+                    sandbox = await async_daytona.get_current_sandbox(sandbox_id)
+
+                    # Start supervisord in a session when restarting
+                    await start_supervisord_session(sandbox)
             except Exception as e:
                 logger.error(f"Error starting sandbox: {e}")
                 raise e
+            finally:
+                await _release_start_lock(sandbox_id, token)
         
         logger.info(f"Sandbox {sandbox_id} is ready")
         return sandbox
@@ -69,15 +101,46 @@ async def get_or_start_sandbox(sandbox_id: str):
         logger.error(f"Error retrieving or starting sandbox: {str(e)}")
         raise e
 
-def start_supervisord_session(sandbox: Sandbox):
+def _needs_start(sandbox: AsyncSandbox) -> bool:
+    return sandbox.instance.state in (WorkspaceState.ARCHIVED, WorkspaceState.STOPPED)
+
+async def _acquire_start_lock(sandbox_id: str, token: str) -> bool:
+    """Take the start lock of a sandbox; without Redis, every caller may start it."""
+    try:
+        return bool(await redis.set(f"{START_LOCK_PREFIX}{sandbox_id}", token, ex=START_LOCK_TTL, nx=True))
+    except Exception as e:
+        logger.warning(f"Could not take start lock of sandbox {sandbox_id}, starting without it: {str(e)}")
+        return True
+
+async def _release_start_lock(sandbox_id: str, token: str) -> None:
+    key = f"{START_LOCK_PREFIX}{sandbox_id}"
+    try:
+        if await redis.get(key) == token:
+            await redis.delete(key)
+    except Exception as e:
+        logger.warning(f"Could not release start lock of sandbox {sandbox_id}: {str(e)}")
+
+async def _wait_for_start_lock(sandbox_id: str) -> None:
+    """Wait until the start lock of a sandbox is released or expires."""
+    key = f"{START_LOCK_PREFIX}{sandbox_id}"
+    deadline = time.monotonic() + START_LOCK_TTL
+    while time.monotonic() < deadline:
+        await asyncio.sleep(START_LOCK_POLL_INTERVAL)
+        try:
+            if await redis.get(key) is None:
+                return
+        except Exception:
+            return
+
+async def start_supervisord_session(sandbox: AsyncSandbox):
     """Start supervisord in a session."""
     session_id = "supervisord-session"
     try:
         logger.info(f"Creating session {session_id} for supervisord")
-        sandbox.process.create_session(session_id)
+        await sandbox.process.create_session(session_id)
         
         # Execute supervisord command
-        sandbox.process.execute_session_command(session_id, SessionExecuteRequest(
+        await sandbox.process.execute_session_command(session_id, SessionExecuteRequest(
             command="exec /usr/bin/supervisord -n -c /etc/supervisor/conf.d/supervisord.conf",
             var_async=True
         ))
@@ -86,14 +149,19 @@ def start_supervisord_session(sandbox: Sandbox):
         logger.error(f"Error starting supervisord session: {str(e)}")
         raise e
 
-def create_sandbox(password: str, project_id: str = None):
-    """Create a new sandbox with all required services configured and running."""
+async def create_sandbox(password: str, project_id: str = None, labels: Optional[Dict[str, str]] = None) -> AsyncSandbox:
+    """Create a new sandbox with all required services configured and running.
+
+    Args:
+        password: VNC password of the sandbox
+        project_id: Project the sandbox belongs to, stored as its 'id' label
+        labels: Labels to set instead of the project label
+    """
     
     logger.debug("Creating new Daytona sandbox environment")
     logger.debug("Configuring sandbox with browser-use image and environment variables")
     
-    labels = None
-    if project_id:
+    if labels is None and project_id:
         logger.debug(f"Using sandbox_id as label: {project_id}")
         labels = {'id': project_id}
         
@@ -122,16 +190,201 @@ def create_sandbox(password: str, project_id: str = None):
     )
     
     # Create the sandbox
-    sandbox = daytona.create(params)
+    sandbox = await async_daytona.create(params)
     logger.debug(f"Sandbox created with ID: {sandbox.id}")
     
     # Start supervisord in a session for new sandbox
-    start_supervisord_session(sandbox)
+    await start_supervisord_session(sandbox)
     
     logger.debug(f"Sandbox environment successfully initialized")
     return sandbox
 
 
+class SandboxHandle:
+    """Cached sandbox of one project."""
+    __slots__ = ("sandbox_id", "sandbox_pass", "sandbox", "checked_at", "restarted_at")
+
+    def __init__(self, sandbox_id: str, sandbox_pass: Optional[str], sandbox: Optional[AsyncSandbox] = None, checked_at: float = 0.0):
+        self.sandbox_id = sandbox_id
+        self.sandbox_pass = sandbox_pass
+        self.sandbox = sandbox
+        self.checked_at = checked_at
+        self.restarted_at: Optional[float] = None  # When the sandbox was restarted after a failed call
+
+
+class SandboxHandleCache:
+    """Singleton cache of sandbox handles keyed by project_id.
+
+    A handle is trusted for `ttl` seconds after its state was last checked.
+    After that, the next lookup checks the sandbox state again and starts it
+    if it was stopped or archived. Concurrent lookups for the same project
+    share a single project query and state check.
+
+    A filesystem, process or preview call that fails on a cached sandbox
+    within the TTL has its state checked right away: if it was stopped or
+    archived, the handle is evicted, the sandbox started again and the call
+    retried.
+    """
+
+    _instance: Optional['SandboxHandleCache'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, ttl: float = DEFAULT_HANDLE_TTL, max_projects: int = DEFAULT_MAX_CACHED_HANDLES):
+        """Initialize the cache once per process.
+
+        Args:
+            ttl: Seconds a handle is used without checking the sandbox state
+            max_projects: Maximum number of cached projects
+        """
+        if self._initialized:
+            return
+        self.ttl = ttl
+        self.max_projects = max_projects
+        self._handles: 'OrderedDict[str, SandboxHandle]' = OrderedDict()
+        self._projects_by_sandbox: Dict[str, str] = {}
+        self._locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.checks = 0
+        self.lookups = 0
+        self._initialized = True
+
+    async def get(self, client, project_id: str) -> Optional[SandboxHandle]:
+        """Return the running sandbox of a project.
+
+        Args:
+            client: The Supabase client
+            project_id: ID of the project
+
+        Returns:
+            The project's sandbox handle, or None if the project has no sandbox
+
+        Raises:
+            ValueError: If the project does not exist
+        """
+        handle = self._fresh(project_id)
+        if handle is not None:
+            self.hits += 1
+            return handle
+
+        async with self._lock(project_id):
+            # Another caller may have refreshed the handle while we waited
+            handle = self._fresh(project_id)
+            if handle is not None:
+                self.hits += 1
+                return handle
+
+            handle = self._handles.get(project_id)
+            if handle is None:
+                self.lookups += 1
+                project = await client.table('projects').select('sandbox').eq('project_id', project_id).execute()
+                if not project.data or len(project.data) == 0:
+                    raise ValueError(f"Project {project_id} not found")
+                sandbox_info = project.data[0].get('sandbox') or {}
+                if not sandbox_info.get('id'):
+                    return None
+                handle = SandboxHandle(sandbox_info['id'], sandbox_info.get('pass'))
+
+            self.checks += 1
+            try:
+                sandbox = await get_or_start_sandbox(handle.sandbox_id)
+            except Exception:
+                self.invalidate(project_id)
+                raise
+            return self.put(project_id, sandbox, handle.sandbox_id, handle.sandbox_pass)
+
+    def put(self, project_id: str, sandbox: AsyncSandbox, sandbox_id: str, sandbox_pass: Optional[str]) -> SandboxHandle:
+        """Cache a sandbox that was just retrieved, started or created."""
+        self.invalidate(project_id)
+        handle = SandboxHandle(sandbox_id, sandbox_pass, sandbox, time.monotonic())
+        sandbox.recover = functools.partial(self._recover, project_id, sandbox_id)
+        self._handles[project_id] = handle
+        self._projects_by_sandbox[sandbox_id] = project_id
+        while len(self._handles) > self.max_projects:
+            _, evicted = self._handles.popitem(last=False)
+            self._projects_by_sandbox.pop(evicted.sandbox_id, None)
+        return handle
+
+    def prime(self, project_id: str, sandbox_id: str, sandbox_pass: Optional[str]) -> None:
+        """Record a project's sandbox from an already fetched project row.
+
+        The next get() then only checks the sandbox state instead of querying
+        the project again.
+        """
+        if project_id not in self._handles:
+            self._handles[project_id] = SandboxHandle(sandbox_id, sandbox_pass)
+            self._projects_by_sandbox[sandbox_id] = project_id
+
+    def has(self, project_id: str) -> bool:
+        """Whether the sandbox of a project is known, fresh or not."""
+        return project_id in self._handles
+
+    def project_for_sandbox(self, sandbox_id: str) -> Optional[str]:
+        """ID of the cached project that owns a sandbox, if known."""
+        return self._projects_by_sandbox.get(sandbox_id)
+
+    def invalidate(self, project_id: str) -> None:
+        """Drop the cached handle of a project."""
+        handle = self._handles.pop(project_id, None)
+        if handle is not None:
+            self._projects_by_sandbox.pop(handle.sandbox_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache occupancy and lookup counters."""
+        return {"projects": len(self._handles), "hits": self.hits, "checks": self.checks, "lookups": self.lookups}
+
+    async def _recover(self, project_id: str, sandbox_id: str, since: float) -> Optional[AsyncSandbox]:
+        """Restart a cached sandbox that a failed call found stopped or archived.
+
+        Args:
+            project_id: Project the sandbox was cached for
+            sandbox_id: ID of the sandbox
+            since: When the failed call started; a restart after that is reused
+
+        Returns:
+            The restarted sandbox, or None if the sandbox was running and the
+            failure has another cause
+        """
+        async with self._lock(project_id):
+            handle = self._handles.get(project_id)
+            if handle is not None and handle.sandbox_id == sandbox_id and handle.restarted_at is not None and handle.restarted_at >= since:
+                # Another call hit the same stop and already restarted it
+                return handle.sandbox
+
+            current = await async_daytona.get_current_sandbox(sandbox_id)
+            if not _needs_start(current):
+                return None
+
+            logger.warning(f"Sandbox {sandbox_id} of project {project_id} is {current.instance.state}, restarting it")
+            cached = handle is not None and handle.sandbox_id == sandbox_id
+            if cached:
+                self.invalidate(project_id)
+            self.checks += 1
+            sandbox = await get_or_start_sandbox(sandbox_id)
+            if cached:
+                # Cached again only if it was cached before: the handle keeps the password
+                self.put(project_id, sandbox, sandbox_id, handle.sandbox_pass).restarted_at = time.monotonic()
+            return sandbox
+
+    def _lock(self, project_id: str) -> asyncio.Lock:
+        lock = self._locks.get(project_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[project_id] = lock
+        return lock
+
+    def _fresh(self, project_id: str) -> Optional[SandboxHandle]:
+        handle = self._handles.get(project_id)
+        if handle is None or handle.sandbox is None or time.monotonic() - handle.checked_at > self.ttl:
+            return None
+        self._handles.move_to_end(project_id)
+        return handle
+
+
 class SandboxToolsBase(Tool):
     """Base class for all sandbox tools that provides project-based sandbox access."""
     
@@ -147,53 +400,42 @@ class SandboxToolsBase(Tool):
         self._sandbox_id = None
         self._sandbox_pass = None
 
-    async def _ensure_sandbox(self) -> Sandbox:
-        """Ensure we have a valid sandbox instance, retrieving it from the project if needed."""
-        if self._sandbox is None:
-            try:
-                # Get database client
-                client = await self.thread_manager.db.client
-                
-                # Get project data
-                project = await client.table('projects').select('*').eq('project_id', self.project_id).execute()
-                if not project.data or len(project.data) == 0:
-                    raise ValueError(f"Project {self.project_id} not found")
-                
-                project_data = project.data[0]
-                sandbox_info = project_data.get('sandbox', {})
-                
-                if not sandbox_info.get('id'):
-                    raise ValueError(f"No sandbox found for project {self.project_id}")
-                
-                # Store sandbox info
-                self._sandbox_id = sandbox_info['id']
-                self._sandbox_pass = sandbox_info.get('pass')
-                
-                # Get or start the sandbox
-                self._sandbox = await get_or_start_sandbox(self._sandbox_id)
+    async def _ensure_sandbox(self) -> AsyncSandbox:
+        """Ensure we have a valid sandbox instance, retrieving it from the project's cached handle."""
+        try:
+            # Shared by all tools of the project; only queries the project and
+            # checks the sandbox state when the cached handle has expired
+            client = await self.thread_manager.db.client
+            handle = await SandboxHandleCache().get(client, self.project_id)
+            if handle is None:
+                raise ValueError(f"No sandbox found for project {self.project_id}")
+
+            self._sandbox_id = handle.sandbox_id
+            self._sandbox_pass = handle.sandbox_pass
+            self._sandbox = handle.sandbox
+
+            # # Log URLs if not already printed
+            # if not SandboxToolsBase._urls_printed:
+            #     vnc_link = self._sandbox.get_preview_link(6080)
+            #     website_link = self._sandbox.get_preview_link(8080)
                 
-                # # Log URLs if not already printed
-                # if not SandboxToolsBase._urls_printed:
-                #     vnc_link = self._sandbox.get_preview_link(6080)
-                #     website_link = self._sandbox.get_preview_link(8080)
-                    
-                #     vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link)
-                #     website_url = website_link.url if hasattr(website_link, 'url') else str(website_link)
-                    
-                #     print("\033[95m***")
-                #     print(f"VNC URL: {vnc_url}")
-                #     print(f"Website URL: {website_url}")
-                #     print("***\033[0m")
-                #     SandboxToolsBase._urls_printed = True
+            #     vnc_url = vnc_link.url if hasattr(vnc_link, 'url') else str(vnc_link)
+            #     website_url = website_link.url if hasattr(website_link, 'url') else str(website_link)
                 
-            except Exception as e:
-                logger.error(f"Error retrieving sandbox for project {self.project_id}: {str(e)}", exc_info=True)
-                raise e
+            #     print("\033[95m***")
+            #     print(f"VNC URL: {vnc_url}")
+            #     print(f"Website URL: {website_url}")
+            #     print("***\033[0m")
+            #     SandboxToolsBase._urls_printed = True
+            
+        except Exception as e:
+            logger.error(f"Error retrieving sandbox for project {self.project_id}: {str(e)}", exc_info=True)
+            raise e
         
         return self._sandbox
 
     @property
-    def sandbox(self) -> Sandbox:
+    def sandbox(self) -> AsyncSandbox:
         """Get the sandbox instance, ensuring it exists."""
         if self._sandbox is None:
             raise RuntimeError("Sandbox not initialized. Call _ensure_sandbox() first.")
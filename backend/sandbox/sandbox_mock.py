@@ -27,10 +27,10 @@ class Sandbox:
     def get_password(self):
         return "mock-password"
         
-def create_sandbox(*args, **kwargs):
+async def create_sandbox(*args, **kwargs):
     """Create a mock sandbox."""
     return Sandbox()
     
-def get_or_start_sandbox(*args, **kwargs):
+async def get_or_start_sandbox(*args, **kwargs):
     """Get or start a mock sandbox."""
     return Sandbox()
@@ -5,29 +5,41 @@ This module provides a unified interface for making API calls to different LLM p
 (OpenAI, Anthropic, Groq, etc.) using LiteLLM. It includes support for:
 - Streaming responses
 - Tool calls and function calling
-- Retry logic with exponential backoff
+- Retries with jittered backoff, request hedging and failover across equivalent models
 - Model-specific configurations
 - Comprehensive error handling and logging
 """
 
-from typing import Union, Dict, Any, Optional, AsyncGenerator, List
+from typing import Union, Dict, Any, Optional, AsyncGenerator, List, Callable, Awaitable
 import os
 import json
 import asyncio
 from openai import OpenAIError
+import httpx
 import litellm
+from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
 from utils.logger import logger
 from utils.config import config
+from services.llm_router import LLMRouter, NON_RETRYABLE_ERRORS
+from services.llm_governor import LLMGovernor, GovernorLease, CHARS_PER_TOKEN
 from datetime import datetime
+import time
 import traceback
+from dataclasses import dataclass
 
 # litellm.set_verbose=True
 litellm.modify_params=True
 
 # Constants
 MAX_RETRIES = 3
-RATE_LIMIT_DELAY = 30
-RETRY_DELAY = 5
+MAX_CACHE_BREAKPOINTS = 4      # Anthropic allows at most 4 cache_control blocks per request
+CACHE_BREAKPOINT_STRIDE = 8    # Spacing of the grid breakpoint that stays fixed across iterations
+# Providers whose LiteLLM handlers accept a shared AsyncHTTPHandler as `client`;
+# OpenAI-compatible providers use litellm.aclient_session instead
+HTTP_HANDLER_PROVIDERS = {"anthropic", "bedrock"}
+
+# Shared HTTP handlers keyed by (provider, api_base), each with the event loop it belongs to
+_http_clients: Dict[tuple, tuple] = {}
 
 class LLMError(Exception):
     """Base exception for LLM-related errors."""
@@ -66,12 +78,188 @@ def setup_api_keys() -> None:
     else:
         logger.warning(f"Missing AWS credentials for Bedrock integration - access_key: {bool(aws_access_key)}, secret_key: {bool(aws_secret_key)}, region: {aws_region}")
 
-async def handle_error(error: Exception, attempt: int, max_attempts: int) -> None:
-    """Handle API errors with appropriate delays and logging."""
-    delay = RATE_LIMIT_DELAY if isinstance(error, litellm.exceptions.RateLimitError) else RETRY_DELAY
-    logger.warning(f"Error on attempt {attempt + 1}/{max_attempts}: {str(error)}")
-    logger.debug(f"Waiting {delay} seconds before retry...")
-    await asyncio.sleep(delay)
+def plan_cache_breakpoints(messages: List[Dict[str, Any]], stable_prefix_len: Optional[int] = None) -> List[int]:
+    """Choose message indices for Anthropic cache_control breakpoints.
+
+    Breakpoints are only placed within the stable prefix, so the cached bytes
+    are the same on the next iteration or auto-continue:
+    - The system prompt, which is shared by every request of a run
+    - The last message on a fixed grid of CACHE_BREAKPOINT_STRIDE messages,
+      which stays put for several iterations and is read back from the cache
+    - The last stable message, which writes the full history to the cache for
+      the next request to read
+
+    Args:
+        messages: Messages of the request
+        stable_prefix_len: Number of leading messages that do not change between
+            iterations. Defaults to all messages.
+
+    Returns:
+        Sorted message indices, at most MAX_CACHE_BREAKPOINTS
+    """
+    stable_end = len(messages) if stable_prefix_len is None else max(0, min(stable_prefix_len, len(messages)))
+    if stable_end == 0:
+        return []
+
+    breakpoints = set()
+    if messages[0].get("role") == "system":
+        breakpoints.add(0)
+    last_stable = stable_end - 1
+    grid = (last_stable // CACHE_BREAKPOINT_STRIDE) * CACHE_BREAKPOINT_STRIDE
+    if grid > 0:
+        breakpoints.add(grid)
+    breakpoints.add(last_stable)
+    return sorted(breakpoints)[:MAX_CACHE_BREAKPOINTS]
+
+def apply_cache_control(messages: List[Dict[str, Any]], message_idx: int) -> None:
+    """Mark the last content block of a message as a cache breakpoint.
+
+    The message is replaced by a copy so the original stays unchanged.
+    """
+    message = messages[message_idx]
+    content = message.get("content")
+
+    if isinstance(content, str) and content:
+        new_content = [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+    elif isinstance(content, list) and content and isinstance(content[-1], dict):
+        new_content = list(content)
+        new_content[-1] = {**content[-1], "cache_control": {"type": "ephemeral"}}
+    else:
+        return
+    messages[message_idx] = {**message, "content": new_content}
+
+@dataclass
+class PromptCacheStats:
+    """Prompt cache usage aggregated over the requests of a run."""
+    requests: int = 0
+    prompt_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cache_read_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def record(self, usage: Any) -> Dict[str, int]:
+        """Add the usage of one response and return its cache figures."""
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        cache_read = getattr(usage, "cache_read_input_tokens", None)
+        if cache_read is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cache_read = getattr(details, "cached_tokens", 0) if details else 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cache_read_tokens += cache_read or 0
+        self.cache_write_tokens += cache_write
+        return {"prompt_tokens": prompt_tokens, "cache_read_tokens": cache_read or 0, "cache_write_tokens": cache_write}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+class _PooledHTTPHandler(AsyncHTTPHandler):
+    """AsyncHTTPHandler that wraps a shared httpx client instead of creating its own."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self._pooled_client = client
+        super().__init__(timeout=client.timeout, client_alias="pooled")
+
+    def create_client(self, *args, **kwargs) -> httpx.AsyncClient:
+        return self._pooled_client
+
+def _create_http_client() -> httpx.AsyncClient:
+    """Create a keep-alive HTTP client sized by the LLM_HTTP_* settings."""
+    http2 = config.LLM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("LLM_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(config.LLM_HTTP_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.LLM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+def _get_pooled_handler(provider: str, api_base: Optional[str]) -> _PooledHTTPHandler:
+    """Return the shared HTTP handler for a provider and base URL in the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = (provider, api_base)
+    entry = _http_clients.get(key)
+    if entry is None or entry[0] is not loop:
+        # Connections cannot be shared across event loops
+        if entry is not None:
+            _close_stale_client(*entry)
+        entry = (loop, _PooledHTTPHandler(_create_http_client()))
+        _http_clients[key] = entry
+        logger.debug(f"Created pooled HTTP client for provider {provider} ({api_base or 'default base URL'})")
+    return entry[1]
+
+def _close_stale_client(loop: asyncio.AbstractEventLoop, handler: _PooledHTTPHandler) -> None:
+    """Close the client of a handler replaced because it belongs to another event loop."""
+    client = handler._pooled_client
+    if loop.is_running() and not loop.is_closed():
+        # Its connections must be closed on the loop they were opened in
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        return
+
+    async def close() -> None:
+        try:
+            await client.aclose()
+        except Exception as e:
+            # Connections of a closed loop are already gone with it
+            logger.debug(f"Error closing stale HTTP client: {str(e)}")
+
+    asyncio.get_running_loop().create_task(close())
+
+def get_llm_http_client(model_name: str, api_base: Optional[str] = None) -> Optional[AsyncHTTPHandler]:
+    """Return a pooled HTTP client to pass to litellm.acompletion for a model.
+
+    Providers handled with AsyncHTTPHandler (Anthropic, Bedrock) get a handler
+    wrapping the shared client. OpenAI-compatible providers (OpenAI,
+    OpenRouter, ...) build their SDK client from litellm.aclient_session,
+    which is pointed at the shared client here, and None is returned.
+
+    litellm has one aclient_session for all OpenAI-compatible providers, so
+    they share one client whatever their base URL. httpx keeps a separate
+    connection pool per origin inside a client, so connections are not mixed
+    across base URLs; only the LLM_HTTP_MAX_CONNECTIONS cap is shared, which
+    bounds the worker's OpenAI-compatible connections as a whole.
+    """
+    try:
+        _, provider, _, _ = litellm.get_llm_provider(model=model_name, api_base=api_base)
+    except Exception:
+        return None
+
+    if provider in HTTP_HANDLER_PROVIDERS:
+        return _get_pooled_handler(provider, api_base)
+
+    session = _get_pooled_handler("openai_compatible", None).client
+    if litellm.aclient_session is not session:
+        litellm.aclient_session = session
+    return None
+
+async def close_llm_http_clients() -> None:
+    """Close all pooled LLM HTTP clients."""
+    for key, (_, handler) in list(_http_clients.items()):
+        try:
+            await handler.client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing HTTP client for {key}: {str(e)}")
+    _http_clients.clear()
+    litellm.aclient_session = None
 
 def prepare_params(
     messages: List[Dict[str, Any]],
@@ -87,9 +275,16 @@ def prepare_params(
     top_p: Optional[float] = None,
     model_id: Optional[str] = None,
     enable_thinking: Optional[bool] = False,
-    reasoning_effort: Optional[str] = 'low'
+    reasoning_effort: Optional[str] = 'low',
+    stable_prefix_len: Optional[int] = None
 ) -> Dict[str, Any]:
-    """Prepare parameters for the API call."""
+    """Prepare parameters for the API call.
+
+    For Anthropic models, prompt cache breakpoints are planned with
+    plan_cache_breakpoints. stable_prefix_len is the number of leading
+    messages that do not change between iterations; anything after it
+    (e.g. a temporary browser state message) is left out of the cached prefix.
+    """
     params = {
         "model": model_name,
         "messages": messages,
@@ -157,74 +352,26 @@ def prepare_params(
             params["model_id"] = "arn:aws:bedrock:us-west-2:935064898258:inference-profile/us.anthropic.claude-3-7-sonnet-20250219-v1:0"
             logger.debug(f"Auto-set model_id for Claude 3.7 Sonnet: {params['model_id']}")
 
-    # Apply Anthropic prompt caching (minimal implementation)
+    # Apply Anthropic prompt caching
     # Check model name *after* potential modifications (like adding bedrock/ prefix)
     effective_model_name = params.get("model", model_name) # Use model from params if set, else original
     if "claude" in effective_model_name.lower() or "anthropic" in effective_model_name.lower():
-        messages = params["messages"] # Direct reference, modification affects params
+        messages = params["messages"]
 
         # Ensure messages is a list
         if not isinstance(messages, list):
             return params # Return early if messages format is unexpected
 
-        # 1. Process the first message if it's a system prompt with string content
-        if messages and messages[0].get("role") == "system":
-            content = messages[0].get("content")
-            if isinstance(content, str):
-                # Wrap the string content in the required list structure
-                messages[0]["content"] = [
-                    {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
-                ]
-            elif isinstance(content, list):
-                 # If content is already a list, check if the first text block needs cache_control
-                 for item in content:
-                     if isinstance(item, dict) and item.get("type") == "text":
-                         if "cache_control" not in item:
-                             item["cache_control"] = {"type": "ephemeral"}
-                             break # Apply to the first text block only for system prompt
-
-        # 2. Find and process relevant user and assistant messages
-        last_user_idx = -1
-        second_last_user_idx = -1
-        last_assistant_idx = -1
-
-        for i in range(len(messages) - 1, -1, -1):
-            role = messages[i].get("role")
-            if role == "user":
-                if last_user_idx == -1:
-                    last_user_idx = i
-                elif second_last_user_idx == -1:
-                    second_last_user_idx = i
-            elif role == "assistant":
-                if last_assistant_idx == -1:
-                    last_assistant_idx = i
-
-            # Stop searching if we've found all needed messages
-            if last_user_idx != -1 and second_last_user_idx != -1 and last_assistant_idx != -1:
-                 break
-
-        # Helper function to apply cache control
-        def apply_cache_control(message_idx: int, message_role: str):
-            if message_idx == -1:
-                return
-
-            message = messages[message_idx]
-            content = message.get("content")
-
-            if isinstance(content, str):
-                message["content"] = [
-                    {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
-                ]
-            elif isinstance(content, list):
-                for item in content:
-                    if isinstance(item, dict) and item.get("type") == "text":
-                        if "cache_control" not in item:
-                           item["cache_control"] = {"type": "ephemeral"}
-
-        # Apply cache control to the identified messages
-        apply_cache_control(last_user_idx, "last user")
-        apply_cache_control(second_last_user_idx, "second last user")
-        apply_cache_control(last_assistant_idx, "last assistant")
+        # Work on a copy so the caller's messages are not modified between iterations
+        messages = list(messages)
+        params["messages"] = messages
+        for idx in plan_cache_breakpoints(messages, stable_prefix_len):
+            apply_cache_control(messages, idx)
+        logger.debug(f"Placed prompt cache breakpoints for {len(messages)} messages (stable prefix: {stable_prefix_len})")
+
+        if stream:
+            # Usage, including cache read/write tokens, arrives in the final chunk
+            params["stream_options"] = {"include_usage": True}
 
     # Add reasoning_effort for Anthropic models if enabled
     use_thinking = enable_thinking if enable_thinking is not None else False
@@ -238,6 +385,182 @@ def prepare_params(
 
     return params
 
+class _GovernedStream:
+    """Stream whose first chunk has already been received.
+
+    Chunks are passed to the governor lease, which is released when the
+    stream ends, fails or is closed.
+    """
+
+    def __init__(self, iterator: Any, first_chunk: Any, lease: GovernorLease):
+        self._iterator = iterator
+        self._pending = [first_chunk] if first_chunk is not None else []
+        self._lease = lease
+        if first_chunk is not None:
+            lease.observe_chunk(first_chunk)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._pending:
+            return self._pending.pop()
+        if self._lease is None:
+            raise StopAsyncIteration
+        try:
+            chunk = await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._release()
+            raise
+        except BaseException:
+            self._release(failed=True)
+            raise
+        self._lease.observe_chunk(chunk)
+        return chunk
+
+    async def aclose(self) -> None:
+        self._release()
+        # litellm's stream wrapper has no close method; close the provider
+        # stream underneath it so the HTTP connection goes back to the pool
+        for stream in (self._iterator, getattr(self._iterator, "completion_stream", None)):
+            close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+            if close is None:
+                continue
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+            return
+
+    def _release(self, failed: bool = False) -> None:
+        if self._lease is not None:
+            self._lease.release(failed=failed)
+            self._lease = None
+
+    def __del__(self):
+        # A stream that is dropped unread must not keep its concurrency slot
+        self._release()
+
+async def _send(
+    router: LLMRouter,
+    model: str,
+    params: Dict[str, Any],
+    estimated_tokens: int,
+    account_id: Optional[str],
+    sent: Optional[asyncio.Event] = None
+) -> Any:
+    """Send one request under a governor lease and record its latency or failure with the router.
+
+    For streams, the latency is the time to the first chunk, which has been
+    received when this returns; the lease is held until the stream ends.
+    If given, sent is set once the lease is acquired and the request goes out.
+    """
+    lease = await LLMGovernor().acquire(model, estimated_tokens, account_id)
+    if sent is not None:
+        sent.set()
+    # Reuse pooled keep-alive connections instead of a fresh client per request
+    http_client = get_llm_http_client(params["model"], params.get("api_base"))
+    start = time.monotonic()
+    try:
+        response = await litellm.acompletion(**params, client=http_client)
+        if params.get("stream"):
+            iterator = response.__aiter__()
+            try:
+                first_chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                first_chunk = None
+            response = _GovernedStream(iterator, first_chunk, lease)
+        else:
+            lease.record_usage(getattr(response, "usage", None))
+            lease.release()
+    except (asyncio.CancelledError, *NON_RETRYABLE_ERRORS):
+        # Cancelled hedges and rejected requests say nothing about provider health
+        lease.release(failed=True)
+        raise
+    except Exception as e:
+        lease.release(failed=True)
+        router.record_failure(model, e)
+        raise
+    router.record_success(model, time.monotonic() - start)
+    return response
+
+async def _send_hedged(
+    router: LLMRouter,
+    model: str,
+    hedge_model: str,
+    send: Callable[[str, Optional[asyncio.Event]], Awaitable[Any]]
+) -> Any:
+    """Send a request, hedging it with a second one if it is slower than usual.
+
+    If the model's p95 time to first token passes without a response, the
+    same request is sent to hedge_model (an equivalent model, or the same one)
+    and whichever responds first is used. The other request is cancelled.
+    The deadline starts once the request has left the governor queue.
+
+    Args:
+        router: Router providing the hedge deadline
+        model: Model the request is sent to
+        hedge_model: Model a hedged request is sent to
+        send: Coroutine function sending the request to a given model and
+            setting the given event, if any, once the request is sent
+    """
+    deadline = router.hedge_deadline(model)
+    if deadline is None:
+        return await send(model, None)
+
+    sent = asyncio.Event()
+    tasks = [asyncio.create_task(send(model, sent))]
+    primary = tasks[0]
+    winner = None
+    try:
+        # Time spent waiting for a governor slot does not count towards the deadline
+        started = asyncio.create_task(sent.wait())
+        try:
+            await asyncio.wait({primary, started}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            started.cancel()
+        done, _ = await asyncio.wait({primary}, timeout=deadline)
+        if done:
+            winner = primary
+            return primary.result()
+
+        logger.info(f"No response from {model} after {deadline:.1f}s, hedging with {hedge_model}")
+        router.record_hedge(model)
+        tasks.append(asyncio.create_task(send(hedge_model, None)))
+        pending = set(tasks)
+        error = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    # Both may complete in the same wait; the primary wins ties
+                    if winner is None or task is primary:
+                        winner = task
+                else:
+                    error = task.exception()
+        if winner is None:
+            raise error
+        return winner.result()
+    finally:
+        # Runs on cancellation of the caller too, so no request is left behind
+        losers = [task for task in tasks if task is not winner]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+        # Close every losing response, including one that completed despite being cancelled
+        for task in losers:
+            if not task.cancelled() and task.exception() is None:
+                await _close_response(task.result())
+
+async def _close_response(response: Any) -> None:
+    """Close a response that will not be used, releasing its stream and governor lease."""
+    close = getattr(response, "aclose", None)
+    if close is None:
+        return
+    try:
+        await close()
+    except Exception as e:
+        logger.warning(f"Error closing unused LLM response: {str(e)}")
+
 async def make_llm_api_call(
     messages: List[Dict[str, Any]],
     model_name: str,
@@ -252,10 +575,19 @@ async def make_llm_api_call(
     top_p: Optional[float] = None,
     model_id: Optional[str] = None,
     enable_thinking: Optional[bool] = False,
-    reasoning_effort: Optional[str] = 'low'
+    reasoning_effort: Optional[str] = 'low',
+    stable_prefix_len: Optional[int] = None,
+    estimated_tokens: Optional[int] = None,
+    account_id: Optional[str] = None
 ) -> Union[Dict[str, Any], AsyncGenerator]:
     """
     Make an API call to a language model using LiteLLM.
+
+    Failed attempts fail over to equivalent models on other providers (see
+    LLMRouter.candidates) and otherwise retry the same model after a jittered
+    delay or the provider's Retry-After. With LLM_HEDGE_ENABLED, a request
+    slower than the model's p95 time to first token is hedged. Every request
+    waits for a concurrency slot and token budget from the LLMGovernor.
     
     Args:
         messages: List of message dictionaries for the conversation
@@ -272,6 +604,10 @@ async def make_llm_api_call(
         model_id: Optional ARN for Bedrock inference profiles
         enable_thinking: Whether to enable thinking
         reasoning_effort: Level of reasoning effort
+        stable_prefix_len: Number of leading messages that are identical across iterations
+        estimated_tokens: Expected prompt tokens, charged to the model's token budget.
+            Estimated from the message size if not given.
+        account_id: Account the call is made for, used for fair queuing by the LLMGovernor
         
     Returns:
         Union[Dict[str, Any], AsyncGenerator]: API response or stream
@@ -282,40 +618,69 @@ async def make_llm_api_call(
     """
     # debug <timestamp>.json messages 
     logger.debug(f"Making LLM API call to model: {model_name} (Thinking: {enable_thinking}, Effort: {reasoning_effort})")
-    params = prepare_params(
-        messages=messages,
-        model_name=model_name,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        response_format=response_format,
-        tools=tools,
-        tool_choice=tool_choice,
-        api_key=api_key,
-        api_base=api_base,
-        stream=stream,
-        top_p=top_p,
-        model_id=model_id,
-        enable_thinking=enable_thinking,
-        reasoning_effort=reasoning_effort
-    )
+    router = LLMRouter()
+    candidates = router.candidates(model_name)
+    if estimated_tokens is None:
+        estimated_tokens = len(json.dumps(messages, default=str)) // CHARS_PER_TOKEN
+
+    def params_for(model: str) -> Dict[str, Any]:
+        # Overrides given by the caller only apply to the requested model
+        requested = model == model_name
+        return prepare_params(
+            messages=messages,
+            model_name=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format=response_format,
+            tools=tools,
+            tool_choice=tool_choice,
+            api_key=api_key if requested else None,
+            api_base=api_base if requested else None,
+            stream=stream,
+            top_p=top_p,
+            model_id=model_id if requested else None,
+            enable_thinking=enable_thinking,
+            reasoning_effort=reasoning_effort,
+            stable_prefix_len=stable_prefix_len
+        )
+
     last_error = None
+    delay = 0.0
+    previous_model = None
     for attempt in range(MAX_RETRIES):
+        model = candidates[attempt % len(candidates)]
+        if model == previous_model:
+            delay = router.retry_delay(last_error, delay)
+            logger.warning(f"Error on attempt {attempt}/{MAX_RETRIES}: {str(last_error)}")
+            logger.debug(f"Waiting {delay:.1f} seconds before retry...")
+            await asyncio.sleep(delay)
+        elif previous_model is not None:
+            logger.warning(f"Error on attempt {attempt}/{MAX_RETRIES} with {previous_model}, failing over to {model}: {str(last_error)}")
+
         try:
-            logger.debug(f"Attempt {attempt + 1}/{MAX_RETRIES}")
+            logger.debug(f"Attempt {attempt + 1}/{MAX_RETRIES} with model {model}")
             # logger.debug(f"API request parameters: {json.dumps(params, indent=2)}")
-            
-            response = await litellm.acompletion(**params)
-            logger.debug(f"Successfully received API response from {model_name}")
+            hedge_model = candidates[(attempt + 1) % len(candidates)]
+            response = await _send_hedged(
+                router, model, hedge_model,
+                lambda m, sent: _send(router, m, params_for(m), estimated_tokens, account_id, sent)
+            )
+            logger.debug(f"Successfully received API response from {model}")
             logger.debug(f"Response: {response}")
             return response
-            
-        except (litellm.exceptions.RateLimitError, OpenAIError, json.JSONDecodeError) as e:
+
+        except NON_RETRYABLE_ERRORS as e:
+            logger.error(f"API call to {model} was rejected: {str(e)}")
+            raise LLMError(f"API call failed: {str(e)}")
+
+        except (litellm.exceptions.RateLimitError, OpenAIError, httpx.HTTPError, json.JSONDecodeError) as e:
             last_error = e
-            await handle_error(e, attempt, MAX_RETRIES)
-            
+
         except Exception as e:
             logger.error(f"Unexpected error during API call: {str(e)}", exc_info=True)
             raise LLMError(f"API call failed: {str(e)}")
+
+        previous_model = model
     
     error_msg = f"Failed to make API call after {MAX_RETRIES} attempts"
     if last_error:
@@ -0,0 +1,339 @@
+"""
+Concurrency and token rate governor for LLM calls.
+
+Bursts of agent runs in one worker would otherwise send every request to the
+provider at once, collect 429s and multiply the load with retries. Every
+request made through make_llm_api_call first takes a lease from the governor:
+- Each model ID has a concurrency limit; waiting requests are served
+  round-robin per account, so one busy account cannot starve the others
+- Each model ID has a tokens-per-minute budget, charged with an estimate of
+  the request's tokens up front and corrected with the actual usage once the
+  response is complete
+- With LLM_GOVERNOR_REDIS, the token budget is shared by all workers through
+  a per-minute counter in Redis; concurrency limits stay per process
+
+Limits are matched by model ID prefix from LLM_RATE_LIMITS, e.g.
+{"anthropic/": {"concurrency": 32, "tokens_per_minute": 400000}}.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from services import redis
+from utils.config import config
+from utils.logger import logger
+
+# Constants for default limits
+DEFAULT_MAX_CONCURRENCY = 64        # Concurrent requests per model ID when not configured
+DEFAULT_TOKENS_PER_MINUTE = 0       # Token budget per model ID when not configured; 0 is unlimited
+DEFAULT_ACCOUNT = "default"         # Fairness key of requests without an account
+CHARS_PER_TOKEN = 4                 # Rough size of a token when no usage is reported
+REDIS_WINDOW_TTL = 120              # Seconds a Redis per-minute counter is kept
+
+
+class _FairLimiter:
+    """Concurrency limit whose waiters are served round-robin by account."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: 'OrderedDict[str, Deque[asyncio.Future]]' = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def acquire(self, account: str) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(account, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the waiter was cancelled
+                self.release()
+            else:
+                queue = self._waiters.get(account)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiters[account]
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        while self.active < self.limit and self._waiters:
+            account, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(account)
+            else:
+                del self._waiters[account]
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+
+class _TokenBucket:
+    """Tokens-per-minute budget refilled continuously; may go into debt."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: int) -> float:
+        """Seconds until the bucket can cover a request, 0 if it can now."""
+        self._refill()
+        needed = min(tokens, self.capacity)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def charge(self, tokens: int) -> None:
+        self._refill()
+        self.tokens -= tokens
+
+
+def _window_key(model: str, window: int) -> str:
+    """Redis key of the shared token counter of a model for one minute."""
+    return f"llm_governor:tpm:{model}:{window}"
+
+
+class GovernorLease:
+    """Concurrency slot and token charge held by one request."""
+
+    def __init__(self, governor: 'LLMGovernor', model: str, limiter: Optional[_FairLimiter], estimate: int):
+        self._governor = governor
+        self._limiter = limiter
+        self.model = model
+        self.estimate = estimate
+        self.charged = False
+        self.window: Optional[int] = None  # Shared per-minute window charged, None for the local budget
+        self._usage: Optional[int] = None
+        self._completion_chars = 0
+        self._released = False
+
+    def record_usage(self, usage: Any) -> None:
+        """Record the usage reported for the request, if any."""
+        total = getattr(usage, "total_tokens", None) if usage is not None else None
+        if total:
+            self._usage = total
+
+    def observe_chunk(self, chunk: Any) -> None:
+        """Track usage from a streamed chunk."""
+        usage = getattr(chunk, "usage", None)
+        if usage is not None:
+            self.record_usage(usage)
+        try:
+            content = chunk.choices[0].delta.content
+        except (AttributeError, IndexError, TypeError):
+            content = None
+        if content:
+            self._completion_chars += len(content)
+
+    def release(self, failed: bool = False) -> None:
+        """Free the concurrency slot and settle the token charge.
+
+        Args:
+            failed: Whether the request failed, in which case its estimate is refunded
+        """
+        if self._released:
+            return
+        self._released = True
+        if self._limiter is not None:
+            self._limiter.release()
+
+        if not self.charged:
+            return
+        if failed:
+            actual = 0
+        elif self._usage is not None:
+            actual = self._usage
+        else:
+            actual = self.estimate + self._completion_chars // CHARS_PER_TOKEN
+        self._governor._settle(self.model, actual - self.estimate, self.window)
+
+
+class LLMGovernor:
+    """Singleton that bounds concurrent requests and token throughput per model ID."""
+
+    _instance: Optional['LLMGovernor'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the governor once per process."""
+        if self._initialized:
+            return
+        self._limits = self._load_limits()
+        # Limiters hold futures of one event loop, so they are kept per loop
+        self._limiters: Dict[str, Tuple[asyncio.AbstractEventLoop, _FairLimiter]] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self.throttled = 0
+        self._initialized = True
+
+    @staticmethod
+    def _load_limits() -> Dict[str, Dict[str, int]]:
+        if not config.LLM_RATE_LIMITS:
+            return {}
+        try:
+            return {prefix: dict(limits) for prefix, limits in json.loads(config.LLM_RATE_LIMITS).items()}
+        except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"Invalid LLM_RATE_LIMITS, using defaults: {str(e)}")
+            return {}
+
+    def limits_for(self, model: str) -> Tuple[int, int]:
+        """Concurrency limit and tokens per minute for a model ID (longest prefix wins)."""
+        limits: Dict[str, int] = {}
+        matched = -1
+        for prefix, value in self._limits.items():
+            if model.startswith(prefix) and len(prefix) > matched:
+                limits, matched = value, len(prefix)
+        return (
+            int(limits.get("concurrency", DEFAULT_MAX_CONCURRENCY)),
+            int(limits.get("tokens_per_minute", DEFAULT_TOKENS_PER_MINUTE)),
+        )
+
+    def _limiter(self, model: str, limit: int) -> Optional[_FairLimiter]:
+        if limit <= 0:
+            return None
+        loop = asyncio.get_running_loop()
+        entry = self._limiters.get(model)
+        if entry is None or entry[0] is not loop:
+            entry = (loop, _FairLimiter(limit))
+            self._limiters[model] = entry
+        return entry[1]
+
+    async def acquire(self, model: str, estimated_tokens: int, account_id: Optional[str] = None) -> GovernorLease:
+        """Wait for a concurrency slot and token budget for one request.
+
+        Args:
+            model: Model ID the request is sent to
+            estimated_tokens: Expected tokens of the request, charged up front
+            account_id: Account the request is made for, used for fair queuing
+
+        Returns:
+            Lease to release once the response is complete
+        """
+        concurrency, tokens_per_minute = self.limits_for(model)
+        limiter = self._limiter(model, concurrency)
+        if limiter is not None:
+            if limiter.active >= limiter.limit:
+                self.throttled += 1
+                logger.debug(f"Waiting for a slot for {model} ({limiter.waiting} requests queued)")
+            await limiter.acquire(account_id or DEFAULT_ACCOUNT)
+
+        lease = GovernorLease(self, model, limiter, estimated_tokens)
+        if tokens_per_minute > 0:
+            try:
+                lease.window = await self._charge(model, estimated_tokens, tokens_per_minute)
+            except BaseException:
+                lease.release()
+                raise
+            lease.charged = True
+        return lease
+
+    async def _charge(self, model: str, tokens: int, tokens_per_minute: int) -> Optional[int]:
+        """Charge tokens to the shared budget if configured, else to the local one.
+
+        Returns:
+            Shared per-minute window charged, or None if the local budget was charged
+        """
+        if config.LLM_GOVERNOR_REDIS:
+            try:
+                return await self._charge_shared(model, tokens, tokens_per_minute)
+            except Exception as e:
+                logger.warning(f"Shared token budget unavailable, using local budget for {model}: {str(e)}")
+
+        bucket = self._buckets.get(model)
+        if bucket is None or bucket.capacity != tokens_per_minute:
+            bucket = _TokenBucket(tokens_per_minute)
+            self._buckets[model] = bucket
+        while True:
+            wait = bucket.wait_time(tokens)
+            if wait <= 0:
+                break
+            self.throttled += 1
+            logger.debug(f"Token budget of {model} exhausted, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+        bucket.charge(tokens)
+        return None
+
+    async def _charge_shared(self, model: str, tokens: int, tokens_per_minute: int) -> int:
+        """Charge tokens to a per-minute counter shared through Redis.
+
+        Returns:
+            Window the tokens were charged to
+        """
+        client = await redis.get_client()
+        while True:
+            now = time.time()
+            window = int(now // 60)
+            key = _window_key(model, window)
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.incrby(key, tokens)
+                pipe.expire(key, REDIS_WINDOW_TTL)
+                used, _ = await pipe.execute()
+            if used <= tokens_per_minute or used == tokens:
+                return window
+            # Over budget for this minute: take the charge back and wait for the next one
+            await client.decrby(key, tokens)
+            self.throttled += 1
+            wait = (window + 1) * 60 - now
+            logger.debug(f"Shared token budget of {model} exhausted, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    def _settle(self, model: str, delta: int, window: Optional[int] = None) -> None:
+        """Correct the token charge of a request by the difference to its actual usage.
+
+        Args:
+            model: Model ID the request was sent to
+            delta: Actual usage minus the tokens charged up front
+            window: Shared per-minute window the request was charged to, None for the local budget
+        """
+        if delta == 0:
+            return
+        if window is None:
+            bucket = self._buckets.get(model)
+            if bucket is not None:
+                bucket.charge(delta)
+            return
+        # The correction belongs to the minute the request was charged to; once
+        # that minute is over it no longer limits anyone
+        if time.time() < (window + 1) * 60:
+            asyncio.create_task(self._settle_shared(_window_key(model, window), delta))
+
+    @staticmethod
+    async def _settle_shared(key: str, delta: int) -> None:
+        try:
+            client = await redis.get_client()
+            await client.incrby(key, delta)
+            await client.expire(key, REDIS_WINDOW_TTL)
+        except Exception as e:
+            logger.debug(f"Could not settle shared token budget {key}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return in-flight, queued and throttle counters."""
+        return {
+            "throttled": self.throttled,
+            "models": {
+                model: {"active": limiter.active, "waiting": limiter.waiting, "limit": limiter.limit}
+                for model, (_, limiter) in self._limiters.items()
+            },
+        }
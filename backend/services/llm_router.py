@@ -0,0 +1,245 @@
+"""
+Provider health tracking and routing for LLM calls.
+
+make_llm_api_call uses the router to decide where and when to send each attempt:
+- Latency (time to first token for streams) and errors are tracked per model ID
+- Equivalent model IDs on other providers (e.g. Anthropic direct, Bedrock and
+  OpenRouter for the same Claude model) are tried when a model fails or is
+  degraded, as long as the provider has credentials configured
+- Retries of the same model wait with decorrelated jitter, or as long as the
+  provider asks for in a Retry-After header
+- The p95 time to first token of a model is the deadline after which a hedged
+  second request may be sent
+"""
+
+import json
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, List, Optional
+
+import litellm
+
+from utils.config import config
+from utils.logger import logger
+
+# Constants for retry delays
+RETRY_BASE_DELAY = 1.0          # Seconds; lower bound of a jittered retry delay
+RETRY_MAX_DELAY = 30.0          # Seconds; upper bound of a jittered retry delay
+MAX_RETRY_AFTER = 60.0          # Longest Retry-After wait honored; longer requests are capped
+
+# Constants for health tracking
+LATENCY_WINDOW = 200            # Latency samples kept per model
+ERROR_WINDOW = 20               # Recent outcomes used for the error rate
+DEGRADED_ERROR_RATE = 0.5       # Error rate above which a model is tried after its equivalents
+DEGRADED_MIN_SAMPLES = 4        # Outcomes needed before a model can be considered degraded
+DEGRADED_COOLDOWN = 60.0        # Seconds after its last failure a degraded model stays demoted
+HEDGE_MIN_SAMPLES = 20          # Latency samples needed before requests are hedged
+MIN_HEDGE_DEADLINE = 1.0        # Seconds; never hedge earlier than this
+
+# Groups of interchangeable model IDs, overridable with LLM_MODEL_EQUIVALENTS
+DEFAULT_MODEL_EQUIVALENTS = [
+    [
+        "anthropic/claude-3-7-sonnet-latest",
+        "bedrock/anthropic.claude-3-7-sonnet-20250219-v1:0",
+        "openrouter/anthropic/claude-3.7-sonnet",
+    ],
+    ["gpt-4o", "openrouter/openai/gpt-4o"],
+    ["gpt-4o-mini", "openrouter/openai/gpt-4o-mini"],
+]
+
+# Errors that will not succeed on a retry or another provider
+NON_RETRYABLE_ERRORS = (
+    litellm.exceptions.BadRequestError,
+    litellm.exceptions.ContextWindowExceededError,
+    litellm.exceptions.ContentPolicyViolationError,
+)
+
+
+@dataclass
+class ModelHealth:
+    """Latency and error history of one model ID."""
+    model: str
+    requests: int = 0
+    failures: int = 0
+    hedges: int = 0
+    last_failure: float = 0.0
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=ERROR_WINDOW))
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def latency_percentile(self, fraction: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def is_degraded(self, now: float) -> bool:
+        return (
+            len(self.outcomes) >= DEGRADED_MIN_SAMPLES
+            and self.error_rate > DEGRADED_ERROR_RATE
+            and now - self.last_failure < DEGRADED_COOLDOWN
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        p50 = self.latency_percentile(0.5)
+        p95 = self.latency_percentile(0.95)
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "error_rate": round(self.error_rate, 4),
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+        }
+
+
+def provider_available(model: str) -> bool:
+    """Whether credentials for the provider of a model ID are configured."""
+    if model.startswith("bedrock/"):
+        return bool(config.AWS_ACCESS_KEY_ID and config.AWS_SECRET_ACCESS_KEY and config.AWS_REGION_NAME)
+    if model.startswith("openrouter/"):
+        return bool(config.OPENROUTER_API_KEY)
+    if model.startswith("anthropic/") or model.startswith("claude"):
+        return bool(config.ANTHROPIC_API_KEY)
+    if model.startswith("openai/") or model.startswith("gpt-") or model.startswith("o1"):
+        return bool(config.OPENAI_API_KEY)
+    return True
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay requested by the provider in a Retry-After header, if any."""
+    headers = getattr(error, "litellm_response_headers", None)
+    if headers is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            return max(0.0, float(retry_after_ms) / 1000)
+        retry_after = headers.get("retry-after")
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class LLMRouter:
+    """Singleton that tracks model health and plans the attempts of a call."""
+
+    _instance: Optional['LLMRouter'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the router once per process."""
+        if self._initialized:
+            return
+        self._health: Dict[str, ModelHealth] = {}
+        self._equivalents: Dict[str, List[str]] = {}
+        for group in self._load_equivalents():
+            for model in group:
+                self._equivalents[model] = group
+        self._initialized = True
+
+    @staticmethod
+    def _load_equivalents() -> List[List[str]]:
+        if not config.LLM_MODEL_EQUIVALENTS:
+            return DEFAULT_MODEL_EQUIVALENTS
+        try:
+            groups = json.loads(config.LLM_MODEL_EQUIVALENTS)
+            return [list(group) for group in groups]
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.warning(f"Invalid LLM_MODEL_EQUIVALENTS, using defaults: {str(e)}")
+            return DEFAULT_MODEL_EQUIVALENTS
+
+    def health(self, model: str) -> ModelHealth:
+        entry = self._health.get(model)
+        if entry is None:
+            entry = ModelHealth(model)
+            self._health[model] = entry
+        return entry
+
+    def candidates(self, model_name: str) -> List[str]:
+        """Model IDs to try for a request, best first.
+
+        The requested model comes first unless it is degraded; its configured
+        equivalents follow in order, skipping providers without credentials.
+        Degraded models are moved to the end rather than dropped.
+
+        Args:
+            model_name: The requested model ID
+
+        Returns:
+            Model IDs starting with the one to try first
+        """
+        models = [model_name]
+        if config.LLM_FAILOVER_ENABLED:
+            models += [m for m in self._equivalents.get(model_name, []) if m != model_name and provider_available(m)]
+        now = time.monotonic()
+        return sorted(models, key=lambda m: m in self._health and self._health[m].is_degraded(now))
+
+    def hedge_deadline(self, model: str) -> Optional[float]:
+        """Seconds after which a request to a model is hedged, or None to not hedge."""
+        if not config.LLM_HEDGE_ENABLED:
+            return None
+        health = self.health(model)
+        if len(health.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(MIN_HEDGE_DEADLINE, health.latency_percentile(0.95))
+
+    def retry_delay(self, error: Exception, previous_delay: float) -> float:
+        """Decorrelated jitter delay before retrying the same model.
+
+        A Retry-After header takes precedence over the jittered delay.
+
+        Args:
+            error: The error of the failed attempt
+            previous_delay: Delay before the failed attempt, 0 for the first one
+
+        Returns:
+            Seconds to wait
+        """
+        requested = retry_after_seconds(error)
+        if requested is not None:
+            return min(requested, MAX_RETRY_AFTER)
+        return min(RETRY_MAX_DELAY, random.uniform(RETRY_BASE_DELAY, max(RETRY_BASE_DELAY, previous_delay * 3)))
+
+    def record_success(self, model: str, latency: float) -> None:
+        health = self.health(model)
+        health.requests += 1
+        health.latencies.append(latency)
+        health.outcomes.append(True)
+
+    def record_failure(self, model: str, error: Exception) -> None:
+        health = self.health(model)
+        health.requests += 1
+        health.failures += 1
+        health.last_failure = time.monotonic()
+        health.outcomes.append(False)
+        logger.debug(f"Recorded failure for {model} (error rate {health.error_rate:.2f}): {type(error).__name__}")
+
+    def record_hedge(self, model: str) -> None:
+        self.health(model).hedges += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return health figures per model ID."""
+        return {model: health.as_dict() for model, health in self._health.items()}
@@ -88,10 +88,10 @@ async def get_client():
 
 
 # Basic Redis operations
-async def set(key: str, value: str, ex: int = None):
-    """Set a Redis key."""
+async def set(key: str, value: str, ex: int = None, nx: bool = False):
+    """Set a Redis key; with nx, only if it does not exist yet."""
     redis_client = await get_client()
-    return await redis_client.set(key, value, ex=ex)
+    return await redis_client.set(key, value, ex=ex, nx=nx)
 
 
 async def get(key: str, default: str = None):
@@ -101,6 +101,12 @@ async def get(key: str, default: str = None):
     return result if result is not None else default
 
 
+async def getdel(key: str):
+    """Get a Redis key and delete it, atomically."""
+    redis_client = await get_client()
+    return await redis_client.getdel(key)
+
+
 async def delete(key: str):
     """Delete a Redis key."""
     redis_client = await get_client()
@@ -0,0 +1,327 @@
+"""
+Content-addressed store for browser screenshots.
+
+Browser actions return a JPEG screenshot as base64 in their JSON result. Kept
+in the browser_state message, every screenshot was inflated by a third and
+copied through Postgres on insert, read and delete. Screenshots are stored
+here instead, once per distinct image:
+- The key of a screenshot is the SHA-256 of its bytes, so identical frames
+  are stored once
+- browser_state messages only keep the key as `screenshot_ref`; the API
+  serves a screenshot to users with access to a thread referencing it
+- The image is read back, and base64-encoded, only when the temporary LLM
+  message is built; recent screenshots are served from memory
+
+Screenshots are written to a Supabase storage bucket (SCREENSHOT_STORE_BUCKET)
+shared by all hosts. Without a bucket they go to a local directory
+(SCREENSHOT_STORE_PATH), which is only shared by the workers of one host;
+outside local development the directory must be configured explicitly, as a
+mount shared by every host.
+
+A screenshot stays referenced after its browser_state message is consumed,
+by tool results shown in the frontend, so it is not deleted with the message.
+Screenshots older than SCREENSHOT_STORE_RETENTION_HOURS are swept instead;
+storing a screenshot again renews it.
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from storage3.utils import StorageException
+
+from services.supabase import DBConnection
+from utils.config import EnvMode, config
+from utils.logger import logger
+
+# Constants for the store
+DEFAULT_DIRECTORY = "suna-screenshots"   # Directory in the system temp dir used when no path is configured
+MEMORY_CACHE_BYTES = 32 * 1024 * 1024    # Recently stored or read screenshots kept in memory
+SWEEP_INTERVAL = 3600                    # Seconds between sweeps of expired screenshots
+SWEEP_LIST_LIMIT = 1000                  # Objects listed per bucket folder and sweep
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_screenshot_key(key: str) -> bool:
+    """Whether a string is a well-formed screenshot key."""
+    return bool(key) and bool(_KEY_PATTERN.match(key))
+
+
+def image_media_type(data: bytes) -> str:
+    """Media type of a screenshot, from the signature of its format."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    return "image/jpeg"
+
+
+def base64_media_type(data: str) -> str:
+    """Media type of a base64-encoded screenshot."""
+    return image_media_type(base64.b64decode(data[:16]))
+
+
+class _LocalBackend:
+    """Screenshots as files in a directory, one subdirectory per key prefix."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def __str__(self) -> str:
+        return self.root
+
+    def _path(self, key: str) -> str:
+        # No extension: the format is read from the image signature
+        return os.path.join(self.root, key[:2], key)
+
+    def _write(self, key: str, data: bytes) -> bool:
+        path = self._path(key)
+        if os.path.exists(path):
+            # Renew the screenshot for the retention sweep
+            os.utime(path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return True
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _sweep(self, cutoff: float) -> int:
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                        removed += 1
+                except FileNotFoundError:
+                    # Removed by the sweep of another worker
+                    pass
+        return removed
+
+    async def write(self, key: str, data: bytes) -> bool:
+        return await asyncio.to_thread(self._write, key, data)
+
+    async def read(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def sweep(self, cutoff: float) -> int:
+        return await asyncio.to_thread(self._sweep, cutoff)
+
+
+class _BucketBackend:
+    """Screenshots as objects in a Supabase storage bucket, shared by all hosts."""
+
+    def __init__(self, bucket: str):
+        self.bucket = bucket
+        self.db = DBConnection()
+
+    def __str__(self) -> str:
+        return f"bucket {self.bucket}"
+
+    async def _objects(self):
+        client = await self.db.client
+        return client.storage.from_(self.bucket)
+
+    async def write(self, key: str, data: bytes) -> bool:
+        objects = await self._objects()
+        # Upsert, so storing a screenshot again renews it for the retention sweep
+        await objects.upload(f"{key[:2]}/{key}", data, {"content-type": image_media_type(data), "upsert": "true"})
+        return True
+
+    async def read(self, key: str) -> Optional[bytes]:
+        objects = await self._objects()
+        try:
+            return await objects.download(f"{key[:2]}/{key}")
+        except StorageException:
+            return None
+
+    async def sweep(self, cutoff: float) -> int:
+        objects = await self._objects()
+        removed = 0
+        for prefix in range(256):
+            folder = f"{prefix:02x}"
+            # Oldest first, so everything expired is within the first page
+            listed = await objects.list(folder, {"limit": SWEEP_LIST_LIMIT, "sortBy": {"column": "updated_at", "order": "asc"}})
+            expired = [
+                f"{folder}/{item['name']}" for item in listed
+                if item.get("updated_at") and _timestamp(item["updated_at"]) < cutoff
+            ]
+            if expired:
+                await objects.remove(expired)
+                removed += len(expired)
+        return removed
+
+
+def _timestamp(value: str) -> float:
+    """Seconds since the epoch of an ISO 8601 timestamp returned by storage."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class ScreenshotStore:
+    """Singleton storing screenshots by the hash of their content."""
+
+    _instance: Optional['ScreenshotStore'] = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, root: Optional[str] = None, bucket: Optional[str] = None):
+        """Initialize the store once per process.
+
+        Args:
+            root: Directory the screenshots are written to. Defaults to SCREENSHOT_STORE_PATH.
+            bucket: Storage bucket the screenshots are written to. Defaults to SCREENSHOT_STORE_BUCKET
+                and takes precedence over the directory.
+
+        Raises:
+            RuntimeError: Outside local development, if neither a bucket nor a directory is configured
+        """
+        if self._initialized:
+            return
+        bucket = bucket or config.SCREENSHOT_STORE_BUCKET
+        root = root or config.SCREENSHOT_STORE_PATH
+        if bucket:
+            self.backend = _BucketBackend(bucket)
+        else:
+            if not root:
+                if config.ENV_MODE != EnvMode.LOCAL:
+                    # A temp dir is private to one host, and workers behind a load balancer would miss screenshots
+                    raise RuntimeError("SCREENSHOT_STORE_BUCKET, or a SCREENSHOT_STORE_PATH shared by all hosts, must be set")
+                root = os.path.join(tempfile.gettempdir(), DEFAULT_DIRECTORY)
+            self.backend = _LocalBackend(root)
+        self.retention = config.SCREENSHOT_STORE_RETENTION_HOURS * 3600
+        # Key -> (bytes, time the key was last written to the backend)
+        self._memory: 'OrderedDict[str, Tuple[bytes, float]]' = OrderedDict()
+        self._memory_bytes = 0
+        self._last_sweep = time.monotonic()
+        self._sweep_task: Optional[asyncio.Task] = None
+        self.stored = 0
+        self.deduplicated = 0
+        self.reads = 0
+        self.memory_hits = 0
+        self.swept = 0
+        self._initialized = True
+
+    def _remember(self, key: str, data: bytes, written_at: float) -> None:
+        if key in self._memory:
+            self._memory[key] = (data, written_at)
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = (data, written_at)
+        self._memory_bytes += len(data)
+        while self._memory_bytes > MEMORY_CACHE_BYTES and len(self._memory) > 1:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _maybe_sweep(self) -> None:
+        """Start a sweep of expired screenshots in the background, at most once per SWEEP_INTERVAL."""
+        if self._sweep_task is not None or time.monotonic() - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = time.monotonic()
+        self._sweep_task = asyncio.create_task(self.sweep())
+        self._sweep_task.add_done_callback(lambda _: setattr(self, '_sweep_task', None))
+
+    async def sweep(self) -> int:
+        """Remove screenshots not stored again within the retention period.
+
+        Returns:
+            The number of screenshots removed
+        """
+        try:
+            removed = await self.backend.sweep(time.time() - self.retention)
+        except Exception as e:
+            logger.error(f"Failed to sweep screenshots in {self.backend}: {str(e)}", exc_info=True)
+            return 0
+        self.swept += removed
+        if removed:
+            logger.info(f"Removed {removed} expired screenshots from {self.backend}")
+        return removed
+
+    async def put(self, data: bytes) -> str:
+        """Store a screenshot.
+
+        Args:
+            data: Image bytes
+
+        Returns:
+            The key of the screenshot
+        """
+        key = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        cached = self._memory.get(key)
+        # Written recently enough that it cannot expire before it is renewed again
+        if cached is not None and now - cached[1] < self.retention / 2:
+            self.deduplicated += 1
+            self._memory.move_to_end(key)
+            return key
+        if await self.backend.write(key, data) and cached is None:
+            self.stored += 1
+        else:
+            self.deduplicated += 1
+        self._remember(key, data, now)
+        self._maybe_sweep()
+        return key
+
+    async def put_base64(self, data: str) -> str:
+        """Store a base64-encoded screenshot and return its key."""
+        return await self.put(base64.b64decode(data))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return the bytes of a screenshot, or None if the key is unknown or malformed."""
+        if not is_screenshot_key(key):
+            return None
+        cached = self._memory.get(key)
+        if cached is not None:
+            self.memory_hits += 1
+            self._memory.move_to_end(key)
+            return cached[0]
+        self.reads += 1
+        data = await self.backend.read(key)
+        if data is None:
+            logger.warning(f"Screenshot {key} not found in {self.backend}")
+            return None
+        # Not written by this read, so the backend copy may be older than the retention period allows
+        self._remember(key, data, 0.0)
+        return data
+
+    async def get_base64(self, key: str) -> Optional[str]:
+        """Return a screenshot base64-encoded, or None if it is not stored."""
+        data = await self.get(key)
+        return base64.b64encode(data).decode() if data is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        """Return store and memory cache counters."""
+        return {
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "reads": self.reads,
+            "memory_hits": self.memory_hits,
+            "memory_bytes": self._memory_bytes,
+            "swept": self.swept,
+        }
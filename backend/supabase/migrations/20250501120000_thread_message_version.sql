@@ -0,0 +1,29 @@
+-- Version counter for the LLM messages of a thread.
+-- Bumped once for every inserted, updated or deleted LLM message so that
+-- in-process message caches can validate themselves with a single lookup.
+ALTER TABLE threads ADD COLUMN message_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_thread_message_version()
+RETURNS TRIGGER
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF OLD.is_llm_message THEN
+            UPDATE threads SET message_version = message_version + 1 WHERE thread_id = OLD.thread_id;
+        END IF;
+        RETURN OLD;
+    END IF;
+
+    IF NEW.is_llm_message OR (TG_OP = 'UPDATE' AND OLD.is_llm_message) THEN
+        UPDATE threads SET message_version = message_version + 1 WHERE thread_id = NEW.thread_id;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER bump_thread_message_version
+    AFTER INSERT OR UPDATE OR DELETE ON messages
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_thread_message_version();
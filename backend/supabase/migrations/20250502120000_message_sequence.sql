@@ -0,0 +1,136 @@
+-- One time source for message ordering.
+-- created_at always comes from the database clock (the column default), and
+-- seq breaks ties between rows stamped with the same transaction time, such
+-- as the rows of one batched insert. Messages are ordered by (created_at, seq).
+-- Existing rows are numbered in storage order; their created_at values are
+-- already distinct within a thread.
+ALTER TABLE messages ADD COLUMN seq BIGINT GENERATED ALWAYS AS IDENTITY;
+
+CREATE INDEX idx_messages_thread_order ON messages(thread_id, created_at, seq);
+
+-- Newest created_at of the thread's LLM messages, by the database clock.
+-- A summary is inserted with this timestamp so it sorts after the messages it
+-- summarizes and before any added while it was generated. NULL until the
+-- thread's next LLM message is inserted.
+ALTER TABLE threads ADD COLUMN last_message_at TIMESTAMP WITH TIME ZONE;
+
+CREATE OR REPLACE FUNCTION bump_thread_message_version()
+RETURNS TRIGGER
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF OLD.is_llm_message THEN
+            UPDATE threads SET message_version = message_version + 1 WHERE thread_id = OLD.thread_id;
+        END IF;
+        RETURN OLD;
+    END IF;
+
+    IF TG_OP = 'INSERT' AND NEW.is_llm_message THEN
+        UPDATE threads
+        SET message_version = message_version + 1,
+            last_message_at = GREATEST(COALESCE(last_message_at, NEW.created_at), NEW.created_at)
+        WHERE thread_id = NEW.thread_id;
+    ELSIF NEW.is_llm_message OR (TG_OP = 'UPDATE' AND OLD.is_llm_message) THEN
+        UPDATE threads SET message_version = message_version + 1 WHERE thread_id = NEW.thread_id;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+-- Same as before, ordered by (created_at, seq)
+CREATE OR REPLACE FUNCTION get_llm_formatted_messages(p_thread_id UUID)
+RETURNS JSONB
+SECURITY DEFINER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    messages_array JSONB := '[]'::JSONB;
+    has_access BOOLEAN;
+    current_role TEXT;
+    latest_summary_id UUID;
+    latest_summary_time TIMESTAMP WITH TIME ZONE;
+    latest_summary_seq BIGINT;
+    is_project_public BOOLEAN;
+BEGIN
+    -- Get current role
+    SELECT current_user INTO current_role;
+    
+    -- Check if associated project is public
+    SELECT p.is_public INTO is_project_public
+    FROM threads t
+    LEFT JOIN projects p ON t.project_id = p.project_id
+    WHERE t.thread_id = p_thread_id;
+    
+    -- Skip access check for service_role or public projects
+    IF current_role = 'authenticated' AND NOT is_project_public THEN
+        -- Check if thread exists and user has access
+        SELECT EXISTS (
+            SELECT 1 FROM threads t
+            LEFT JOIN projects p ON t.project_id = p.project_id
+            WHERE t.thread_id = p_thread_id
+            AND (
+                basejump.has_role_on_account(t.account_id) = true OR 
+                basejump.has_role_on_account(p.account_id) = true
+            )
+        ) INTO has_access;
+        
+        IF NOT has_access THEN
+            RAISE EXCEPTION 'Thread not found or access denied';
+        END IF;
+    END IF;
+
+    -- Find the latest summary message if it exists
+    SELECT message_id, created_at, seq
+    INTO latest_summary_id, latest_summary_time, latest_summary_seq
+    FROM messages
+    WHERE thread_id = p_thread_id
+    AND type = 'summary'
+    AND is_llm_message = TRUE
+    ORDER BY created_at DESC, seq DESC
+    LIMIT 1;
+    
+    -- Log whether a summary was found (helpful for debugging)
+    IF latest_summary_id IS NOT NULL THEN
+        RAISE NOTICE 'Found latest summary message: id=%, time=%', latest_summary_id, latest_summary_time;
+    ELSE
+        RAISE NOTICE 'No summary message found for thread %', p_thread_id;
+    END IF;
+
+    -- Parse content if it's stored as a string and return proper JSON objects
+    WITH parsed_messages AS (
+        SELECT 
+            message_id,
+            CASE 
+                WHEN jsonb_typeof(content) = 'string' THEN content::text::jsonb
+                ELSE content
+            END AS parsed_content,
+            created_at,
+            seq,
+            type
+        FROM messages
+        WHERE thread_id = p_thread_id
+        AND is_llm_message = TRUE
+        AND (
+            -- Include the latest summary and all messages after it,
+            -- or all messages if no summary exists
+            latest_summary_id IS NULL 
+            OR message_id = latest_summary_id 
+            OR (created_at, seq) > (latest_summary_time, latest_summary_seq)
+        )
+    )
+    SELECT JSONB_AGG(parsed_content ORDER BY created_at, seq)
+    INTO messages_array
+    FROM parsed_messages;
+    
+    -- Handle the case when no messages are found
+    IF messages_array IS NULL THEN
+        RETURN '[]'::JSONB;
+    END IF;
+    
+    RETURN messages_array;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_llm_formatted_messages TO authenticated, anon, service_role;
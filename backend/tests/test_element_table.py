@@ -0,0 +1,60 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from agent.tools.sb_browser_tool import render_element_table
+from sandbox.docker.element_table import ElementTable
+
+
+@dataclass
+class Box:
+    x: float
+    y: float
+    width: float
+    height: float
+
+
+@dataclass
+class Element:
+    tag_name: str
+    text: str = ""
+    attributes: Dict[str, str] = field(default_factory=dict)
+    viewport_coordinates: Optional[Box] = None
+    is_in_viewport: bool = True
+
+    def get_all_text_till_next_clickable_element(self) -> str:
+        return self.text
+
+
+DISPLAY_ATTRIBUTES = ["id", "href", "alt", "aria-label", "placeholder", "name", "role", "title", "value"]
+
+
+def make_table() -> ElementTable:
+    selector_map = {
+        0: Element("a", "Home", {"href": "/", "title": "Home"}, Box(1.5, 2, 30, 10)),
+        1: Element("input", attributes={"name": "q", "type": "text", "placeholder": "Search"}),
+        2: Element("button", attributes={"aria-label": "Close"}, is_in_viewport=False),
+        3: Element("div", attributes={"role": "div"}),
+        5: Element("img", "", {"alt": "Logo", "src": "/logo.png"}, Box(0, 0, 64, 64)),
+        8: Element("span", "Ünïcode — text", {"id": "x", "title": "Ünïcode"}),
+    }
+    return ElementTable.from_selector_map(selector_map, DISPLAY_ATTRIBUTES)
+
+
+def test_rendered_table_matches_browser_api_rendering():
+    table = make_table()
+    # The table travels to the backend as JSON
+    data = json.loads(json.dumps(table.as_dict()))
+    assert render_element_table(data) == table.to_string()
+
+
+def test_round_trip_keeps_every_column():
+    table = make_table()
+    restored = ElementTable.from_dict(json.loads(json.dumps(table.as_dict())))
+    assert restored.as_dict() == table.as_dict()
+    assert restored.interactive_elements() == table.interactive_elements()
+
+
+def test_empty_table():
+    table = ElementTable.from_selector_map({}, DISPLAY_ATTRIBUTES)
+    assert render_element_table(table.as_dict()) == "No interactive elements found"
@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from sandbox.fake_backend import FakeSandboxBackend
+from sandbox.pool import SandboxPool
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool():
+    SandboxPool._instance = None
+    yield
+    SandboxPool._instance = None
+
+
+async def wait_until_ready(pool: SandboxPool, count: int) -> None:
+    while pool.ready < count:
+        await asyncio.sleep(0.001)
+
+
+def test_start_fills_pool():
+    async def run():
+        backend = FakeSandboxBackend()
+        pool = SandboxPool(size=3, backend=backend)
+        pool.start()
+        await wait_until_ready(pool, 3)
+        assert len(backend.sandboxes) == 3
+        assert pool.stats()["created"] == 3
+
+    asyncio.run(run())
+
+
+def test_claim_assigns_sandbox_and_replenishes():
+    async def run():
+        backend = FakeSandboxBackend()
+        pool = SandboxPool(size=2, backend=backend)
+        pool.start()
+        await wait_until_ready(pool, 2)
+
+        sandbox, password = await pool.claim("project-1")
+        assert sandbox.labels == {"id": "project-1"}
+        assert sandbox.autostop_interval == 15
+        assert password == sandbox.password
+
+        await wait_until_ready(pool, 2)
+        assert len(backend.sandboxes) == 3
+        assert pool.stats()["hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_claim_from_empty_pool_is_a_miss():
+    async def run():
+        pool = SandboxPool(size=1, backend=FakeSandboxBackend(create_latency=1.0))
+        pool.start()
+        assert await pool.claim("project-1") is None
+        assert pool.stats()["misses"] == 1
+        await pool.drain()
+
+    asyncio.run(run())
+
+
+def test_drain_releases_sandboxes_and_next_pool_adopts_them():
+    async def run():
+        backend = FakeSandboxBackend()
+        pool = SandboxPool(size=2, backend=backend)
+        pool.start()
+        await wait_until_ready(pool, 2)
+        await pool.drain()
+
+        # Still running, passwords kept for the next process
+        assert len(backend.sandboxes) == 2
+        assert set(backend.released) == set(backend.sandboxes)
+
+        SandboxPool._instance = None
+        pool = SandboxPool(size=2, backend=backend)
+        pool.start()
+        await wait_until_ready(pool, 2)
+        assert pool.stats()["adopted"] == 2
+        assert pool.stats()["created"] == 0
+        assert backend.released == {}
+
+        sandbox, password = await pool.claim("project-1")
+        assert password == sandbox.password
+
+    asyncio.run(run())
+
+
+def test_reclaim_removes_stopped_and_leaves_unreleased_sandboxes():
+    async def run():
+        backend = FakeSandboxBackend()
+        stopped = await backend.create("stopped")
+        stopped.running = False
+        # Running but not released: it may be waiting in another worker's pool
+        other = await backend.create("other")
+
+        pool = SandboxPool(size=1, backend=backend)
+        pool.start()
+        await wait_until_ready(pool, 1)
+        assert stopped.id not in backend.sandboxes
+        assert other.id in backend.sandboxes
+        assert pool.stats()["reclaimed"] == 1
+        assert pool.stats()["adopted"] == 0
+
+    asyncio.run(run())
+
+
+def test_adopts_only_up_to_pool_size():
+    async def run():
+        backend = FakeSandboxBackend()
+        for i in range(3):
+            sandbox = await backend.create(f"password-{i}")
+            await backend.release(sandbox, sandbox.password)
+
+        pool = SandboxPool(size=2, backend=backend)
+        pool.start()
+        await wait_until_ready(pool, 2)
+        await asyncio.sleep(0.01)
+        assert pool.ready == 2
+        assert pool.stats()["adopted"] == 2
+        assert len(backend.released) == 1
+
+    asyncio.run(run())
+
+
+def test_disabled_pool_leaves_sandboxes_alone():
+    async def run():
+        backend = FakeSandboxBackend()
+        stopped = await backend.create("stopped")
+        stopped.running = False
+        released = await backend.create("released")
+        await backend.release(released, released.password)
+
+        pool = SandboxPool(size=0, backend=backend)
+        pool.start()
+        await asyncio.sleep(0.01)
+        assert await pool.claim("project-1") is None
+        await pool.drain()
+        assert len(backend.sandboxes) == 2
+        assert released.id in backend.released
+        assert pool.stats()["misses"] == 0
+
+    asyncio.run(run())
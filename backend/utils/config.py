@@ -125,6 +125,28 @@ class Configuration:
     # Model configuration
     MODEL_TO_USE: Optional[str] = "anthropic/claude-3-7-sonnet-latest"
 
+    # LLM HTTP connection pool (shared per provider and base URL)
+    LLM_HTTP_MAX_CONNECTIONS: int = 200
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 100
+    LLM_HTTP_KEEPALIVE_EXPIRY: int = 120  # Seconds an idle connection is kept open
+    LLM_HTTP_TIMEOUT: int = 600  # Seconds; long streaming completions must fit
+    LLM_HTTP2: bool = True  # Requires the h2 package, falls back to HTTP/1.1 otherwise
+
+    # LLM routing across equivalent models on different providers
+    LLM_FAILOVER_ENABLED: bool = True
+    LLM_HEDGE_ENABLED: bool = False  # Send a second request once the first exceeds the p95 time to first token
+    LLM_MODEL_EQUIVALENTS: Optional[str] = None  # JSON list of groups of interchangeable model IDs
+
+    # Context compaction
+    CONTEXT_TOKEN_THRESHOLD: int = 120000  # An iteration waits for a summary at this many tokens
+    CONTEXT_SOFT_TOKEN_THRESHOLD: int = 90000  # A background summary starts at this many tokens
+    CONTEXT_HYSTERESIS_TOKENS: int = 30000  # Tokens a thread must grow by after a summary before the next background one
+    CONTEXT_SUMMARY_MODEL: str = "gpt-4o-mini"  # Cheap model used for summaries
+
+    # LLM rate governor
+    LLM_RATE_LIMITS: Optional[str] = None  # JSON object of model ID prefix -> {"concurrency": n, "tokens_per_minute": n}
+    LLM_GOVERNOR_REDIS: bool = False  # Share token budgets across workers through Redis
+
     # Supabase configuration
     SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
@@ -140,6 +162,17 @@ class Configuration:
     DAYTONA_API_KEY: str
     DAYTONA_SERVER_URL: str
     DAYTONA_TARGET: str
+    SANDBOX_EXECUTOR_WORKERS: int = 32  # Threads running blocking Daytona SDK calls
+    SANDBOX_POOL_SIZE: int = 0  # Pre-created sandboxes kept ready per worker; 0 disables the pool
+    SANDBOX_BROWSER_DIRECT_HTTP: bool = True  # Call the in-sandbox browser API over its preview link instead of curl
+    SANDBOX_BROWSER_API_TIMEOUT: int = 30  # Seconds a browser action may take
+    SANDBOX_BROWSER_SCREENSHOT_TIER: Optional[str] = None  # skip, thumbnail, standard or full_page; the browser API default if unset
+    SANDBOX_BROWSER_SCREENSHOT_FORMAT: Optional[str] = None  # jpeg or webp; the browser API default if unset
+
+    # Content-addressed screenshot store
+    SCREENSHOT_STORE_BUCKET: Optional[str] = None  # Supabase storage bucket shared by all hosts; takes precedence over the path
+    SCREENSHOT_STORE_PATH: Optional[str] = None  # Directory shared by all hosts; required outside local mode without a bucket
+    SCREENSHOT_STORE_RETENTION_HOURS: int = 72  # Screenshots not stored again within this time are removed
 
     # Search and other API keys
     TAVILY_API_KEY: str
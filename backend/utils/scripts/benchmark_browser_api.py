@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+Benchmark of per-action latency of the sandbox browser API: curl via exec vs direct HTTP.
+
+Usage:
+    python -m utils.scripts.benchmark_browser_api [--actions 30] [--screenshot-kb 300]
+        [--exec-overhead-ms 150] [--handshake-ms 60]
+
+This script:
+1. Starts a local stub of the browser API that answers every automation
+   request with a JSON result carrying a base64 screenshot of --screenshot-kb
+2. Runs --actions actions through the curl path of SandboxBrowserTool: a
+   real curl process per action, run through the exec facade, plus
+   --exec-overhead-ms for the exec API round trip and shell start in the
+   sandbox
+3. Runs the same actions through sandbox.browser_client, whose keep-alive
+   connections pay --handshake-ms (the TLS handshake to the preview proxy)
+   only once
+4. Prints the median and p95 latency per action for both paths
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import subprocess
+import time
+from types import SimpleNamespace
+from typing import List
+
+from sandbox.async_daytona import AsyncProcess, shutdown_executor
+from sandbox.browser_client import browser_api_request, close_browser_clients
+
+
+class StubBrowserAPI:
+    """Minimal HTTP/1.1 keep-alive server answering automation requests."""
+
+    def __init__(self, screenshot_kb: int, handshake_seconds: float):
+        screenshot = base64.b64encode(os.urandom(screenshot_kb * 1024 * 3 // 4)).decode()
+        self.body = json.dumps({
+            "success": True, "message": "Navigated", "url": "https://example.com",
+            "title": "Example", "element_count": 42, "screenshot_base64": screenshot,
+        }).encode()
+        self.handshake_seconds = handshake_seconds
+        self.connections = 0
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        handshake_pending = True
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                content_length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value.strip())
+                if content_length:
+                    await reader.readexactly(content_length)
+                if handshake_pending:
+                    # Only remote (direct) clients pay for a handshake; curl runs next to the API
+                    if not request_line.startswith(b"POST /local"):
+                        await asyncio.sleep(self.handshake_seconds)
+                    handshake_pending = False
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(self.body)}\r\n\r\n".encode()
+                    + self.body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class CurlProcess:
+    """Stand-in for the sandbox process API running commands with a shell."""
+
+    def __init__(self, exec_overhead: float):
+        self.exec_overhead = exec_overhead
+
+    def exec(self, command: str, cwd=None, timeout=None):
+        time.sleep(self.exec_overhead)
+        completed = subprocess.run(command, shell=True, capture_output=True, timeout=timeout)
+        return SimpleNamespace(exit_code=completed.returncode, result=completed.stdout.decode())
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args) -> None:
+    stub = StubBrowserAPI(args.screenshot_kb, args.handshake_ms / 1000)
+    port = await stub.start()
+    params = {"url": "https://example.com"}
+
+    process = AsyncProcess(SimpleNamespace(id="benchmark-sandbox", process=CurlProcess(args.exec_overhead_ms / 1000)))
+    curl_cmd = (
+        f"curl -s -X POST 'http://127.0.0.1:{port}/local/api/automation/navigate_to' "
+        f"-H 'Content-Type: application/json' -d '{json.dumps(params)}'"
+    )
+    curl_latencies = []
+    for _ in range(args.actions):
+        start = time.perf_counter()
+        response = await process.exec(curl_cmd, timeout=30)
+        json.loads(response.result)
+        curl_latencies.append(time.perf_counter() - start)
+
+    async def get_preview_link(_port):
+        return SimpleNamespace(url=f"http://127.0.0.1:{port}", token="benchmark-token")
+
+    sandbox = SimpleNamespace(id="benchmark-sandbox", get_preview_link=get_preview_link)
+    direct_latencies = []
+    connections_before = stub.connections
+    for _ in range(args.actions):
+        start = time.perf_counter()
+        await browser_api_request(sandbox, "navigate_to", params)
+        direct_latencies.append(time.perf_counter() - start)
+    direct_connections = stub.connections - connections_before
+
+    await close_browser_clients()
+    await stub.stop()
+
+    print(
+        f"{args.actions} actions, screenshot {args.screenshot_kb} KB, "
+        f"exec overhead {args.exec_overhead_ms:.0f} ms, handshake {args.handshake_ms:.0f} ms"
+    )
+    for label, latencies in (("curl", curl_latencies), ("direct", direct_latencies)):
+        print(
+            f"{label:<8} median {statistics.median(latencies) * 1000:8.1f} ms"
+            f"   p95 {percentile(latencies, 0.95) * 1000:8.1f} ms"
+        )
+    print(f"direct connections opened: {direct_connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark browser API calls via curl and direct HTTP")
+    parser.add_argument("--actions", type=int, default=30, help="Browser actions per path")
+    parser.add_argument("--screenshot-kb", type=int, default=300, help="Size of the base64 screenshot in responses")
+    parser.add_argument("--exec-overhead-ms", type=float, default=150.0, help="Exec API round trip and shell start")
+    parser.add_argument("--handshake-ms", type=float, default=60.0, help="Connection setup to the preview proxy")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+    shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+Benchmark for time-to-first-token of LLM calls with fresh and pooled HTTP clients.
+
+Usage:
+    python -m utils.scripts.benchmark_llm_http_pool [--requests 40] [--concurrency 1,8,32]
+        [--handshake-ms 60] [--ttft-ms 20]
+
+This script:
+1. Starts a local stub server speaking the OpenAI-compatible streaming chat
+   completions API. Every new connection waits --handshake-ms before it is
+   served, standing in for the TCP and TLS handshake to a remote provider.
+2. Sends --requests streaming completions through litellm at each concurrency
+   level, first with a new HTTP client per request and then with the pooled
+   client from services.llm
+3. Prints the median and p95 time to the first streamed token for both modes
+   and the number of connections the server accepted
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+import httpx
+import litellm
+from openai import AsyncOpenAI
+
+from services import llm
+
+STUB_MODEL = "openai/stub-model"
+
+
+class StubServer:
+    """Minimal HTTP/1.1 keep-alive server streaming fixed chat completion chunks."""
+
+    def __init__(self, handshake_seconds: float, ttft_seconds: float, chunks: int = 5):
+        self.handshake_seconds = handshake_seconds
+        self.ttft_seconds = ttft_seconds
+        self.chunks = chunks
+        self.connections = 0
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        await asyncio.sleep(self.handshake_seconds)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                content_length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value.strip())
+                if content_length:
+                    await reader.readexactly(content_length)
+                await self._respond(writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        await asyncio.sleep(self.ttft_seconds)
+        for i in range(self.chunks):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "stub-model",
+                "choices": [{"index": 0, "delta": {"content": f"token{i} "}, "finish_reason": None}],
+            }
+            self._write_chunk(writer, f"data: {json.dumps(chunk)}\n\n".encode())
+            await writer.drain()
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes) -> None:
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+async def time_to_first_token(api_base: str, pooled: bool) -> float:
+    """Send one streaming completion and return the seconds until its first token."""
+    fresh_client = None
+    kwargs = {}
+    if pooled:
+        kwargs["client"] = llm.get_llm_http_client(STUB_MODEL, api_base)
+    else:
+        fresh_client = httpx.AsyncClient()
+        kwargs["client"] = AsyncOpenAI(api_key="stub", base_url=api_base, http_client=fresh_client)
+
+    start = time.perf_counter()
+    try:
+        response = await litellm.acompletion(
+            model=STUB_MODEL,
+            api_base=api_base,
+            api_key="stub",
+            messages=[{"role": "user", "content": "Hello"}],
+            stream=True,
+            **kwargs,
+        )
+        ttft = None
+        async for chunk in response:
+            if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+                ttft = time.perf_counter() - start
+        return ttft if ttft is not None else time.perf_counter() - start
+    finally:
+        if fresh_client is not None:
+            await fresh_client.aclose()
+
+
+async def run_level(api_base: str, pooled: bool, requests: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> float:
+        async with semaphore:
+            return await time_to_first_token(api_base, pooled)
+
+    return list(await asyncio.gather(*(one() for _ in range(requests))))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run(args) -> None:
+    server = StubServer(args.handshake_ms / 1000, args.ttft_ms / 1000)
+    port = await server.start()
+    api_base = f"http://127.0.0.1:{port}/v1"
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    print(f"{args.requests} requests per level, handshake {args.handshake_ms:.0f} ms, server TTFT {args.ttft_ms:.0f} ms")
+    print(f"{'mode':<8}{'concurrency':>12}{'median ms':>12}{'p95 ms':>10}{'connections':>13}")
+    try:
+        for concurrency in levels:
+            for pooled in (False, True):
+                connections_before = server.connections
+                ttfts = await run_level(api_base, pooled, args.requests, concurrency)
+                print(
+                    f"{'pooled' if pooled else 'fresh':<8}{concurrency:>12}"
+                    f"{statistics.median(ttfts) * 1000:>12.1f}{percentile(ttfts, 0.95) * 1000:>10.1f}"
+                    f"{server.connections - connections_before:>13}"
+                )
+    finally:
+        await llm.close_llm_http_clients()
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM time-to-first-token with fresh and pooled HTTP clients")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per concurrency level and mode")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--handshake-ms", type=float, default=60.0, help="Simulated connection setup time")
+    parser.add_argument("--ttft-ms", type=float, default=20.0, help="Server time before the first token")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
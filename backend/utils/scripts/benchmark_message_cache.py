@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark for per-iteration message fetch cost with and without the MessageCache.
+
+Usage:
+    python -m utils.scripts.benchmark_message_cache [--messages 500] [--iterations 50]
+        [--rpc-ms 0] [--version-ms 0]
+
+This script:
+1. Synthesizes a thread of user, assistant and tool messages in the format
+   returned by get_llm_formatted_messages
+2. Simulates the uncached path: fetch the whole thread (optionally waiting
+   --rpc-ms to stand in for the RPC round trip) and parse every message
+3. Simulates the cached path: read the message version (optionally waiting
+   --version-ms) and serve the thread from the MessageCache
+4. Appends an assistant and a tool message per iteration on both paths, as an
+   agent run does, verifies both return the same messages and prints timings
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, List
+
+from agentpress.message_cache import MessageCache
+
+
+def build_message(i: int) -> str:
+    """JSON text of the i-th message of a synthetic thread."""
+    if i % 3 == 0:
+        content = {"role": "user", "content": f"Please update module_{i}.py so that it handles retries. " * 4}
+    elif i % 3 == 1:
+        content = {
+            "role": "assistant",
+            "content": f"I'll update the module.\n<str-replace file_path=\"module_{i}.py\">\n"
+                       f"<old_str>retry = 0</old_str>\n<new_str>retry = 3</new_str>\n</str-replace>",
+        }
+    else:
+        output = "\n".join(f"line {j}: ok" for j in range(60))
+        content = {"role": "user", "content": f"<tool_result> <str-replace> ToolResult(success=True, output='{output}') </str-replace> </tool_result>"}
+    return json.dumps(content)
+
+
+def parse_rpc_result(items: List[str]) -> List[Any]:
+    """Parsing done by ThreadManager on every uncached fetch."""
+    return [json.loads(item) for item in items]
+
+
+async def run_uncached(thread: List[str], iterations: int, rpc_seconds: float) -> List[Any]:
+    messages = []
+    for i in range(iterations):
+        if rpc_seconds:
+            await asyncio.sleep(rpc_seconds)
+        messages = parse_rpc_result(thread)
+        thread.append(build_message(len(thread)))
+        thread.append(build_message(len(thread)))
+    return messages
+
+
+async def run_cached(thread: List[str], iterations: int, version_seconds: float) -> List[Any]:
+    cache = MessageCache()
+    thread_id = "benchmark-thread"
+    version = len(thread)
+    cache.put(thread_id, thread, version)
+
+    messages = []
+    for i in range(iterations):
+        if version_seconds:
+            await asyncio.sleep(version_seconds)
+        messages = cache.get(thread_id, version)
+        for _ in range(2):
+            message = build_message(len(thread))
+            thread.append(message)
+            cache.append(thread_id, message)
+            version += 1
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-iteration message fetch cost")
+    parser.add_argument("--messages", type=int, default=500, help="Messages in the thread at the start")
+    parser.add_argument("--iterations", type=int, default=50, help="Agent iterations to simulate")
+    parser.add_argument("--rpc-ms", type=float, default=0.0, help="Simulated RPC latency per uncached fetch")
+    parser.add_argument("--version-ms", type=float, default=0.0, help="Simulated latency of the version lookup")
+    args = parser.parse_args()
+
+    base_thread = [build_message(i) for i in range(args.messages)]
+    total_kb = sum(len(m) for m in base_thread) / 1024
+    print(f"Thread: {args.messages} messages, {total_kb:.0f} KB of JSON, {args.iterations} iterations")
+
+    start = time.perf_counter()
+    uncached = asyncio.run(run_uncached(list(base_thread), args.iterations, args.rpc_ms / 1000))
+    uncached_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cached = asyncio.run(run_cached(list(base_thread), args.iterations, args.version_ms / 1000))
+    cached_time = time.perf_counter() - start
+
+    print(f"Uncached: {uncached_time / args.iterations * 1000:8.3f} ms per iteration")
+    print(f"Cached:   {cached_time / args.iterations * 1000:8.3f} ms per iteration")
+    print(f"Speedup: {uncached_time / max(cached_time, 1e-9):.1f}x")
+    print(f"Cache stats: {MessageCache().stats()}")
+
+    if uncached != cached:
+        print("WARNING: cached and uncached paths returned different messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Load test for event loop responsiveness during long sandbox shell commands.
+
+Usage:
+    python -m utils.scripts.benchmark_sandbox_executor [--commands 4] [--command-seconds 3]
+        [--interval-ms 50]
+
+This script:
+1. Streams SSE-style events from a producer task to a consumer every
+   --interval-ms, as the agent run stream does, and records how late each
+   event arrives
+2. Meanwhile runs --commands blocking "shell commands" that take
+   --command-seconds each, with a process object that blocks like the Daytona
+   SDK does while a command runs
+3. Calls them once directly from async code and once through the
+   AsyncProcess facade, and prints the event delivery delays for both
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+from typing import List
+
+from sandbox.async_daytona import AsyncProcess, shutdown_executor
+
+
+class BlockingProcess:
+    """Stand-in for the SDK process API: every call blocks the calling thread."""
+
+    def __init__(self, command_seconds: float):
+        self.command_seconds = command_seconds
+
+    def execute_session_command(self, session_id: str, req, timeout=None):
+        time.sleep(self.command_seconds)
+        return SimpleNamespace(cmd_id="cmd", exit_code=0)
+
+
+async def stream_events(stop: asyncio.Event, interval: float) -> List[float]:
+    """Produce and consume events at a fixed interval, returning delivery delays in seconds."""
+    queue: asyncio.Queue = asyncio.Queue()
+    delays: List[float] = []
+
+    async def produce():
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            await queue.put(next_at)
+        await queue.put(None)
+
+    async def consume():
+        while True:
+            scheduled = await queue.get()
+            if scheduled is None:
+                break
+            delays.append(time.perf_counter() - scheduled)
+
+    await asyncio.gather(produce(), consume())
+    return delays
+
+
+async def run(commands: int, command_seconds: float, interval: float, use_executor: bool) -> List[float]:
+    blocking = BlockingProcess(command_seconds)
+    sandbox = SimpleNamespace(id="benchmark-sandbox", process=blocking)
+    process = AsyncProcess(sandbox)
+    stop = asyncio.Event()
+    stream = asyncio.create_task(stream_events(stop, interval))
+    await asyncio.sleep(interval * 4)
+
+    async def command(i: int):
+        session_id = f"session-{i}"
+        if use_executor:
+            await process.execute_session_command(session_id, None)
+        else:
+            blocking.execute_session_command(session_id, None)
+
+    await asyncio.gather(*(command(i) for i in range(commands)))
+    await asyncio.sleep(interval * 4)
+    stop.set()
+    return await stream
+
+
+def summarize(label: str, delays: List[float], elapsed: float) -> None:
+    ordered = sorted(delays)
+    p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+    print(
+        f"{label:<10} events {len(delays):>5}   median {statistics.median(delays) * 1000:8.1f} ms"
+        f"   p99 {p99 * 1000:8.1f} ms   max {ordered[-1] * 1000:8.1f} ms   wall {elapsed:6.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test event streaming during long sandbox commands")
+    parser.add_argument("--commands", type=int, default=4, help="Concurrent long-running commands")
+    parser.add_argument("--command-seconds", type=float, default=3.0, help="Duration of each command")
+    parser.add_argument("--interval-ms", type=float, default=50.0, help="Interval between streamed events")
+    args = parser.parse_args()
+
+    print(f"{args.commands} commands of {args.command_seconds:.1f}s, one event every {args.interval_ms:.0f} ms")
+    for label, use_executor in (("direct", False), ("executor", True)):
+        start = time.perf_counter()
+        delays = asyncio.run(run(args.commands, args.command_seconds, args.interval_ms / 1000, use_executor))
+        summarize(label, delays, time.perf_counter() - start)
+    shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
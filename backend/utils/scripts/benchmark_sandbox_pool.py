@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Benchmark of first-run sandbox latency with and without the warm pool.
+
+Usage:
+    python -m utils.scripts.benchmark_sandbox_pool [--projects 20] [--pool-size 4]
+        [--create-seconds 2] [--arrival-ms 500]
+
+This script:
+1. Uses FakeSandboxBackend, whose sandboxes take --create-seconds to create,
+   like provisioning a Daytona workspace and starting supervisord
+2. Lets --projects new projects arrive every --arrival-ms and get a sandbox,
+   first always creating one and then claiming from a pool of --pool-size
+3. Prints the latency until each project has its sandbox and the pool hit rate
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from sandbox.fake_backend import FakeSandboxBackend
+from sandbox.pool import SandboxPool
+
+
+async def run(projects: int, pool_size: int, create_seconds: float, arrival: float) -> List[float]:
+    backend = FakeSandboxBackend(create_latency=create_seconds)
+    SandboxPool._instance = None
+    pool = SandboxPool(size=pool_size, backend=backend)
+    pool.start()
+    if pool_size > 0:
+        # Let the pool fill before traffic arrives, as it does after worker startup
+        while pool.ready < pool_size:
+            await asyncio.sleep(0.01)
+
+    latencies: List[float] = []
+
+    async def first_run(i: int):
+        await asyncio.sleep(i * arrival)
+        start = time.perf_counter()
+        if await pool.claim(f"project-{i}") is None:
+            await backend.create(f"password-{i}")
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(first_run(i) for i in range(projects)))
+    if pool_size > 0:
+        print(f"  pool: {pool.stats()}")
+    await pool.drain()
+    return latencies
+
+
+def summarize(label: str, latencies: List[float]) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    print(
+        f"{label:<8} median {statistics.median(latencies) * 1000:9.1f} ms"
+        f"   p95 {p95 * 1000:9.1f} ms   max {ordered[-1] * 1000:9.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark first-run sandbox latency with a warm pool")
+    parser.add_argument("--projects", type=int, default=20, help="New projects to serve")
+    parser.add_argument("--pool-size", type=int, default=4, help="Sandboxes kept ready in the pool")
+    parser.add_argument("--create-seconds", type=float, default=2.0, help="Time to create a sandbox")
+    parser.add_argument("--arrival-ms", type=float, default=500.0, help="Interval between new projects")
+    args = parser.parse_args()
+
+    print(
+        f"{args.projects} projects every {args.arrival_ms:.0f} ms, "
+        f"sandbox creation {args.create_seconds:.1f}s, pool size {args.pool_size}"
+    )
+    for label, size in (("no pool", 0), ("pool", args.pool_size)):
+        latencies = asyncio.run(run(args.projects, size, args.create_seconds, args.arrival_ms / 1000))
+        summarize(label, latencies)
+
+
+if __name__ == "__main__":
+    main()
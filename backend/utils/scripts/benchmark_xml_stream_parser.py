@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Benchmark for streaming XML tool call detection.
+
+Usage:
+    python -m utils.scripts.benchmark_xml_stream_parser [--deltas 20000] [--replay stream.jsonl]
+
+This script:
+1. Loads a recorded stream (one JSON string or {"content": ...} object per line)
+   or synthesizes one with the requested number of deltas
+2. Replays it through the legacy rescan-and-replace extraction used by the
+   ResponseProcessor before the incremental parser existed
+3. Replays it through agentpress.xml_tool_parser.StreamingXMLParser
+4. Verifies both produce the same chunks and prints the timings
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import List
+
+from agentpress.xml_tool_parser import StreamingXMLParser
+
+TAG_NAMES = [
+    "ask", "complete", "create-file", "delete-file", "full-file-rewrite", "str-replace",
+    "execute-command", "web-search", "scrape-webpage", "see-image", "expose-port", "deploy",
+    "browser-navigate-to", "browser-click-element", "browser-input-text", "browser-send-keys",
+    "browser-scroll-down", "browser-scroll-up", "browser-go-back", "browser-wait",
+]
+
+
+def legacy_extract_xml_chunks(content: str, tag_names: List[str]) -> List[str]:
+    """Rescanning extraction, one str.find pass per registered tag."""
+    chunks = []
+    pos = 0
+    while pos < len(content):
+        next_tag_start = -1
+        current_tag = None
+        for tag_name in tag_names:
+            tag_pos = content.find(f'<{tag_name}', pos)
+            if tag_pos != -1 and (next_tag_start == -1 or tag_pos < next_tag_start):
+                next_tag_start = tag_pos
+                current_tag = tag_name
+        if next_tag_start == -1 or not current_tag:
+            break
+
+        end_pattern = f'</{current_tag}>'
+        tag_stack = []
+        current_pos = next_tag_start
+        while current_pos < len(content):
+            next_start = content.find(f'<{current_tag}', current_pos + 1)
+            next_end = content.find(end_pattern, current_pos)
+            if next_end == -1:
+                break
+            if next_start != -1 and next_start < next_end:
+                tag_stack.append(next_start)
+                current_pos = next_start + 1
+            elif not tag_stack:
+                chunk_end = next_end + len(end_pattern)
+                chunks.append(content[next_tag_start:chunk_end])
+                pos = chunk_end
+                break
+            else:
+                tag_stack.pop()
+                current_pos = next_end + 1
+        if current_pos >= len(content):
+            break
+        pos = max(pos + 1, current_pos)
+    return chunks
+
+
+def synthesize_stream(num_deltas: int, seed: int = 42) -> List[str]:
+    """Build a realistic assistant turn and split it into num_deltas deltas."""
+    rng = random.Random(seed)
+    prose = "Let me check the project structure and update the implementation accordingly. "
+    file_body = "\n".join(f"    line_{i} = compute(value_{i}) < limit" for i in range(200))
+    calls = [
+        '<execute-command>\nls -la /workspace\n</execute-command>',
+        f'<create-file file_path="src/module.py">\n{file_body}\n</create-file>',
+        '<str-replace file_path="src/module.py">\n<old_str>line_1</old_str>\n<new_str>line_one</new_str>\n</str-replace>',
+        '<web-search query="python asyncio streams" num_results="10"></web-search>',
+    ]
+    # Roughly 4 characters per delta, as produced by most providers
+    parts = []
+    total = 0
+    while total < num_deltas * 4:
+        part = prose * rng.randint(1, 4) if rng.random() < 0.6 else rng.choice(calls)
+        parts.append(part)
+        total += len(part)
+    text = "".join(parts)
+
+    cuts = sorted(rng.sample(range(1, len(text)), num_deltas - 1))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+def load_stream(path: str) -> List[str]:
+    """Load a recorded stream of content deltas from a JSONL file."""
+    deltas = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            deltas.append(item["content"] if isinstance(item, dict) else item)
+    return deltas
+
+
+def run_legacy(deltas: List[str]) -> List[str]:
+    found = []
+    current_xml_content = ""
+    for delta in deltas:
+        current_xml_content += delta
+        for xml_chunk in legacy_extract_xml_chunks(current_xml_content, TAG_NAMES):
+            current_xml_content = current_xml_content.replace(xml_chunk, "", 1)
+            found.append(xml_chunk)
+    return found
+
+
+def run_incremental(deltas: List[str]) -> List[str]:
+    found = []
+    parser = StreamingXMLParser(TAG_NAMES)
+    for delta in deltas:
+        found.extend(parser.feed(delta))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming XML tool call detection")
+    parser.add_argument("--deltas", type=int, default=20000, help="Number of deltas to synthesize")
+    parser.add_argument("--replay", type=str, default=None, help="JSONL file with recorded deltas")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the incremental parser")
+    args = parser.parse_args()
+
+    deltas = load_stream(args.replay) if args.replay else synthesize_stream(args.deltas)
+    total_chars = sum(len(d) for d in deltas)
+    print(f"Stream: {len(deltas)} deltas, {total_chars} characters, {len(TAG_NAMES)} registered tags")
+
+    start = time.perf_counter()
+    incremental_chunks = run_incremental(deltas)
+    incremental_time = time.perf_counter() - start
+    print(f"Incremental parser: {incremental_time * 1000:.1f} ms, {len(incremental_chunks)} tool calls")
+
+    if args.skip_legacy:
+        return
+
+    start = time.perf_counter()
+    legacy_chunks = run_legacy(deltas)
+    legacy_time = time.perf_counter() - start
+    print(f"Legacy rescan:      {legacy_time * 1000:.1f} ms, {len(legacy_chunks)} tool calls")
+    print(f"Speedup: {legacy_time / max(incremental_time, 1e-9):.1f}x")
+
+    if legacy_chunks != incremental_chunks:
+        print("WARNING: legacy and incremental parsers produced different chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for XML tool call argument extraction.
+
+Usage:
+    python -m utils.scripts.benchmark_xml_tool_parsing [--size-kb 256] [--iterations 200]
+
+This script:
+1. Builds large create-file, full-file-rewrite and str-replace payloads
+2. Parses them with the legacy interpreter of XMLTagSchema.mappings, which
+   rebuilt attribute regexes and re-sliced the chunk for every mapping
+3. Parses them with the precompiled XMLExtractionPlan built at registration
+4. Verifies both produce the same arguments and prints throughput in MB/s
+"""
+
+import argparse
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from agentpress.tool import XMLTagSchema
+from agentpress.xml_tool_parser import XMLExtractionPlan
+
+
+def legacy_extract_tag_content(xml_chunk: str, tag_name: str) -> Tuple[Optional[str], str]:
+    start_tag = f'<{tag_name}'
+    end_tag = f'</{tag_name}>'
+    start_pos = xml_chunk.find(start_tag)
+    if start_pos == -1:
+        return None, xml_chunk
+    tag_end = xml_chunk.find('>', start_pos)
+    if tag_end == -1:
+        return None, xml_chunk
+    content_start = tag_end + 1
+    nesting_level = 1
+    pos = content_start
+    while nesting_level > 0 and pos < len(xml_chunk):
+        next_start = xml_chunk.find(start_tag, pos)
+        next_end = xml_chunk.find(end_tag, pos)
+        if next_end == -1:
+            return None, xml_chunk
+        if next_start != -1 and next_start < next_end:
+            nesting_level += 1
+            pos = next_start + len(start_tag)
+        else:
+            nesting_level -= 1
+            if nesting_level == 0:
+                return xml_chunk[content_start:next_end], xml_chunk[next_end + len(end_tag):]
+            pos = next_end + len(end_tag)
+    return None, xml_chunk
+
+
+def legacy_extract_attribute(opening_tag: str, attr_name: str) -> Optional[str]:
+    patterns = [
+        fr'{attr_name}="([^"]*)"',
+        fr"{attr_name}='([^']*)'",
+        fr'{attr_name}=([^\s/>;]+)'
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, opening_tag)
+        if match:
+            value = match.group(1)
+            value = value.replace('&quot;', '"').replace('&apos;', "'")
+            value = value.replace('&lt;', '<').replace('&gt;', '>')
+            value = value.replace('&amp;', '&')
+            return value
+    return None
+
+
+def legacy_parse(schema: XMLTagSchema, xml_chunk: str) -> Dict[str, Any]:
+    params = {}
+    remaining_chunk = xml_chunk
+    for mapping in schema.mappings:
+        if mapping.node_type == "attribute":
+            opening_tag = remaining_chunk.split('>', 1)[0]
+            value = legacy_extract_attribute(opening_tag, mapping.param_name)
+            if value is not None:
+                params[mapping.param_name] = value
+        elif mapping.node_type == "element":
+            content, remaining_chunk = legacy_extract_tag_content(remaining_chunk, mapping.path)
+            if content is not None:
+                params[mapping.param_name] = content.strip()
+        elif mapping.node_type in ("text", "content"):
+            content, _ = legacy_extract_tag_content(remaining_chunk, schema.tag_name)
+            if content is not None:
+                params[mapping.param_name] = content.strip()
+    return params
+
+
+def build_cases(size_kb: int):
+    body_line = "    <div class=\"row\">{i}: value &lt; limit &amp;&amp; other</div>\n"
+    lines = []
+    total = 0
+    i = 0
+    while total < size_kb * 1024:
+        line = body_line.format(i=i)
+        lines.append(line)
+        total += len(line)
+        i += 1
+    body = "".join(lines)
+
+    file_schema = [
+        {"param_name": "file_path", "node_type": "attribute", "path": "."},
+        {"param_name": "file_contents", "node_type": "content", "path": "."},
+    ]
+    replace_schema = [
+        {"param_name": "file_path", "node_type": "attribute", "path": "."},
+        {"param_name": "old_str", "node_type": "element", "path": "old_str"},
+        {"param_name": "new_str", "node_type": "element", "path": "new_str"},
+    ]
+
+    cases = []
+    for tag_name, mappings, chunk in [
+        ("create-file", file_schema,
+         f'<create-file file_path="src/pages/index.html">\n{body}</create-file>'),
+        ("full-file-rewrite", file_schema,
+         f'<full-file-rewrite file_path=\'src/pages/index.html\'>\n{body}</full-file-rewrite>'),
+        ("str-replace", replace_schema,
+         f'<str-replace file_path="src/pages/index.html">\n<old_str>{body}</old_str>\n<new_str>{body}</new_str>\n</str-replace>'),
+    ]:
+        schema = XMLTagSchema(tag_name=tag_name)
+        for mapping in mappings:
+            schema.add_mapping(**mapping)
+        cases.append((schema, chunk))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark XML tool call argument extraction")
+    parser.add_argument("--size-kb", type=int, default=256, help="Approximate payload size in KB")
+    parser.add_argument("--iterations", type=int, default=200, help="Parses per payload")
+    args = parser.parse_args()
+
+    for schema, chunk in build_cases(args.size_kb):
+        plan = XMLExtractionPlan(schema)
+        megabytes = len(chunk) * args.iterations / (1024 * 1024)
+
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            legacy_params = legacy_parse(schema, chunk)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            plan_params, _ = plan.extract(chunk)
+        plan_time = time.perf_counter() - start
+
+        status = "ok" if plan_params == legacy_params else "MISMATCH"
+        print(f"{schema.tag_name:<18} {len(chunk) / 1024:8.0f} KB  "
+              f"legacy {megabytes / legacy_time:9.1f} MB/s  "
+              f"plan {megabytes / plan_time:9.1f} MB/s  "
+              f"speedup {legacy_time / plan_time:5.1f}x  [{status}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
-import React, { useMemo } from "react";
+import React, { useEffect, useMemo, useState } from "react";
 import { Globe, MonitorPlay, ExternalLink, CheckCircle, AlertTriangle, CircleDashed } from "lucide-react";
 import { ToolViewProps } from "./types";
 import { extractBrowserUrl, extractBrowserOperation, formatTimestamp, getToolTitle } from "./utils";
 import { ApiMessageType } from '@/components/thread/types';
 import { safeJsonParse } from '@/components/thread/utils';
 import { cn } from "@/lib/utils";
+import { createClient } from "@/lib/supabase/client";
+
+const API_URL = process.env.NEXT_PUBLIC_BACKEND_URL || '';
 
 export function BrowserToolView({ 
   name = "browser-operation",
@@ -51,7 +54,8 @@ export function BrowserToolView({
   }
 
   // Find the browser_state message and extract the screenshot
-  let screenshotBase64: string | null = null;
+  let screenshotSrc: string | null = null;
+  let screenshotUrl: string | null = null;
   if (browserStateMessageId && messages.length > 0) {
     const browserStateMessage = messages.find(msg => 
         (msg.type as string) === 'browser_state' && 
@@ -59,11 +63,53 @@ export function BrowserToolView({
     );
     
     if (browserStateMessage) {
-        const browserStateContent = safeJsonParse<{ screenshot_base64?: string }>(browserStateMessage.content, {});
-        screenshotBase64 = browserStateContent?.screenshot_base64 || null;
+        const browserStateContent = safeJsonParse<{ screenshot_base64?: string; screenshot_ref?: string }>(browserStateMessage.content, {});
+        // Screenshots are stored by content hash; older messages embed them as base64
+        if (browserStateContent?.screenshot_ref && browserStateMessage.thread_id) {
+          screenshotUrl = `${API_URL}/threads/${browserStateMessage.thread_id}/screenshots/${browserStateContent.screenshot_ref}`;
+        } else if (browserStateContent?.screenshot_base64) {
+          screenshotSrc = `data:image/jpeg;base64,${browserStateContent.screenshot_base64}`;
+        }
     }
   }
   
+  // Stored screenshots need the user's token, which an <img> cannot send
+  const [storedScreenshotSrc, setStoredScreenshotSrc] = useState<string | null>(null);
+  useEffect(() => {
+    if (!screenshotUrl) {
+      setStoredScreenshotSrc(null);
+      return;
+    }
+    let objectUrl: string | null = null;
+    let cancelled = false;
+    (async () => {
+      try {
+        const supabase = createClient();
+        const { data: { session } } = await supabase.auth.getSession();
+        // Screenshots of public projects are served without a token
+        const response = await fetch(screenshotUrl, {
+          headers: session?.access_token ? { 'Authorization': `Bearer ${session.access_token}` } : {},
+        });
+        if (!response.ok) {
+          throw new Error(`Screenshot request failed with ${response.status}`);
+        }
+        const blob = await response.blob();
+        if (!cancelled) {
+          objectUrl = URL.createObjectURL(blob);
+          setStoredScreenshotSrc(objectUrl);
+        }
+      } catch (error) {
+        console.error("[BrowserToolView] Error loading screenshot:", error);
+        if (!cancelled) setStoredScreenshotSrc(null);
+      }
+    })();
+    return () => {
+      cancelled = true;
+      if (objectUrl) URL.revokeObjectURL(objectUrl);
+    };
+  }, [screenshotUrl]);
+  screenshotSrc = screenshotSrc ?? storedScreenshotSrc;
+
   // Check if we have a VNC preview URL from the project
   const vncPreviewUrl = project?.sandbox?.vnc_preview ? 
     `${project.sandbox.vnc_preview}/vnc_lite.html?password=${project?.sandbox?.pass}&autoconnect=true&scale=local&width=1024&height=768` : 
@@ -110,10 +156,10 @@ export function BrowserToolView({
               isRunning && vncIframe ? (
                 // Use the memoized iframe for live preview
                 vncIframe
-              ) : screenshotBase64 ? (
+              ) : screenshotSrc ? (
                 <div className="flex items-center justify-center w-full h-full max-h-[650px] overflow-auto">
                   <img 
-                    src={`data:image/jpeg;base64,${screenshotBase64}`} 
+                    src={screenshotSrc} 
                     alt="Browser Screenshot"
                     className="max-w-full max-h-full object-contain"
                   />
@@ -139,10 +185,10 @@ export function BrowserToolView({
               )
             ) : (
               // For non-last tool calls, only show screenshot if available, otherwise show "No Browser State image found"
-              screenshotBase64 ? (
+              screenshotSrc ? (
                 <div className="flex items-center justify-center w-full h-full max-h-[650px] overflow-auto">
                   <img 
-                    src={`data:image/jpeg;base64,${screenshotBase64}`} 
+                    src={screenshotSrc} 
                     alt="Browser Screenshot"
                     className="max-w-full max-h-full object-contain"
                   />